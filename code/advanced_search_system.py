@@ -7,16 +7,51 @@
 
 import json
 import re
-import math
 import os
 from typing import List, Dict, Any, Tuple, Optional
-from collections import Counter, defaultdict
+from collections import Counter
 import jieba
 import jieba.analyse
 from vectorize_chunks import ChunkVectorizer
+from bm25_index import (BM25Index, CollectionFingerprint, tokenize, content_hash,
+                        get_ngram_snapshot_path, TOKENIZER_VERSION, NGRAM_VERSION)
+from ngram_index import NGramIndex
+from metadata_filter import MetadataBitmapIndex
+from token_cache import TokenCache, QueryTokens
+from exact_match import ExactMatcher
 import numpy as np
 from datetime import datetime
 
+# 文档ID中的数字段，用于ID别名索引
+_ID_NUMBER_PATTERN = re.compile(r'\d+')
+
+# 关键词抽取保留的词性
+_KEYWORD_POS = ('n', 'nr', 'ns', 'nt', 'nz', 'v', 'vd', 'vn', 'a', 'ad', 'an')
+
+# BRE重排序后保留的最低综合得分
+RERANK_MIN_SCORE = 0.001
+
+
+def truncate_reranked(reranked: List[Dict[str, Any]],
+                      top_k: int,
+                      score_key: str = 'final_score') -> List[Dict[str, Any]]:
+    """
+    截取重排序结果的前top_k个：过滤综合得分过低的文档，过滤后不足top_k的一半时保留原排序
+    
+    对按更大top_k截取过的结果再次调用，与直接按top_k截取的结果相同（预先检索的结果据此截取）
+    
+    Args:
+        reranked: 按综合得分降序的结果
+        top_k: 返回文档数量
+        score_key: 综合得分的键
+        
+    Returns:
+        截取后的结果
+    """
+    filtered = [r for r in reranked if r.get(score_key, 0.0) > RERANK_MIN_SCORE]
+    return filtered[:top_k] if len(filtered) >= max(1, top_k // 2) else reranked[:top_k]
+
+
 class AdvancedSearchSystem:
     """
     高级搜索系统
@@ -29,7 +64,9 @@ class AdvancedSearchSystem:
                  bm25_b: float = 0.75,
                  vector_weight: float = 0.6,
                  bm25_weight: float = 0.25,
-                 exact_weight: float = 0.15):
+                 exact_weight: float = 0.15,
+                 phrase_candidates: int = 10,
+                 index_workers: Optional[int] = None):
         """
         初始化高级搜索系统
         
@@ -40,6 +77,8 @@ class AdvancedSearchSystem:
             vector_weight: 向量匹配权重
             bm25_weight: BM25匹配权重
             exact_weight: 精确匹配权重
+            phrase_candidates: 字面短语检索补充到候选池的文档数（0表示关闭）
+            index_workers: 全量构建索引时的分词进程数（None表示使用全部CPU核，1表示单进程）
         """
         self.vectorizer = vectorizer
         self.bm25_k1 = bm25_k1
@@ -47,13 +86,33 @@ class AdvancedSearchSystem:
         self.vector_weight = vector_weight
         self.bm25_weight = bm25_weight
         self.exact_weight = exact_weight
+        self.phrase_candidates = phrase_candidates
+        self.index_workers = index_workers
         
-        # 文档统计信息
-        self.doc_count = 0
-        self.avg_doc_length = 0
-        self.doc_lengths = {}
-        self.term_doc_freq = defaultdict(int)  # 词项文档频率
+        # BM25倒排索引、字符n-gram索引及文档内容
+        self.bm25_index = BM25Index(k1=bm25_k1, b=bm25_b)
+        self.ngram_index = NGramIndex()
         self.documents = {}  # 存储文档内容
+        self.doc_metadatas = {}  # 存储文档元数据
+        # 集合指纹（随增量变化加减对应文档，不重新遍历全部元数据）
+        self._fingerprint = CollectionFingerprint()
+        
+        # 按BM25/n-gram索引文档编号对齐的元数据过滤位图，索引变化后按需重建
+        self._filter_indexes: Dict[str, MetadataBitmapIndex] = {}
+        
+        # 分词缓存：查询只分析一次，文档词项取自BM25正排列表
+        self.token_cache = TokenCache()
+        
+        # 文档ID别名索引（在构建全局BM25索引时预计算，增量变化时只更新变化的文档）
+        self._id_mapping = {}
+        self._id_mapping_reverse = {}
+        self._stripped_id_aliases = {}
+        self._numeric_id_aliases = {}
+        # 对应多个文档的别名 {别名类型: {别名: [文档ID]}}，按索引中的顺序排列
+        self._ambiguous_aliases = {'去前缀': {}, '末尾数字': {}}
+        
+        # 是否读写磁盘上的BM25快照
+        self.use_bm25_snapshot = True
         
         # 初始化jieba
         jieba.initialize()
@@ -72,6 +131,10 @@ class AdvancedSearchSystem:
                 self.build_global_bm25_index()
             else:
                 print("⚠️ ChromaDB未初始化，跳过BM25索引构建")
+            
+            # 向量化器入库/删除文档后增量更新BM25索引
+            if hasattr(self.vectorizer, 'add_index_listener'):
+                self.vectorizer.add_index_listener(self.apply_document_changes)
         
         print("高级搜索系统初始化完成")
     
@@ -85,32 +148,39 @@ class AdvancedSearchSystem:
         Returns:
             处理后的词项列表
         """
-        # 基本清理
-        text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9\s]', ' ', text)
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        # 分词
-        words = jieba.lcut(text)
-        
-        # 改进的停用词过滤
-        stop_words = {'的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一个', '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这'}
-        
-        # 重要的单字符保留列表（主要是人名、地名等）
-        important_single_chars = {'乔', '梁', '李', '王', '张', '刘', '陈', '杨', '黄', '赵', '周', '吴', '徐', '孙', '马', '朱', '胡', '郭', '何', '高'}
+        return tokenize(text)
+    
+    def _analyze_query(self, query: str) -> QueryTokens:
+        """
+        分析查询：TF-IDF关键词抽取与BM25分词（每个查询只执行一次，结果由分词缓存保存）
         
-        filtered_words = []
-        for word in words:
-            # 保留长度大于1的词
-            if len(word) > 1 and word not in stop_words:
-                filtered_words.append(word)
-            # 保留重要的单字符
-            elif len(word) == 1 and word in important_single_chars:
-                filtered_words.append(word)
-            # 保留数字和英文
-            elif len(word) == 1 and (word.isdigit() or word.isalpha()):
-                filtered_words.append(word)
+        Args:
+            query: 查询文本
+            
+        Returns:
+            查询分析结果
+        """
+        # 使用jieba的TF-IDF关键词抽取（基于BM25思想），保留全部关键词，按需截取
+        tags = jieba.analyse.extract_tags(
+            query, 
+            topK=None, 
+            withWeight=True,
+            allowPOS=_KEYWORD_POS
+        )
+        tokens = self.preprocess_text(query)
+        return QueryTokens(tags=tags, tokens=tokens, token_set=frozenset(tokens))
+    
+    def analyze_query(self, query: str) -> QueryTokens:
+        """
+        获取查询分析结果（命中缓存时不再分词）
         
-        return filtered_words
+        Args:
+            query: 查询文本
+            
+        Returns:
+            查询分析结果
+        """
+        return self.token_cache.get_query(query, self._analyze_query)
     
     def extract_keywords_bm25(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
         """
@@ -123,17 +193,11 @@ class AdvancedSearchSystem:
         Returns:
             关键词及其权重列表
         """
-        # 使用jieba的TF-IDF关键词抽取（基于BM25思想）
-        keywords = jieba.analyse.extract_tags(
-            query, 
-            topK=top_k, 
-            withWeight=True,
-            allowPOS=('n', 'nr', 'ns', 'nt', 'nz', 'v', 'vd', 'vn', 'a', 'ad', 'an')
-        )
+        analysis = self.analyze_query(query)
+        keywords = analysis.tags[:top_k]
         
         # 补充自定义关键词抽取
-        words = self.preprocess_text(query)
-        word_freq = Counter(words)
+        word_freq = Counter(analysis.tokens)
         
         # 合并结果
         keyword_dict = {kw: weight for kw, weight in keywords}
@@ -148,47 +212,60 @@ class AdvancedSearchSystem:
         
         return sorted_keywords
     
+    @property
+    def doc_count(self) -> int:
+        return self.bm25_index.doc_count
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self.bm25_index.avg_doc_length
+
+    @property
+    def doc_lengths(self) -> Dict[str, int]:
+        """文档长度（由倒排索引生成，仅供调试）"""
+        return {doc_id: length for doc_id, length in zip(self.bm25_index.doc_ids, self.bm25_index.doc_lengths) if doc_id is not None}
+
+    @property
+    def term_doc_freq(self) -> Dict[str, int]:
+        """词项文档频率（由倒排索引生成，仅供调试）"""
+        return {term: len(docs) for term, docs in zip(self.bm25_index.terms, self.bm25_index.postings_docs)}
+
     def build_bm25_index(self, documents: Dict[str, str]):
         """
-        构建BM25索引
+        构建BM25倒排索引
         
         Args:
             documents: 文档字典 {doc_id: content}
         """
         print("正在构建BM25索引...")
         
+        self.token_cache.clear()
         self.documents = documents
-        self.doc_count = len(documents)
-        
-        # 初始化BM25索引
-        self.bm25_index = {}
+        # 分词在进程池中并行执行（preprocess_text即tokenize），结果与逐个文档分词完全一致
+        self.bm25_index.build_from_texts(documents, tokenizer=tokenize, workers=self.index_workers)
         
-        # 计算文档长度和词项统计
-        total_length = 0
-        term_docs = defaultdict(set)
+        print(f"BM25索引构建完成：{self.doc_count}个文档，平均长度{self.avg_doc_length:.1f}")
+        print(f"BM25倒排索引包含{len(self.bm25_index.terms)}个词项")
+    
+    def _resolve_bm25_id(self, doc_id: str) -> Optional[str]:
+        """
+        将候选文档ID解析为BM25索引中的ID
         
-        for doc_id, content in documents.items():
-            words = self.preprocess_text(content)
-            self.doc_lengths[doc_id] = len(words)
-            total_length += len(words)
-            
-            # 构建文档的词项频率索引
-            word_freq = Counter(words)
-            self.bm25_index[doc_id] = word_freq
+        Args:
+            doc_id: 文档ID
             
-            # 统计词项出现的文档
-            for word in set(words):
-                term_docs[word].add(doc_id)
-        
-        # 计算平均文档长度
-        self.avg_doc_length = total_length / self.doc_count if self.doc_count > 0 else 0
-        
-        # 计算词项文档频率
-        for term, docs in term_docs.items():
-            self.term_doc_freq[term] = len(docs)
-        
-        print(f"BM25索引构建完成：{self.doc_count}个文档，平均长度{self.avg_doc_length:.1f}")
-        print(f"BM25索引包含{len(self.bm25_index)}个文档的词项频率信息")
+        Returns:
+            索引中的文档ID，找不到时返回None
+        """
+        if doc_id in self.bm25_index:
+            return doc_id
+        
+        matched_id = self._find_matching_bm25_id(doc_id)
+        if matched_id:
+            print(f"[BM25_FIX] 文档ID映射: {doc_id[:30]}... -> {matched_id[:30]}...")
+        else:
+            print(f"[BM25_ERROR] 文档ID {doc_id[:30]}... 在BM25索引中未找到匹配，返回0分")
+        return matched_id
     
     def calculate_bm25_score(self, query_terms: List[str], doc_id: str) -> float:
         """
@@ -202,52 +279,151 @@ class AdvancedSearchSystem:
             BM25得分
         """
         # 检查文档是否在BM25索引中
-        if not hasattr(self, 'bm25_index') or not self.bm25_index:
+        if not self.bm25_index:
             print(f"[DEBUG] BM25索引不存在或为空")
             return 0.0
+        
+        doc_id = self._resolve_bm25_id(doc_id)
+        if doc_id is None:
+            return 0.0
+        
+        return self.bm25_index.score_document(query_terms, doc_id)
+    
+    def calculate_bm25_scores(self, query_terms: List[str], doc_ids: List[str]) -> List[float]:
+        """
+        批量计算BM25得分：一次遍历倒排列表为所有候选文档打分
+        
+        Args:
+            query_terms: 查询词项列表
+            doc_ids: 文档ID列表
             
-        if doc_id not in self.bm25_index:
-            # 改进的ID匹配策略
-            matched_id = self._find_matching_bm25_id(doc_id)
-            if matched_id:
-                print(f"[BM25_FIX] 文档ID映射: {doc_id[:30]}... -> {matched_id[:30]}...")
-                doc_id = matched_id
-            else:
-                print(f"[BM25_ERROR] 文档ID {doc_id[:30]}... 在BM25索引中未找到匹配，返回0分")
-                return 0.0
+        Returns:
+            与doc_ids一一对应的BM25得分
+        """
+        if not self.bm25_index:
+            print(f"[DEBUG] BM25索引不存在或为空")
+            return [0.0] * len(doc_ids)
         
-        # 从BM25索引获取词频信息
-        term_freq = self.bm25_index[doc_id]
-        doc_length = self.doc_lengths.get(doc_id, 0)
+        resolved_ids = [self._resolve_bm25_id(doc_id) for doc_id in doc_ids]
+        return self.bm25_index.score_documents(query_terms, resolved_ids)
+    
+    def _filter_mask(self, index_name: str, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        元数据过滤条件在BM25或n-gram索引上的文档掩码（按文档编号对齐）
         
-        if doc_length == 0:
-            return 0.0
+        Args:
+            index_name: bm25 / ngram
+            filters: 过滤条件（见metadata_filter.normalize_filters）
+            
+        Returns:
+            布尔掩码；没有过滤条件时返回None
+        """
+        if not filters:
+            return None
+        index = self.bm25_index if index_name == 'bm25' else self.ngram_index
+        filter_index = self._filter_indexes.get(index_name)
+        if filter_index is None or filter_index.size != len(index.doc_ids):
+            filter_index = MetadataBitmapIndex(
+                index.doc_ids,
+                [self.doc_metadatas.get(doc_id) if doc_id is not None else None for doc_id in index.doc_ids]
+            )
+            self._filter_indexes[index_name] = filter_index
+        return filter_index.mask(filters)
+    
+    def bm25_search(self, 
+                    query_terms: List[str], 
+                    top_k: int = 10,
+                    filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """
+        在全局BM25倒排索引上检索得分最高的文档
         
-        score = 0.0
-        for term in query_terms:
-            if term in term_freq:
-                # 词频
-                tf = term_freq[term]
-                
-                # 文档频率
-                df = self.term_doc_freq.get(term, 0)
-                if df == 0:
-                    continue
-                
-                # IDF计算
-                idf = math.log((self.doc_count - df + 0.5) / (df + 0.5))
-                
-                # BM25公式
-                numerator = tf * (self.bm25_k1 + 1)
-                denominator = tf + self.bm25_k1 * (1 - self.bm25_b + self.bm25_b * (doc_length / self.avg_doc_length))
-                
-                score += idf * (numerator / denominator)
+        Args:
+            query_terms: 查询词项列表
+            top_k: 返回文档数量
+            filters: 可选，元数据过滤条件（在top-k剪枝内部生效）
+            
+        Returns:
+            [(doc_id, bm25_score)] 按得分降序
+        """
+        return self.bm25_index.top_k(query_terms, k=top_k, allowed=self._filter_mask('bm25', filters))
+    
+    @staticmethod
+    def _strip_id_prefix(doc_id: str) -> str:
+        """去除ID中常见的doc_/chunk_前缀"""
+        return doc_id.strip().replace('doc_', '').replace('chunk_', '')
+    
+    @staticmethod
+    def _numeric_id_suffix(doc_id: str) -> Optional[str]:
+        """提取ID中最后一段数字"""
+        numbers = _ID_NUMBER_PATTERN.findall(doc_id)
+        return numbers[-1] if numbers else None
+    
+    def build_id_alias_index(self):
+        """
+        预计算文档ID别名索引：去前缀形式、末尾数字形式 -> 规范ID
+        
+        同一别名对应多个文档时保留索引中靠前的文档（与旧的线性扫描结果一致），
+        并在构建时统一报告一次，查询时不再扫描全部ID
+        """
+        self._stripped_id_aliases = {}
+        self._numeric_id_aliases = {}
+        self._ambiguous_aliases = {'去前缀': {}, '末尾数字': {}}
+        
+        for doc_id in self.bm25_index:
+            self._register_id_aliases(doc_id)
+        
+        print(f"ID别名索引构建完成：{len(self._stripped_id_aliases)}个去前缀别名，{len(self._numeric_id_aliases)}个数字别名")
+        for alias_type, conflicts in self._ambiguous_aliases.items():
+            if conflicts:
+                examples = ', '.join(f"{alias}->{ids[0]}(另有{len(ids) - 1}个)" for alias, ids in list(conflicts.items())[:5])
+                print(f"⚠️ {len(conflicts)}个{alias_type}别名对应多个文档，将解析为首个文档: {examples}")
+    
+    def _id_alias_forms(self, doc_id: str) -> List[Tuple[str, Dict[str, str], Optional[str]]]:
+        """单个文档ID的别名 [(别名类型, 别名索引, 别名)]"""
+        return [
+            ('去前缀', self._stripped_id_aliases, self._strip_id_prefix(doc_id)),
+            ('末尾数字', self._numeric_id_aliases, self._numeric_id_suffix(doc_id))
+        ]
+    
+    def _register_id_aliases(self, doc_id: str):
+        """
+        登记单个文档ID的别名（文档位于索引末尾，别名已被占用时记为冲突）
         
-        return score
+        Args:
+            doc_id: 规范文档ID
+        """
+        for alias_type, aliases, alias in self._id_alias_forms(doc_id):
+            if alias is None:
+                continue
+            existing = aliases.setdefault(alias, doc_id)
+            if existing != doc_id:
+                self._ambiguous_aliases[alias_type].setdefault(alias, [existing]).append(doc_id)
+    
+    def _unregister_id_aliases(self, doc_id: str):
+        """
+        注销单个文档ID的别名：冲突别名改为指向剩余文档中索引靠前的一个
+        
+        Args:
+            doc_id: 规范文档ID
+        """
+        for alias_type, aliases, alias in self._id_alias_forms(doc_id):
+            if alias is None:
+                continue
+            conflicts = self._ambiguous_aliases[alias_type]
+            members = conflicts.get(alias)
+            if members is None:
+                if aliases.get(alias) == doc_id:
+                    del aliases[alias]
+                continue
+            if doc_id in members:
+                members.remove(doc_id)
+            aliases[alias] = members[0]
+            if len(members) == 1:
+                del conflicts[alias]
     
     def _find_matching_bm25_id(self, target_id: str) -> str:
         """
-        智能查找匹配的BM25索引ID
+        查找匹配的BM25索引ID（全部为哈希查找）
         
         Args:
             target_id: 目标文档ID
@@ -255,11 +431,11 @@ class AdvancedSearchSystem:
         Returns:
             匹配的BM25索引ID，如果没找到返回None
         """
-        if not hasattr(self, 'bm25_index') or not self.bm25_index:
+        if not self.bm25_index:
             return None
             
         # 0. 检查ID映射表
-        if hasattr(self, '_id_mapping') and target_id in self._id_mapping:
+        if target_id in self._id_mapping:
             mapped_id = self._id_mapping[target_id]
             if mapped_id in self.bm25_index:
                 return mapped_id
@@ -272,28 +448,16 @@ class AdvancedSearchSystem:
         normalized_target = str(target_id).strip()
         if normalized_target in self.bm25_index:
             return normalized_target
-            
-        # 3. 子串匹配（双向）
-        for bm25_id in self.bm25_index.keys():
-            if target_id in bm25_id or bm25_id in target_id:
-                return bm25_id
-                
-        # 4. 去除常见前缀/后缀后匹配
-        cleaned_target = target_id.strip().replace('doc_', '').replace('chunk_', '')
-        for bm25_id in self.bm25_index.keys():
-            cleaned_bm25 = bm25_id.strip().replace('doc_', '').replace('chunk_', '')
-            if cleaned_target == cleaned_bm25:
-                return bm25_id
-                
-        # 5. 数字ID匹配（提取数字部分）
-        import re
-        target_numbers = re.findall(r'\d+', target_id)
-        if target_numbers:
-            target_num = target_numbers[-1]  # 使用最后一个数字
-            for bm25_id in self.bm25_index.keys():
-                bm25_numbers = re.findall(r'\d+', bm25_id)
-                if bm25_numbers and bm25_numbers[-1] == target_num:
-                    return bm25_id
+        
+        # 3. 去除常见前缀/后缀后匹配
+        matched_id = self._stripped_id_aliases.get(self._strip_id_prefix(normalized_target))
+        if matched_id:
+            return matched_id
+        
+        # 4. 数字ID匹配（提取数字部分）
+        target_number = self._numeric_id_suffix(normalized_target)
+        if target_number is not None:
+            return self._numeric_id_aliases.get(target_number)
                     
         return None
     
@@ -308,92 +472,340 @@ class AdvancedSearchSystem:
         Returns:
             精确匹配得分
         """
-        query_lower = query.lower()
-        doc_lower = document.lower()
+        return self.exact_match_scores(query, [document])[0]
+    
+    def exact_match_scores(self, query: str, documents: List[str]) -> List[float]:
+        """
+        批量计算精确匹配得分：查询只编译一次，整批候选文档一次打分
         
-        score = 0.0
+        查询词覆盖率基于BM25倒排列表批量统计（按内容哈希定位文档），不对文档分词
         
-        # 完全匹配
-        if query_lower in doc_lower:
-            score += 1.0
+        Args:
+            query: 查询文本
+            documents: 文档内容列表
+            
+        Returns:
+            与documents一一对应的精确匹配得分
+        """
+        if not documents:
+            return []
         
-        # 词汇匹配
-        query_words = set(self.preprocess_text(query))
-        doc_words = set(self.preprocess_text(document))
+        matcher = ExactMatcher(query, self.analyze_query(query).token_set)
+        return matcher.score_batch(documents, self._count_query_terms(matcher.query_terms, documents))
+    
+    def _count_query_terms(self, query_terms: frozenset, documents: List[str]) -> List[int]:
+        """
+        统计每个文档包含的不同查询词数量
         
-        if query_words:
-            overlap = len(query_words & doc_words)
-            score += overlap / len(query_words) * 0.8
+        Args:
+            query_terms: 查询词集合
+            documents: 文档内容列表
+            
+        Returns:
+            与documents一一对应的命中词数
+        """
+        if not query_terms:
+            return [0] * len(documents)
+        
+        doc_nums = [self.bm25_index.find_by_hash(content_hash(document)) for document in documents]
+        indexed = [i for i, doc_num in enumerate(doc_nums) if doc_num is not None]
+        counts = [0] * len(documents)
+        
+        if indexed:
+            hits = self.bm25_index.count_query_terms(query_terms, np.array([doc_nums[i] for i in indexed]))
+            for i, hit in zip(indexed, hits):
+                counts[i] = int(hit)
+        
+        # 未被索引的内容（如索引构建失败）才回退到分词缓存
+        for i, doc_num in enumerate(doc_nums):
+            if doc_num is None:
+                doc_terms = self.token_cache.get_document_terms(documents[i], self.bm25_index, self.preprocess_text)
+                counts[i] = len(query_terms & doc_terms)
+        return counts
+
+    def _get_collection(self):
+        """获取ChromaDB集合"""
+        if getattr(self, 'collection', None):
+            return self.collection
+        if self.vectorizer and getattr(self.vectorizer, 'collection', None):
+            return self.vectorizer.collection
+        return None
+    
+    def get_bm25_snapshot_path(self) -> Optional[str]:
+        """
+        BM25快照文件路径（位于ChromaDB目录旁的索引目录中）
         
-        # 短语匹配
-        query_phrases = [query[i:i+4] for i in range(len(query)-3)]
-        phrase_matches = sum(1 for phrase in query_phrases if phrase in document)
-        if query_phrases:
-            score += phrase_matches / len(query_phrases) * 0.6
+        Returns:
+            快照路径，无法确定ChromaDB目录时返回None
+        """
+        if not self.vectorizer:
+            return None
+        return self.vectorizer.get_bm25_snapshot_path()
+    
+    def _fetch_documents(self, doc_ids: List[str]) -> Dict[str, str]:
+        """
+        获取文档内容：优先使用内存中的文档，缺失的按ID从ChromaDB定向获取
         
-        return score
+        Args:
+            doc_ids: 文档ID列表
+            
+        Returns:
+            {doc_id: content}
+        """
+        contents = {doc_id: self.documents[doc_id] for doc_id in doc_ids if doc_id in self.documents}
+        missing = [doc_id for doc_id in doc_ids if doc_id not in contents]
+        collection = self._get_collection()
+        if missing and collection is not None:
+            raw_ids = {self._id_mapping_reverse.get(doc_id, doc_id): doc_id for doc_id in missing}
+            results = collection.get(ids=list(raw_ids.keys()), include=['documents'])
+            for raw_id, content in zip(results['ids'], results['documents']):
+                contents[raw_ids.get(raw_id, str(raw_id).strip())] = content
+        return contents
 
-    def build_global_bm25_index(self):
+    def build_global_bm25_index(self, use_snapshot: bool = True):
         """
         构建全局BM25索引，确保ID格式一致性
+        
+        先只获取ID和元数据计算集合指纹，若ChromaDB目录旁存在指纹一致的快照则直接内存映射加载，
+        否则获取全部文档重新分词构建并写入快照
+        
+        Args:
+            use_snapshot: 是否读写磁盘快照（替换分词函数调试时应关闭）
         """
         print("正在构建全局BM25索引...")
+        start_time_build = datetime.now()
+        self.use_bm25_snapshot = use_snapshot
         try:
-            # 从ChromaDB获取所有文档
-            if hasattr(self, 'collection') and self.collection:
-                results = self.collection.get()
-                documents = results['documents']
-                ids = results['ids']
-            elif hasattr(self, 'vectorizer') and self.vectorizer and hasattr(self.vectorizer, 'collection'):
-                results = self.vectorizer.collection.get()
-                documents = results['documents']
-                ids = results['ids']
-            else:
+            # 从ChromaDB获取所有文档ID和元数据
+            collection = self._get_collection()
+            if collection is None:
                 print("❌ 无法访问ChromaDB collection")
                 raise Exception("ChromaDB collection不可用")
             
-            print(f"从ChromaDB获取到 {len(documents)} 个文档")
+            results = collection.get(include=['metadatas'])
+            ids = results['ids']
+            metadatas = results.get('metadatas') or [{}] * len(ids)
             
-            # 标准化ID格式并构建文档字典
-            normalized_docs = {}
+            print(f"从ChromaDB获取到 {len(ids)} 个文档")
+            
+            # 标准化ID格式
+            self.doc_metadatas = {}
             self._id_mapping = {}
             
-            for doc_id, content in zip(ids, documents):
+            for doc_id, metadata in zip(ids, metadatas):
                 # 统一ID格式，去除可能的格式差异
                 normalized_id = str(doc_id).strip()
-                normalized_docs[normalized_id] = content
+                self.doc_metadatas[normalized_id] = metadata or {}
                 
                 # 建立ID映射表用于调试
                 if doc_id != normalized_id:
                     self._id_mapping[doc_id] = normalized_id
+            self._id_mapping_reverse = {v: k for k, v in self._id_mapping.items()}
             
-            # 构建BM25索引
-            self.build_bm25_index(normalized_docs)
+            # 尝试加载快照（BM25与字符n-gram索引各自按指纹校验）
+            self._fingerprint = CollectionFingerprint.from_entries(ids, metadatas)
+            fingerprint = self._fingerprint.hexdigest(TOKENIZER_VERSION)
+            ngram_fingerprint = self._fingerprint.hexdigest(NGRAM_VERSION)
+            snapshot_path = self.get_bm25_snapshot_path() if use_snapshot else None
+            snapshot = None
+            ngram_snapshot = None
+            if snapshot_path:
+                try:
+                    snapshot = BM25Index.load(snapshot_path, fingerprint, k1=self.bm25_k1, b=self.bm25_b)
+                    ngram_snapshot = NGramIndex.load(get_ngram_snapshot_path(snapshot_path), ngram_fingerprint)
+                except Exception as e:
+                    print(f"⚠️ 索引快照加载失败: {e}，重新构建")
             
-            if hasattr(self, '_id_mapping') and self._id_mapping:
+            # 任一快照不存在或已过期时获取文档内容
+            normalized_docs = None
+            if snapshot is None or ngram_snapshot is None:
+                documents_result = collection.get(include=['documents'])
+                contents = {str(doc_id).strip(): content for doc_id, content in zip(documents_result['ids'], documents_result['documents'])}
+                normalized_docs = {doc_id: contents.get(doc_id) or '' for doc_id in self.doc_metadatas}
+            
+            if snapshot is not None:
+                self.bm25_index.close()
+                self.bm25_index = snapshot
+                self.documents = {}
+                self.token_cache.clear()
+                print(f"✅ 已从快照加载BM25索引: {snapshot_path}")
+            else:
+                # 构建BM25索引
+                self.build_bm25_index(normalized_docs)
+                self._save_bm25_snapshot(fingerprint)
+            
+            if ngram_snapshot is not None:
+                self.ngram_index.close()
+                self.ngram_index = ngram_snapshot
+                print(f"✅ 已从快照加载字符n-gram索引")
+            else:
+                self.build_ngram_index(normalized_docs)
+                self._save_ngram_snapshot(ngram_fingerprint)
+            
+            if self._id_mapping:
                 print(f"建立了 {len(self._id_mapping)} 个ID映射")
             
-            print(f"全局BM25索引构建完成，包含 {len(self.bm25_index)} 个文档")
+            # 预计算ID别名索引，查询时的ID解析只需哈希查找
+            self.build_id_alias_index()
+            self._filter_indexes = {}
+            
+            build_time = (datetime.now() - start_time_build).total_seconds()
+            print(f"全局BM25索引构建完成，包含 {len(self.bm25_index)} 个文档，耗时{build_time:.2f}秒")
         except Exception as e:
             print(f"构建全局BM25索引失败: {e}")
             import traceback
             traceback.print_exc()
-            self.bm25_index = {}
-            self.doc_lengths = {}
-            self.term_doc_freq = {}
-            self.doc_count = 0
-            self.avg_doc_length = 0
+            self.bm25_index = BM25Index(k1=self.bm25_k1, b=self.bm25_b)
+            self.ngram_index = NGramIndex()
+            self.doc_metadatas = {}
+            self._fingerprint = CollectionFingerprint()
             self._id_mapping = {}
+            self._id_mapping_reverse = {}
+            self._stripped_id_aliases = {}
+            self._numeric_id_aliases = {}
+            self._ambiguous_aliases = {'去前缀': {}, '末尾数字': {}}
+
+    def build_ngram_index(self, documents: Dict[str, str]):
+        """
+        构建字符n-gram倒排索引（字面短语检索通道）
+        
+        Args:
+            documents: 文档字典 {doc_id: content}
+        """
+        print("正在构建字符n-gram索引...")
+        self.ngram_index.build_from_texts(documents, workers=self.index_workers)
+        print(f"字符n-gram索引构建完成：{self.ngram_index.doc_count}个文档，{len(self.ngram_index.terms)}个n-gram")
+
+    def _collection_fingerprint(self, tokenizer_version: str = TOKENIZER_VERSION) -> str:
+        """内存中的文档对应的集合指纹（与从ChromaDB读取时的计算方式一致）"""
+        return self._fingerprint.hexdigest(tokenizer_version)
+    
+    def _save_bm25_snapshot(self, fingerprint: str = None):
+        """
+        保存BM25快照
+        
+        Args:
+            fingerprint: 集合指纹，默认根据内存中的元数据计算
+        """
+        snapshot_path = self.get_bm25_snapshot_path() if self.use_bm25_snapshot else None
+        if not snapshot_path:
+            return
+        try:
+            self.bm25_index.save(snapshot_path, fingerprint or self._collection_fingerprint())
+            print(f"💾 BM25快照已保存: {snapshot_path}")
+        except Exception as e:
+            print(f"⚠️ BM25快照保存失败: {e}")
+    
+    def _save_ngram_snapshot(self, fingerprint: str = None):
+        """
+        保存字符n-gram快照
+        
+        Args:
+            fingerprint: 集合指纹，默认根据内存中的元数据计算
+        """
+        snapshot_path = self.get_bm25_snapshot_path() if self.use_bm25_snapshot else None
+        if not snapshot_path:
+            return
+        try:
+            self.ngram_index.save(get_ngram_snapshot_path(snapshot_path), fingerprint or self._collection_fingerprint(NGRAM_VERSION))
+        except Exception as e:
+            print(f"⚠️ 字符n-gram快照保存失败: {e}")
+    
+    def _save_snapshot_changes(self):
+        """
+        把增量变化追加到BM25与字符n-gram快照的增量日志（只写入变化的文档，日志过大时整体重写快照）
+        """
+        snapshot_path = self.get_bm25_snapshot_path() if self.use_bm25_snapshot else None
+        if not snapshot_path:
+            return
+        snapshots = [
+            ("BM25", self.bm25_index, snapshot_path, TOKENIZER_VERSION),
+            ("字符n-gram", self.ngram_index, get_ngram_snapshot_path(snapshot_path), NGRAM_VERSION)
+        ]
+        for label, index, path, tokenizer_version in snapshots:
+            try:
+                if index.save_changes(path, self._collection_fingerprint(tokenizer_version)):
+                    print(f"💾 {label}快照已整体保存: {path}")
+            except Exception as e:
+                print(f"⚠️ {label}快照增量保存失败: {e}")
+    
+    def apply_document_changes(self, 
+                               upserts: List[Dict[str, Any]], 
+                               deletions: List[str] = ()) -> bool:
+        """
+        增量更新BM25索引：只对新增或更新的文档分词，并调整倒排列表、文档频率和平均文档长度
+        
+        作为向量化器的监听器在入库/删除后调用，同时维护字符n-gram索引、元数据、集合指纹和ID别名
+        （均只处理变化的文档），并把变化追加到磁盘快照的增量日志
+        
+        Args:
+            upserts: 新增或更新的文档 [{'id', 'document', 'metadata'}]
+            deletions: 删除的文档ID
+            
+        Returns:
+            是否同步成功
+        """
+        start_time_update = datetime.now()
+        try:
+            for raw_id in deletions:
+                doc_id = str(raw_id).strip()
+                if doc_id in self.bm25_index:
+                    self._unregister_id_aliases(doc_id)
+                self.bm25_index.remove_document(doc_id)
+                self.ngram_index.remove_document(doc_id)
+                if doc_id in self.doc_metadatas:
+                    self._fingerprint.remove(raw_id, self.doc_metadatas.pop(doc_id))
+                self.documents.pop(doc_id, None)
+                self._id_mapping.pop(raw_id, None)
+                self._id_mapping_reverse.pop(doc_id, None)
+            
+            changed = 0
+            for chunk in upserts:
+                raw_id = chunk['id']
+                doc_id = str(raw_id).strip()
+                content = chunk.get('document') or ''
+                existed = doc_id in self.bm25_index
+                if self.bm25_index.add_document(doc_id, self.preprocess_text(content), content_hash(content)):
+                    changed += 1
+                    # 更新的文档移到索引末尾，别名随之重新登记
+                    if existed:
+                        self._unregister_id_aliases(doc_id)
+                    self._register_id_aliases(doc_id)
+                self.ngram_index.add_text(doc_id, content)
+                if doc_id in self.doc_metadatas:
+                    self._fingerprint.remove(raw_id, self.doc_metadatas[doc_id])
+                self.doc_metadatas[doc_id] = chunk.get('metadata') or {}
+                self._fingerprint.add(raw_id, self.doc_metadatas[doc_id])
+                self.documents[doc_id] = content
+                if raw_id != doc_id:
+                    self._id_mapping[raw_id] = doc_id
+                    self._id_mapping_reverse[doc_id] = raw_id
+            
+            self._filter_indexes = {}
+            self._save_snapshot_changes()
+            
+            update_time = (datetime.now() - start_time_update).total_seconds()
+            print(f"BM25索引增量更新完成：新增/更新{changed}个，删除{len(deletions)}个，当前{self.doc_count}个文档，耗时{update_time:.2f}秒")
+            return True
+        except Exception as e:
+            print(f"BM25索引增量更新失败: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
 
     def search_candidates(self, 
                          query: str, 
-                         n_candidates: int = 50) -> List[Dict[str, Any]]:
+                         n_candidates: int = 50,
+                         vector_results: Optional[Dict[str, Any]] = None,
+                         filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         搜索候选文档
         
         Args:
             query: 查询文本
             n_candidates: 候选文档数量
+            vector_results: 可选，已完成的向量检索结果（批量检索时传入，不再单独检索）
+            filters: 可选，元数据过滤条件（向量检索与短语检索都只在满足条件的文档中取top-k）
             
         Returns:
             候选文档列表
@@ -405,23 +817,27 @@ class AdvancedSearchSystem:
         query_terms = [kw for kw, _ in keywords]
         
         # 1. 向量搜索
-        if self.vectorizer and self.vectorizer.model:
+        if vector_results is not None or (self.vectorizer and self.vectorizer.model):
             try:
-                vector_results = self.vectorizer.search_similar_chunks(
-                    query_text=query,
-                    n_results=n_candidates
-                )
+                if vector_results is None:
+                    vector_results = self.vectorizer.search_similar_chunks(
+                        query_text=query,
+                        n_results=n_candidates,
+                        filters=filters
+                    )
                 
                 if vector_results and 'documents' in vector_results:
-                    for i, (doc, metadata, doc_id) in enumerate(zip(
+                    # 一次遍历倒排列表为所有候选文档计算BM25得分，精确匹配同样整批计算
+                    bm25_scores = self.calculate_bm25_scores(query_terms, vector_results['ids'][0])
+                    exact_scores = self.exact_match_scores(query, vector_results['documents'][0])
+                    
+                    for i, (doc, metadata, doc_id, bm25_score, exact_score) in enumerate(zip(
                         vector_results['documents'][0],
                         vector_results['metadatas'][0],
-                        vector_results['ids'][0]
+                        vector_results['ids'][0],
+                        bm25_scores,
+                        exact_scores
                     )):
-                        # 计算BM25得分
-                        bm25_score = self.calculate_bm25_score(query_terms, doc_id)
-                        exact_score = self.exact_match_score(query, doc)
-                        
                         candidates.append({
                             'id': doc_id,
                             'content': doc,
@@ -435,9 +851,104 @@ class AdvancedSearchSystem:
             except Exception as e:
                 print(f"向量搜索失败: {e}")
         
+        candidates = candidates[:n_candidates]
+        
+        # 2. 字符n-gram短语检索：补充向量检索未召回、但字面包含查询短语的文档
+        if self.phrase_candidates > 0:
+            try:
+                candidates.extend(self._phrase_candidates(query, query_terms, candidates, filters))
+            except Exception as e:
+                print(f"短语检索失败: {e}")
+        
         # 注释：已移除时间范围搜索补充逻辑
         
-        return candidates[:n_candidates]
+        return candidates
+    
+    def _query_phrases(self, query: str) -> List[str]:
+        """
+        用于字面检索的查询短语：完整查询及抽取的关键词
+        
+        Args:
+            query: 查询文本
+            
+        Returns:
+            短语列表
+        """
+        phrases = [query.strip()] + [kw for kw, _ in self.extract_keywords_bm25(query, top_k=10)]
+        return [phrase for phrase in dict.fromkeys(phrases) if len(phrase) >= 2]
+    
+    def phrase_search(self, 
+                      query: str, 
+                      top_k: int = 10, 
+                      exclude: set = None,
+                      filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        字面短语检索：在字符n-gram索引上查找包含查询短语的文档，不扫描全部文档内容
+        
+        Args:
+            query: 查询文本
+            top_k: 返回文档数量
+            exclude: 需要跳过的文档ID
+            filters: 可选，元数据过滤条件
+            
+        Returns:
+            [{'id', 'content', 'phrase_score'}]，按短语得分降序
+        """
+        fetched = {}
+        
+        def fetch(doc_ids: List[str]) -> Dict[str, str]:
+            contents = self._fetch_documents(doc_ids)
+            fetched.update(contents)
+            return contents
+        
+        hits = self.ngram_index.search_phrases(self._query_phrases(query), top_k=top_k, fetch_documents=fetch,
+                                               exclude=exclude, allowed=self._filter_mask('ngram', filters))
+        missing = [doc_id for doc_id, _ in hits if doc_id not in fetched]
+        if missing:
+            fetch(missing)
+        return [{'id': doc_id, 'content': fetched.get(doc_id, ''), 'phrase_score': score} for doc_id, score in hits]
+    
+    def _phrase_candidates(self, 
+                           query: str, 
+                           query_terms: List[str], 
+                           candidates: List[Dict[str, Any]],
+                           filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        生成字面短语检索补充的候选文档（跳过已在候选池中的文档）
+        
+        Args:
+            query: 查询文本
+            query_terms: BM25查询词
+            candidates: 已有候选文档
+            filters: 可选，元数据过滤条件
+            
+        Returns:
+            补充的候选文档列表
+        """
+        existing = {str(c['id']).strip() for c in candidates}
+        hits = self.phrase_search(query, top_k=self.phrase_candidates, exclude=existing, filters=filters)
+        if not hits:
+            return []
+        
+        doc_ids = [hit['id'] for hit in hits]
+        bm25_scores = self.calculate_bm25_scores(query_terms, doc_ids)
+        exact_scores = self.exact_match_scores(query, [hit['content'] for hit in hits])
+        
+        extra = []
+        for hit, bm25_score, exact_score in zip(hits, bm25_scores, exact_scores):
+            extra.append({
+                'id': self._id_mapping_reverse.get(hit['id'], hit['id']),
+                'content': hit['content'],
+                'metadata': self.doc_metadatas.get(hit['id'], {}),
+                'vector_rank': None,
+                'vector_score': 0.0,  # 未被向量检索召回
+                'bm25_score': bm25_score,
+                'exact_score': exact_score,
+                'phrase_score': hit['phrase_score']
+            })
+        
+        print(f"字面短语检索补充{len(extra)}个候选文档")
+        return extra
     
     def rerank_with_bre(self, 
                         query: str, 
@@ -465,8 +976,16 @@ class AdvancedSearchSystem:
         # 2. 使用全局BM25索引计算得分 (不再构建临时索引)
         
         # 3. 使用已计算的得分或重新计算
+        # 缺失或为0的BM25分数统一批量重算，只遍历一次倒排列表
+        recalc_ids = [c['id'] for c in candidates if not c.get('bm25_score')]
+        recalc_scores = dict(zip(recalc_ids, self.calculate_bm25_scores(query_terms, recalc_ids))) if recalc_ids else {}
+        
+        # 缺失的精确匹配分数同样整批计算
+        exact_missing = [i for i, c in enumerate(candidates) if c.get('exact_score') is None]
+        exact_recalc = dict(zip(exact_missing, self.exact_match_scores(query, [candidates[i]['content'] for i in exact_missing])))
+        
         scored_candidates = []
-        for candidate in candidates:
+        for i, candidate in enumerate(candidates):
             # 使用候选文档中已计算的得分，如果没有则重新计算
             vector_score = candidate.get('vector_score', 0.0)
             bm25_score = candidate.get('bm25_score')
@@ -474,16 +993,16 @@ class AdvancedSearchSystem:
             
             # 智能处理BM25分数：优先保留有效的预计算分数
             if bm25_score is None:
-                bm25_score = self.calculate_bm25_score(query_terms, candidate['id'])
+                bm25_score = recalc_scores.get(candidate['id'], 0.0)
             elif bm25_score == 0.0:
                 # 如果预计算分数为0，尝试重新计算
-                recalc_bm25 = self.calculate_bm25_score(query_terms, candidate['id'])
+                recalc_bm25 = recalc_scores.get(candidate['id'], 0.0)
                 if recalc_bm25 > 0:
                     print(f"[BM25_FIX] 重新计算BM25分数: {bm25_score} -> {recalc_bm25}")
                     bm25_score = recalc_bm25
                     
             if exact_score is None:
-                exact_score = self.exact_match_score(query, candidate['content'])
+                exact_score = exact_recalc[i]
             
             scored_candidate = candidate.copy()
             scored_candidate.update({
@@ -522,14 +1041,13 @@ class AdvancedSearchSystem:
         for candidate in reranked:
             candidate['score'] = candidate['final_score']
         
-        # 6. 过滤和截断
-        min_threshold = 0.001  # 降低阈值，避免过度过滤有效结果
-        filtered_reranked = [r for r in reranked if r['final_score'] > min_threshold]
+        # 6. 过滤和截断（阈值较低，避免过度过滤有效结果）
+        filtered_count = sum(1 for r in reranked if r['final_score'] > RERANK_MIN_SCORE)
         
-        print(f"重排序完成，原始{len(reranked)}个，过滤后{len(filtered_reranked)}个，返回前{min(top_k, len(filtered_reranked))}个结果")
+        print(f"重排序完成，原始{len(reranked)}个，过滤后{filtered_count}个，返回前{min(top_k, filtered_count)}个结果")
         
         # 输出筛选后文档的详细内容
-        final_results = filtered_reranked[:top_k] if len(filtered_reranked) >= max(1, top_k // 2) else reranked[:top_k]
+        final_results = truncate_reranked(reranked, top_k)
         
         print("\n=== 筛选后文档详细内容 ===")
         for i, doc in enumerate(final_results, 1):
@@ -556,11 +1074,10 @@ class AdvancedSearchSystem:
         print("=== 文档详细内容结束 ===\n")
         
         # 如果过滤后结果太少，返回未经过滤的重排序结果
-        if len(filtered_reranked) < max(1, top_k // 2):
-            print(f"过滤后结果太少({len(filtered_reranked)})，返回未经过滤的重排序结果")
-            return reranked[:top_k]
+        if filtered_count < max(1, top_k // 2):
+            print(f"过滤后结果太少({filtered_count})，返回未经过滤的重排序结果")
         
-        return filtered_reranked[:top_k]
+        return final_results
     
     def generate_prompt(self, 
                        query: str, 
@@ -645,7 +1162,9 @@ class AdvancedSearchSystem:
     def search(self, 
                query: str, 
                top_k: int = 10,
-               max_context_length: int = 2000) -> Dict[str, Any]:
+               max_context_length: int = 2000,
+               vector_results: Optional[Dict[str, Any]] = None,
+               filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         执行完整的搜索流程
         
@@ -653,6 +1172,8 @@ class AdvancedSearchSystem:
             query: 查询文本
             top_k: 返回结果数量
             max_context_length: 最大上下文长度
+            vector_results: 可选，已完成的向量检索结果（由batch_search传入）
+            filters: 可选，元数据过滤条件，如 {'source_file': 'chap02', 'chunk_type': 'qa_pair'}
             
         Returns:
             搜索结果和提示词
@@ -663,7 +1184,9 @@ class AdvancedSearchSystem:
         # 1. 搜索候选文档
         candidates = self.search_candidates(
             query=query,
-            n_candidates=50
+            n_candidates=50,
+            vector_results=vector_results,
+            filters=filters
         )
         
         print(f"找到{len(candidates)}个候选文档")
@@ -698,27 +1221,101 @@ class AdvancedSearchSystem:
             'prompt': prompt,
             'search_time': search_time,
             'total_candidates': len(candidates),
-            'keywords_extracted': [kw for kw, _ in self.extract_keywords_bm25(query)]
+            'keywords_extracted': [kw for kw, _ in self.extract_keywords_bm25(query)]  # 命中分词缓存
+        }
+    
+    def keyword_search(self, 
+                       query: str, 
+                       top_k: int = 10,
+                       filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        独立的关键词检索：直接在全局BM25倒排索引上取top-k，不经过向量模型和ChromaDB
+        
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+            filters: 可选，元数据过滤条件
+            
+        Returns:
+            搜索结果（结构与search()一致，不含提示词；按综合得分排序，每个结果另含bm25_rank，即BM25得分的名次）
+        """
+        print(f"\n=== 开始关键词检索：{query} ===")
+        start_time_search = datetime.now()
+        
+        keywords = self.extract_keywords_bm25(query, top_k=10)
+        query_terms = [kw for kw, _ in keywords]
+        
+        hits = self.bm25_search(query_terms, top_k=top_k, filters=filters)
+        max_bm25_score = max((score for _, score in hits), default=0.0) or 1.0
+        contents = self._fetch_documents([doc_id for doc_id, _ in hits])
+        exact_scores = self.exact_match_scores(query, [contents.get(doc_id, '') for doc_id, _ in hits])
+        
+        results = []
+        for bm25_rank, ((doc_id, bm25_score), exact_score) in enumerate(zip(hits, exact_scores)):
+            content = contents.get(doc_id, '')
+            norm_bm25 = bm25_score / max_bm25_score
+            final_score = self.bm25_weight * norm_bm25 + self.exact_weight * exact_score
+            
+            results.append({
+                'id': doc_id,
+                'bm25_rank': bm25_rank,
+                'content': content,
+                'metadata': self.doc_metadatas.get(doc_id, {}),
+                'bm25_score': bm25_score,
+                'exact_score': exact_score,
+                'final_score': final_score,
+                'score': final_score,
+                'score_breakdown': {
+                    'vector': 0.0,
+                    'bm25': bm25_score,
+                    'exact': exact_score,
+                    'bm25_norm': norm_bm25
+                }
+            })
+        
+        results.sort(key=lambda x: x['final_score'], reverse=True)
+        search_time = (datetime.now() - start_time_search).total_seconds()
+        
+        print(f"关键词检索完成，命中{len(results)}个文档，耗时{search_time:.3f}秒")
+        
+        return {
+            'query': query,
+            'results': results,
+            'search_time': search_time,
+            'total_candidates': len(hits),
+            'keywords_extracted': query_terms
         }
     
     def batch_search(self, 
                     queries: List[str], 
-                    top_k: int = 5) -> List[Dict[str, Any]]:
+                    top_k: int = 5,
+                    max_context_length: int = 2000,
+                    filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
-        批量搜索
+        批量搜索：全部查询一次编码、一次ChromaDB多向量查询，再分别重排序
         
         Args:
             queries: 查询列表
             top_k: 每个查询返回的结果数量
+            max_context_length: 最大上下文长度
+            filters: 可选，元数据过滤条件（对全部查询生效）
             
         Returns:
             批量搜索结果
         """
+        batch_vector_results = [None] * len(queries)
+        if queries and self.vectorizer and self.vectorizer.model:
+            start_time_batch = datetime.now()
+            batch_vector_results = self.vectorizer.search_similar_chunks_batch(queries, n_results=50, filters=filters)
+            batch_time = (datetime.now() - start_time_batch).total_seconds()
+            print(f"批量向量检索完成：{len(queries)}个查询，耗时{batch_time:.2f}秒")
+        
         results = []
         
-        for i, query in enumerate(queries):
+        for i, (query, vector_results) in enumerate(zip(queries, batch_vector_results)):
             print(f"\n处理查询 {i+1}/{len(queries)}: {query}")
-            result = self.search(query, top_k=top_k)
+            result = self.search(query, top_k=top_k, max_context_length=max_context_length,
+                                 vector_results=vector_results, filters=filters)
             results.append(result)
         
         return results
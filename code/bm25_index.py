@@ -0,0 +1,1353 @@
+# -*- coding: utf-8 -*-
+"""
+BM25倒排索引
+词项 -> 倒排列表（文档编号数组 + 词频数组），预计算IDF和文档长度归一化因子，
+一次遍历即可为所有命中查询词的文档打分，可作为独立的检索通道使用；top-k检索按词项得分上界做MaxScore剪枝
+支持按文档增量新增/更新/删除，入库或清理少量文档时无需全量重建
+"""
+
+import os
+import re
+import json
+import mmap
+import struct
+import hashlib
+import multiprocessing
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Dict, List, Tuple, Iterable, Optional, Any
+
+import jieba
+import numpy as np
+
+# 索引快照文件格式
+SNAPSHOT_MAGIC = b'BM25IDX\x00'
+SNAPSHOT_VERSION = 2
+_SNAPSHOT_ALIGN = 8
+
+# 分词逻辑版本：修改tokenize时需递增，使已有BM25快照失效
+TOKENIZER_VERSION = "1"
+
+# 字符n-gram切分版本：修改char_ngrams时需递增
+NGRAM_VERSION = "1"
+NGRAM_SIZES = (2, 3)
+
+# 文档数低于该值时不启用并行分词（进程启动开销大于收益）
+PARALLEL_MIN_DOCUMENTS = 2000
+
+# 过滤后的文档数不超过全部文档的该比例时，直接在这些文档上全量打分（比剪枝更快）
+FILTERED_EXACT_FRACTION = 0.25
+
+# 派生索引目录后缀：与ChromaDB目录同级的"<目录名>_indexes"
+INDEX_DIR_SUFFIX = "_indexes"
+
+# 增量日志超过快照文件大小的该比例时整体重写（压缩）快照
+DELTA_COMPACT_RATIO = 0.25
+
+_NON_WORD_PATTERN = re.compile(r'[^\u4e00-\u9fa5a-zA-Z0-9\s]')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# 停用词
+STOP_WORDS = {'的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一个', '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这'}
+
+# 重要的单字符保留列表（主要是人名、地名等）
+IMPORTANT_SINGLE_CHARS = {'乔', '梁', '李', '王', '张', '刘', '陈', '杨', '黄', '赵', '周', '吴', '徐', '孙', '马', '朱', '胡', '郭', '何', '高'}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    BM25分词：清理符号、jieba分词、去停用词
+    
+    Args:
+        text: 输入文本
+        
+    Returns:
+        词项列表
+    """
+    # 基本清理
+    text = _NON_WORD_PATTERN.sub(' ', text)
+    text = _WHITESPACE_PATTERN.sub(' ', text).strip()
+    
+    filtered_words = []
+    for word in jieba.lcut(text):
+        # 保留长度大于1的词
+        if len(word) > 1 and word not in STOP_WORDS:
+            filtered_words.append(word)
+        # 保留重要的单字符
+        elif len(word) == 1 and word in IMPORTANT_SINGLE_CHARS:
+            filtered_words.append(word)
+        # 保留数字和英文
+        elif len(word) == 1 and (word.isdigit() or word.isalpha()):
+            filtered_words.append(word)
+    
+    return filtered_words
+
+
+def char_ngrams(text: str) -> List[str]:
+    """
+    字符n-gram切分（小写后的二元和三元字符组，用于字面短语检索）
+    
+    Args:
+        text: 输入文本
+        
+    Returns:
+        n-gram列表（保留重复）
+    """
+    text = (text or '').lower()
+    return [text[i:i + n] for n in NGRAM_SIZES for i in range(len(text) - n + 1)]
+
+
+def content_hash(text: str) -> str:
+    """文档内容哈希，用于判断文档内容是否变化"""
+    return hashlib.sha1((text or '').encode('utf-8')).hexdigest()
+
+
+def get_index_directory(persist_directory: str) -> str:
+    """ChromaDB目录对应的派生索引目录"""
+    return os.path.normpath(persist_directory) + INDEX_DIR_SUFFIX
+
+
+def get_snapshot_path(persist_directory: str, collection_name: str) -> str:
+    """ChromaDB集合对应的BM25快照路径"""
+    return os.path.join(get_index_directory(persist_directory), f"{collection_name}.bm25")
+
+
+def get_ngram_snapshot_path(snapshot_path: str) -> str:
+    """BM25快照对应的字符n-gram快照路径（同目录、同名、扩展名.ngram）"""
+    return os.path.splitext(snapshot_path)[0] + ".ngram"
+
+
+def get_delta_path(snapshot_path: str) -> str:
+    """快照对应的增量日志路径（同目录、同名加.delta后缀）"""
+    return snapshot_path + ".delta"
+
+
+class CollectionFingerprint:
+    """
+    可增量更新的集合指纹：文档ID与其写入时间（created_at）不变则指纹不变
+
+    每个文档的（ID, created_at）条目取SHA1的前16字节作为整数，指纹为文档数和全部条目之和（模2^128），
+    与文档顺序无关；文档新增、删除或重新写入时只需加减对应条目，不必重新读取整个集合
+    """
+
+    _MODULUS = 1 << 128
+
+    def __init__(self, count: int = 0, total: int = 0):
+        self.count = count
+        self.total = total
+
+    @classmethod
+    def from_entries(cls, 
+                     ids: Iterable[str], 
+                     metadatas: Iterable[Optional[Dict[str, Any]]]) -> 'CollectionFingerprint':
+        """由集合中的全部文档ID和元数据计算指纹"""
+        fingerprint = cls()
+        for doc_id, metadata in zip(ids, metadatas):
+            fingerprint.add(doc_id, metadata)
+        return fingerprint
+
+    @classmethod
+    def parse(cls, digest: Optional[str], tokenizer_version: str = "") -> Optional['CollectionFingerprint']:
+        """
+        从hexdigest(tokenizer_version)的结果还原指纹
+
+        Returns:
+            指纹；格式或版本不符（如旧版本快照的指纹）时返回None
+        """
+        try:
+            prefix, count, total = (digest or '').rsplit('-', 2)
+            if prefix != f"{SNAPSHOT_VERSION}-{tokenizer_version}":
+                return None
+            return cls(int(count), int(total, 16))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _entry(doc_id: str, metadata: Optional[Dict[str, Any]]) -> int:
+        data = f"{doc_id}\x01{(metadata or {}).get('created_at', '')}".encode('utf-8')
+        return int.from_bytes(hashlib.sha1(data).digest()[:16], 'big')
+
+    def add(self, doc_id: str, metadata: Optional[Dict[str, Any]]):
+        """计入一个文档"""
+        self.count += 1
+        self.total = (self.total + self._entry(str(doc_id), metadata)) % self._MODULUS
+
+    def remove(self, doc_id: str, metadata: Optional[Dict[str, Any]]):
+        """移除一个文档（元数据须与计入时相同）"""
+        self.count -= 1
+        self.total = (self.total - self._entry(str(doc_id), metadata)) % self._MODULUS
+
+    def copy(self) -> 'CollectionFingerprint':
+        return CollectionFingerprint(self.count, self.total)
+
+    def hexdigest(self, tokenizer_version: str = "") -> str:
+        """
+        指纹字符串
+
+        Args:
+            tokenizer_version: 分词逻辑版本，分词规则变化时应同步修改
+        """
+        return f"{SNAPSHOT_VERSION}-{tokenizer_version}-{self.count}-{self.total:032x}"
+
+
+def compute_collection_fingerprint(ids: List[str], 
+                                   metadatas: List[Optional[Dict[str, Any]]],
+                                   tokenizer_version: str = "") -> str:
+    """
+    计算集合指纹：文档ID与其写入时间（created_at）不变则指纹不变（见CollectionFingerprint）
+    
+    Args:
+        ids: 集合中的全部文档ID
+        metadatas: 与ids对应的元数据
+        tokenizer_version: 分词逻辑版本，分词规则变化时应同步修改
+        
+    Returns:
+        指纹字符串
+    """
+    return CollectionFingerprint.from_entries(ids, metadatas).hexdigest(tokenizer_version)
+
+
+def _init_tokenizer_worker(freq: Optional[Dict[str, int]], total: Optional[int]):
+    """分词子进程初始化：非fork方式启动时复制主进程的jieba词典（含运行时添加的词）"""
+    if freq is not None:
+        jieba.dt.FREQ = freq
+        jieba.dt.total = total
+        jieba.dt.initialized = True
+
+
+def _count_terms_chunk(tokenizer: Callable[[str], List[str]], texts: List[str]) -> List[Tuple[int, List[Tuple[str, int]]]]:
+    """对一批文档分词并统计词频（词项按首次出现的顺序排列）"""
+    return [(len(tokens), list(Counter(tokens).items())) for tokens in map(tokenizer, texts)]
+
+
+def count_terms(texts: List[str], 
+                tokenizer: Callable[[str], List[str]] = tokenize, 
+                workers: Optional[int] = None) -> List[Tuple[int, List[Tuple[str, int]]]]:
+    """
+    批量分词并统计各文档词频，文档较多时分片交给进程池并行处理
+    
+    jieba为纯Python实现，单进程分词只能用到一个CPU核。各分片结果按输入顺序合并，
+    与顺序处理的结果完全一致
+    
+    Args:
+        texts: 文档内容列表
+        tokenizer: 分词函数（须为模块级函数，以便传给子进程）
+        workers: 进程数，None表示使用全部CPU核，1表示不并行
+        
+    Returns:
+        与texts一一对应的 (词项总数, [(词项, 词频)])
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(texts) // max(1, PARALLEL_MIN_DOCUMENTS // 4) or 1)
+    if workers <= 1 or len(texts) < PARALLEL_MIN_DOCUMENTS:
+        return _count_terms_chunk(tokenizer, texts)
+    
+    # fork方式的子进程直接继承主进程的jieba词典；其他方式需要复制词典
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+        initargs = (None, None)
+    else:
+        context = multiprocessing.get_context('spawn')
+        jieba.initialize()
+        initargs = (jieba.dt.FREQ, jieba.dt.total)
+    
+    chunk_size = -(-len(texts) // (workers * 4))
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    try:
+        results = []
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_tokenizer_worker, initargs=initargs) as executor:
+            for chunk_result in executor.map(partial(_count_terms_chunk, tokenizer), chunks):
+                results.extend(chunk_result)
+        return results
+    except Exception as e:
+        print(f"⚠️ 并行分词失败，改为单进程分词: {e}")
+        return _count_terms_chunk(tokenizer, texts)
+
+
+class _MappedPostings(Sequence):
+    """
+    内存映射快照中的分段数组（倒排列表、正排列表）：按编号惰性切片，不复制数据
+
+    增量修改时采用写时复制：被修改或新追加的分段保存在overrides中，其余分段仍指向快照
+    """
+    
+    def __init__(self, offsets: memoryview, values: memoryview):
+        self.offsets = offsets
+        self.values = values
+        self.overrides: Dict[int, array] = {}
+        self._base_count = len(offsets) - 1
+        self._count = self._base_count
+    
+    def __getitem__(self, i: int):
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        segment = self.overrides.get(i)
+        if segment is not None:
+            return segment
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def mutable(self, i: int) -> array:
+        """获取可修改的分段（首次修改时从快照复制）"""
+        segment = self.overrides.get(i)
+        if segment is None:
+            segment = array('i', self[i].tobytes())
+            self.overrides[i] = segment
+        return segment
+    
+    def append(self, segment: array):
+        """追加新分段"""
+        self.overrides[self._count] = segment
+        self._count += 1
+    
+    def lengths(self) -> np.ndarray:
+        """各分段长度（倒排列表的长度即文档频率）"""
+        lengths = np.zeros(self._count, dtype=np.int64)
+        lengths[:self._base_count] = np.diff(np.frombuffer(self.offsets, dtype=np.int64))
+        for i, segment in self.overrides.items():
+            lengths[i] = len(segment)
+        return lengths
+
+
+class BM25Index(Mapping):
+    """
+    基于倒排列表的BM25索引
+
+    文档删除后其编号作为空位保留（doc_ids中为None），整体保存快照时统一压缩；
+    对应磁盘快照的索引记录此后的增量变化，save_changes只把变化追加到快照的增量日志；
+    为兼容旧接口（doc_id -> Counter），本类同时实现了只读Mapping协议
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        初始化BM25索引
+
+        Args:
+            k1: BM25参数k1
+            b: BM25参数b
+        """
+        self.k1 = k1
+        self.b = b
+        self._reset()
+
+    def _reset(self):
+        """清空索引内容"""
+        # 文档编号 <-> 文档ID（已删除文档的编号保留为None）
+        self.doc_ids: List[Optional[str]] = []
+        self.doc_index: Dict[str, int] = {}
+        self.doc_lengths = array('i')
+        self.total_length = 0
+        self._tombstones = 0
+
+        # 正排列表：按文档编号存放词项编号数组，及文档内容哈希
+        self.doc_terms: List[array] = []
+        self.doc_hashes: List[Optional[str]] = []
+
+        # 词项 -> 词项编号
+        self.terms: List[str] = []
+        self.term_index: Dict[str, int] = {}
+
+        # 倒排列表：按词项编号存放（文档编号数组, 词频数组），文档编号递增
+        self.postings_docs: List[array] = []
+        self.postings_tfs: List[array] = []
+
+        # 预计算的IDF与长度归一化因子、内容哈希 -> 文档编号，索引变化后惰性重算
+        self._idf: Optional[np.ndarray] = None
+        self._norms: Optional[np.ndarray] = None
+        self._hash_index: Optional[Dict[str, int]] = None
+        # 词项编号 -> 该词项单次出现时的最大得分贡献（MaxScore剪枝的上界），按需计算
+        self._term_bounds: Dict[int, float] = {}
+
+        # 从快照加载时的内存映射及其指纹
+        self._mmap: Optional[mmap.mmap] = None
+        self.fingerprint: Optional[str] = None
+        # 自上次保存或加载快照以来的增量变化（索引没有对应的快照时为None，不记录）
+        self._journal: Optional[List[list]] = None
+
+    # === 构建 ===
+
+    def build(self, 
+              documents: Iterable[Tuple[str, List[str]]], 
+              content_hashes: Optional[Dict[str, str]] = None):
+        """
+        从分词结果构建索引
+
+        Args:
+            documents: (doc_id, 词项列表) 序列
+            content_hashes: 可选，{doc_id: 内容哈希}，用于增量更新时跳过未变化的文档
+        """
+        self.close()
+        self._reset()
+        content_hashes = content_hashes or {}
+        for doc_id, tokens in documents:
+            self._append_document(doc_id, tokens, content_hashes.get(doc_id))
+
+    def build_from_texts(self, 
+                         documents: Dict[str, str], 
+                         tokenizer: Callable[[str], List[str]] = tokenize,
+                         workers: Optional[int] = None):
+        """
+        从文档内容构建索引，分词可由多个进程并行完成
+
+        各文档的词频统计按文档顺序依次并入索引，结果（及保存的快照）与单进程构建逐字节一致
+
+        Args:
+            documents: {doc_id: content}
+            tokenizer: 分词函数（须为模块级函数）
+            workers: 分词进程数，None表示使用全部CPU核，1表示不并行
+        """
+        doc_ids = list(documents.keys())
+        texts = [documents[doc_id] or '' for doc_id in doc_ids]
+        term_counts = count_terms(texts, tokenizer, workers)
+
+        self.close()
+        self._reset()
+        for doc_id, text, (length, counts) in zip(doc_ids, texts, term_counts):
+            self._append_counts(doc_id, length, counts, content_hash(text))
+
+    @staticmethod
+    def _mutable_segment(segments, i: int) -> array:
+        """获取可修改的分段（快照中的分段先复制）"""
+        return segments.mutable(i) if isinstance(segments, _MappedPostings) else segments[i]
+
+    def _append_document(self, doc_id: str, tokens: List[str], doc_hash: Optional[str] = None) -> int:
+        """
+        追加一个新文档，返回文档编号
+
+        新文档编号总是最大，直接追加到倒排列表末尾即可保持文档编号递增
+        """
+        return self._append_counts(doc_id, len(tokens), Counter(tokens).items(), doc_hash)
+
+    def _append_counts(self, 
+                       doc_id: str, 
+                       length: int, 
+                       term_counts: Iterable[Tuple[str, int]], 
+                       doc_hash: Optional[str] = None) -> int:
+        """
+        按词频统计追加一个新文档，返回文档编号
+
+        Args:
+            doc_id: 文档ID
+            length: 文档词项总数
+            term_counts: (词项, 词频)，按词项在文档中首次出现的顺序
+            doc_hash: 文档内容哈希
+        """
+        doc_num = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        self.doc_index[doc_id] = doc_num
+        self.doc_lengths.append(length)
+        self.total_length += length
+        self.doc_hashes.append(doc_hash)
+
+        term_ids = array('i')
+        for term, tf in term_counts:
+            term_id = self.term_index.get(term)
+            if term_id is None:
+                term_id = len(self.terms)
+                self.terms.append(term)
+                self.term_index[term] = term_id
+                self.postings_docs.append(array('i'))
+                self.postings_tfs.append(array('i'))
+            self._mutable_segment(self.postings_docs, term_id).append(doc_num)
+            self._mutable_segment(self.postings_tfs, term_id).append(tf)
+            term_ids.append(term_id)
+        self.doc_terms.append(term_ids)
+
+        self._invalidate()
+        return doc_num
+
+    # === 增量维护 ===
+
+    def add_document(self, doc_id: str, tokens: List[str], doc_hash: Optional[str] = None) -> bool:
+        """
+        新增或更新单个文档，只修改该文档涉及的倒排列表
+
+        Args:
+            doc_id: 文档ID
+            tokens: 文档词项列表
+            doc_hash: 可选，文档内容哈希；与索引中记录的一致时视为未变化
+
+        Returns:
+            索引是否发生变化
+        """
+        return self._upsert_counts(doc_id, len(tokens), list(Counter(tokens).items()), doc_hash)
+
+    def _upsert_counts(self, 
+                       doc_id: str, 
+                       length: int, 
+                       term_counts: List[Tuple[str, int]], 
+                       doc_hash: Optional[str] = None) -> bool:
+        """按词频统计新增或更新单个文档（参数含义同_append_counts），返回索引是否发生变化"""
+        doc_num = self.doc_index.get(doc_id)
+        if doc_num is not None:
+            if doc_hash is not None and self.doc_hashes[doc_num] == doc_hash:
+                return False
+            self.remove_document(doc_id)
+        self._append_counts(doc_id, length, term_counts, doc_hash)
+        if self._journal is not None:
+            self._journal.append(['add', doc_id, length, term_counts, doc_hash])
+        return True
+
+    def remove_document(self, doc_id: str) -> bool:
+        """
+        删除单个文档：从其正排列表涉及的倒排列表中移除，文档编号留作空位
+
+        Args:
+            doc_id: 文档ID
+
+        Returns:
+            文档是否存在
+        """
+        doc_num = self.doc_index.pop(doc_id, None)
+        if doc_num is None:
+            return False
+
+        term_ids = self._mutable_segment(self.doc_terms, doc_num)
+        for term_id in term_ids:
+            docs = self._mutable_segment(self.postings_docs, term_id)
+            tfs = self._mutable_segment(self.postings_tfs, term_id)
+            pos = bisect_left(docs, doc_num)
+            del docs[pos]
+            del tfs[pos]
+        del term_ids[:]
+
+        self.total_length -= self.doc_lengths[doc_num]
+        self.doc_lengths[doc_num] = 0
+        self.doc_ids[doc_num] = None
+        self.doc_hashes[doc_num] = None
+        self._tombstones += 1
+        self._invalidate()
+        if self._journal is not None:
+            self._journal.append(['del', doc_id])
+        return True
+
+    def rename_documents(self, mapping: Dict[str, str]):
+        """
+        批量修改文档ID（内容不变，无需重新分词）
+
+        Args:
+            mapping: {旧ID: 新ID}
+        """
+        # 整体记为一条变化，重放时按相同顺序执行（其中被覆盖文档的删除不单独记录）
+        journal, self._journal = self._journal, None
+        renamed = [(self.doc_index.pop(old_id), new_id) for old_id, new_id in mapping.items() if old_id in self.doc_index]
+        for doc_num, new_id in renamed:
+            if new_id in self.doc_index:
+                self.remove_document(new_id)
+            self.doc_ids[doc_num] = new_id
+            self.doc_index[new_id] = doc_num
+        self._journal = journal
+        if journal is not None and renamed:
+            journal.append(['ren', dict(mapping)])
+
+    def update_documents(self, 
+                         upserts: Iterable[Tuple[str, List[str], Optional[str]]] = (),
+                         deletions: Iterable[str] = ()) -> Tuple[int, int]:
+        """
+        批量增量更新
+
+        Args:
+            upserts: (doc_id, 词项列表, 内容哈希) 序列
+            deletions: 待删除的文档ID
+
+        Returns:
+            (新增或更新的文档数, 删除的文档数)
+        """
+        removed = sum(1 for doc_id in deletions if self.remove_document(doc_id))
+        changed = sum(1 for doc_id, tokens, doc_hash in upserts if self.add_document(doc_id, tokens, doc_hash))
+        return changed, removed
+
+    def compact(self):
+        """
+        压缩索引：回收已删除文档的编号和不再出现的词项，并把快照中的数据复制到内存
+        """
+        live_docs = np.array([num for num, doc_id in enumerate(self.doc_ids) if doc_id is not None], dtype=np.intc)
+        doc_remap = np.full(len(self.doc_ids), -1, dtype=np.intc)
+        doc_remap[live_docs] = np.arange(len(live_docs), dtype=np.intc)
+
+        live_terms = [term_id for term_id in range(len(self.terms)) if len(self.postings_docs[term_id]) > 0]
+        term_remap = np.full(len(self.terms), -1, dtype=np.intc)
+        term_remap[live_terms] = np.arange(len(live_terms), dtype=np.intc)
+
+        terms = [self.terms[term_id] for term_id in live_terms]
+        postings_docs = [
+            array('i', doc_remap[np.frombuffer(self.postings_docs[term_id], dtype=np.intc)].tobytes())
+            for term_id in live_terms
+        ]
+        postings_tfs = [array('i', bytes(self.postings_tfs[term_id])) for term_id in live_terms]
+        doc_terms = [
+            array('i', term_remap[np.frombuffer(self.doc_terms[num], dtype=np.intc)].tobytes())
+            for num in live_docs
+        ]
+        doc_ids = [self.doc_ids[num] for num in live_docs]
+        doc_hashes = [self.doc_hashes[num] for num in live_docs]
+        doc_lengths = array('i', (self.doc_lengths[num] for num in live_docs))
+
+        self.close()
+        self.terms = terms
+        self.term_index = {term: i for i, term in enumerate(terms)}
+        self.postings_docs = postings_docs
+        self.postings_tfs = postings_tfs
+        self.doc_terms = doc_terms
+        self.doc_ids = doc_ids
+        self.doc_index = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        self.doc_hashes = doc_hashes
+        self.doc_lengths = doc_lengths
+        self._tombstones = 0
+        self._invalidate()
+
+    def _invalidate(self):
+        """统计量变化后清空预计算缓存"""
+        self._idf = None
+        self._norms = None
+        self._hash_index = None
+        self._term_bounds = {}
+
+    def _refresh(self):
+        """
+        预计算所有词项的IDF和所有文档的长度归一化因子
+        """
+        n = self.doc_count
+        if isinstance(self.postings_docs, _MappedPostings):
+            df = self.postings_docs.lengths().astype(np.float64)
+        else:
+            df = np.fromiter((len(p) for p in self.postings_docs), dtype=np.float64, count=len(self.postings_docs))
+        self._idf = np.log((n - df + 0.5) / (df + 0.5)) if len(df) else np.zeros(0)
+
+        lengths = np.frombuffer(self.doc_lengths, dtype=np.intc).astype(np.float64) if self.doc_lengths else np.zeros(0)
+        avgdl = self.avg_doc_length or 1.0
+        self._norms = self.k1 * (1 - self.b + self.b * (lengths / avgdl))
+
+    # === 统计信息 ===
+
+    @property
+    def doc_count(self) -> int:
+        return len(self.doc_index)
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self.total_length / self.doc_count if self.doc_count > 0 else 0
+
+    def doc_freq(self, term: str) -> int:
+        """词项的文档频率"""
+        term_id = self.term_index.get(term)
+        return len(self.postings_docs[term_id]) if term_id is not None else 0
+
+    def find_by_hash(self, doc_hash: str) -> Optional[int]:
+        """
+        按内容哈希查找文档编号
+
+        Args:
+            doc_hash: 文档内容哈希
+
+        Returns:
+            文档编号，索引中没有该内容时返回None
+        """
+        if self._hash_index is None:
+            self._hash_index = {h: num for num, h in enumerate(self.doc_hashes) if h is not None}
+        return self._hash_index.get(doc_hash)
+
+    def document_terms(self, doc_num: int) -> List[str]:
+        """文档包含的词项（去重，取自正排列表，无需重新分词）"""
+        return [self.terms[term_id] for term_id in self.doc_terms[doc_num]]
+
+    def count_query_terms(self, query_terms: Iterable[str], doc_nums: np.ndarray) -> np.ndarray:
+        """
+        批量统计每个文档包含多少个不同的查询词（在倒排列表中二分查找，不访问文档内容）
+
+        Args:
+            query_terms: 查询词项
+            doc_nums: 文档编号数组
+
+        Returns:
+            与doc_nums一一对应的命中词数
+        """
+        doc_nums = np.asarray(doc_nums, dtype=np.intc)
+        hits = np.zeros(len(doc_nums), dtype=np.int64)
+        for term in set(query_terms):
+            term_id = self.term_index.get(term)
+            if term_id is None:
+                continue
+            docs = np.frombuffer(self.postings_docs[term_id], dtype=np.intc)
+            if len(docs) == 0:
+                continue
+            pos = np.minimum(np.searchsorted(docs, doc_nums), len(docs) - 1)
+            hits += docs[pos] == doc_nums
+        return hits
+
+    # === 打分 ===
+
+    def _query_term_ids(self, query_terms: List[str]) -> List[Tuple[int, int]]:
+        """
+        将查询词映射为(词项编号, 出现次数)，丢弃索引中不存在的词
+        """
+        term_counts = Counter(query_terms)
+        return [(self.term_index[t], c) for t, c in term_counts.items() if t in self.term_index]
+
+    def score_all(self, query_terms: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        一次遍历倒排列表，为所有命中任一查询词的文档打分
+
+        Args:
+            query_terms: 查询词项列表
+
+        Returns:
+            (稠密得分数组, 命中掩码)，按文档编号索引（含已删除文档的空位）
+        """
+        scores = np.zeros(len(self.doc_ids), dtype=np.float64)
+        matched = np.zeros(len(self.doc_ids), dtype=bool)
+
+        term_ids = self._query_term_ids(query_terms)
+        if not term_ids:
+            return scores, matched
+        if self._idf is None:
+            self._refresh()
+
+        for term_id, count in term_ids:
+            docs = np.frombuffer(self.postings_docs[term_id], dtype=np.intc)
+            tfs = np.frombuffer(self.postings_tfs[term_id], dtype=np.intc).astype(np.float64)
+            contrib = self._idf[term_id] * (tfs * (self.k1 + 1) / (tfs + self._norms[docs]))
+            scores[docs] += count * contrib
+            matched[docs] = True
+
+        return scores, matched
+
+    def score_documents(self, query_terms: List[str], doc_ids: List[Optional[str]]) -> List[float]:
+        """
+        批量计算指定文档的BM25得分（只遍历一次倒排列表）
+
+        Args:
+            query_terms: 查询词项列表
+            doc_ids: 文档ID列表，None或未知ID得0分
+
+        Returns:
+            与doc_ids一一对应的得分列表
+        """
+        scores, _ = self.score_all(query_terms)
+        results = []
+        for doc_id in doc_ids:
+            doc_num = self.doc_index.get(doc_id) if doc_id is not None else None
+            results.append(float(scores[doc_num]) if doc_num is not None else 0.0)
+        return results
+
+    def score_document(self, query_terms: List[str], doc_id: str) -> float:
+        """
+        计算单个文档的BM25得分（二分查找倒排列表，不做全量打分）
+        """
+        doc_num = self.doc_index.get(doc_id)
+        if doc_num is None or self.doc_lengths[doc_num] == 0:
+            return 0.0
+        if self._idf is None:
+            self._refresh()
+
+        score = 0.0
+        for term_id, count in self._query_term_ids(query_terms):
+            docs = self.postings_docs[term_id]
+            pos = bisect_left(docs, doc_num)
+            if pos < len(docs) and docs[pos] == doc_num:
+                tf = self.postings_tfs[term_id][pos]
+                score += count * self._idf[term_id] * (tf * (self.k1 + 1) / (tf + self._norms[doc_num]))
+        return float(score)
+
+    def _term_contributions(self, 
+                            term_id: int, 
+                            doc_nums: Optional[np.ndarray] = None,
+                            member: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        词项在倒排列表中各文档上的得分贡献（未乘查询词次数）
+
+        Args:
+            term_id: 词项编号
+            doc_nums: 可选，只计算这些文档（升序）；为None时计算整个倒排列表
+            member: 可选，doc_nums对应的稠密掩码；doc_nums较多时用掩码过滤倒排列表代替二分查找
+
+        Returns:
+            (文档编号数组, 得分贡献数组)
+        """
+        docs = np.frombuffer(self.postings_docs[term_id], dtype=np.intc)
+        tfs = np.frombuffer(self.postings_tfs[term_id], dtype=np.intc)
+        if doc_nums is not None:
+            if len(docs) == 0 or len(doc_nums) == 0:
+                return doc_nums[:0], np.zeros(0)
+            if member is not None and len(doc_nums) * 8 > len(docs):
+                hit = member[docs]
+                docs, tfs = docs[hit], tfs[hit]
+            else:
+                pos = np.minimum(np.searchsorted(docs, doc_nums), len(docs) - 1)
+                hit = docs[pos] == doc_nums
+                docs, tfs = doc_nums[hit], tfs[pos[hit]]
+        tfs = tfs.astype(np.float64)
+        # 与score_all中的计算顺序保持一致，保证逐位相同的浮点结果
+        return docs, self._idf[term_id] * (tfs * (self.k1 + 1) / (tfs + self._norms[docs]))
+
+    def _term_bound(self, term_id: int) -> float:
+        """词项单次出现时得分贡献的上界（倒排列表中的最大贡献，索引变化前缓存）"""
+        bound = self._term_bounds.get(term_id)
+        if bound is None:
+            _, contrib = self._term_contributions(term_id)
+            bound = float(contrib.max()) if len(contrib) else 0.0
+            self._term_bounds[term_id] = bound
+        return bound
+
+    def _rank(self, scores: np.ndarray, candidates: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        """
+        从候选文档中取得分最高的k个
+
+        Args:
+            scores: 按文档编号索引的得分
+            candidates: 候选文档编号
+            k: 返回数量
+
+        Returns:
+            [(doc_id, score)]，按得分降序（同分按文档编号升序）
+        """
+        if len(candidates) > k:
+            part = np.argpartition(-scores[candidates], k - 1)[:k]
+            kth = scores[candidates[part]].min()
+            # 补齐与第k名同分的文档，保证同分时的排序稳定
+            candidates = candidates[scores[candidates] >= kth]
+
+        order = np.lexsort((candidates, -scores[candidates]))[:k]
+        return [(self.doc_ids[n], float(scores[n])) for n in candidates[order]]
+
+    def top_k_exhaustive(self, 
+                         query_terms: List[str], 
+                         k: int = 10, 
+                         allowed: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        全量打分后检索得分最高的k个文档（遍历全部倒排列表，作为top_k的对照实现）
+
+        Args:
+            query_terms: 查询词项列表
+            k: 返回数量
+            allowed: 可选，按文档编号的布尔掩码，只返回掩码为True的文档
+
+        Returns:
+            [(doc_id, score)]，按得分降序（同分按文档编号升序）
+        """
+        scores, matched = self.score_all(query_terms)
+        if allowed is not None:
+            matched &= allowed
+        candidates = np.flatnonzero(matched)
+        if k <= 0 or len(candidates) == 0:
+            return []
+        return self._rank(scores, candidates, k)
+
+    def _top_k_within(self, 
+                      term_ids: List[Tuple[int, int]], 
+                      rows: np.ndarray, 
+                      member: np.ndarray, 
+                      k: int) -> List[Tuple[str, float]]:
+        """
+        只在给定文档上全量打分取top-k（每个词项在倒排列表中二分查找这些文档，长倒排列表改用掩码过滤）
+
+        Args:
+            term_ids: [(词项编号, 出现次数)]
+            rows: 文档编号（升序）
+            member: rows对应的稠密掩码
+            k: 返回数量
+
+        Returns:
+            [(doc_id, score)]，按得分降序（同分按文档编号升序）
+        """
+        scores = np.zeros(len(rows), dtype=np.float64)
+        matched = np.zeros(len(rows), dtype=bool)
+        for term_id, count in term_ids:
+            docs, contrib = self._term_contributions(term_id, rows, member)
+            positions = np.searchsorted(rows, docs)
+            # 与score_all相同的累加顺序，得分逐位一致
+            scores[positions] += count * contrib
+            matched[positions] = True
+
+        hits = np.flatnonzero(matched)
+        order = np.lexsort((rows[hits], -scores[hits]))[:k]
+        return [(self.doc_ids[rows[i]], float(scores[i])) for i in hits[order]]
+
+    def top_k(self, 
+              query_terms: List[str], 
+              k: int = 10, 
+              allowed: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        检索BM25得分最高的k个文档（MaxScore动态剪枝，结果与全量打分完全一致）
+
+        查询词按得分上界从高到低处理。当剩余词项的上界之和低于当前第k名的得分下界时，
+        未出现过的文档不可能进入前k名，剩余词项（通常是倒排列表很长的高频词）
+        只在候选文档上二分查找，不再遍历整个倒排列表；最后按原始词序重新计算候选文档得分。
+        指定allowed时只在满足过滤条件的文档上打分：文档较少时直接逐词二分查找全量打分，
+        否则以这些文档为初始候选做剪枝
+
+        Args:
+            query_terms: 查询词项列表
+            k: 返回数量
+            allowed: 可选，按文档编号的布尔掩码（元数据过滤），只返回掩码为True的文档
+
+        Returns:
+            [(doc_id, score)]，按得分降序（同分按文档编号升序）
+        """
+        term_ids = self._query_term_ids(query_terms)
+        if k <= 0 or not term_ids:
+            return []
+        if self._idf is None:
+            self._refresh()
+        if allowed is not None:
+            # 与倒排列表相同的整数类型，二分查找时不再转换整个倒排列表
+            rows = np.flatnonzero(allowed).astype(np.intc)
+            if len(rows) <= FILTERED_EXACT_FRACTION * len(self.doc_ids):
+                return self._top_k_within(term_ids, rows, allowed, k)
+        if (len(term_ids) == 1 and allowed is None) or any(self._idf[term_id] <= 0 for term_id, _ in term_ids):
+            # 单个词项无可剪枝；存在非正IDF时部分得分不再是下界，退回全量打分
+            return self.top_k_exhaustive(query_terms, k, allowed)
+
+        bounds = {term_id: count * self._term_bound(term_id) for term_id, count in term_ids}
+        ordered = sorted(term_ids, key=lambda item: -bounds[item[0]])
+        # remaining[i]: 第i个及之后词项的上界之和
+        remaining = [0.0] * (len(ordered) + 1)
+        for i in range(len(ordered) - 1, -1, -1):
+            remaining[i] = remaining[i + 1] + bounds[ordered[i][0]]
+
+        # IDF均为正，得分贡献均为正，部分得分非零即表示文档已命中
+        partial = np.zeros(len(self.doc_ids), dtype=np.float64)
+        if allowed is None:
+            member = np.zeros(len(self.doc_ids), dtype=bool)
+            candidates = None
+        else:
+            member = allowed.copy()
+            candidates = np.flatnonzero(allowed)
+        for i, (term_id, count) in enumerate(ordered):
+            if candidates is None:
+                # 必要词项：遍历整个倒排列表
+                docs, contrib = self._term_contributions(term_id)
+                partial[docs] += count * contrib
+                touched = partial[docs]
+            else:
+                # 非必要词项：只查找仍有可能进入前k名的候选文档
+                docs, contrib = self._term_contributions(term_id, candidates, member)
+                partial[docs] += count * contrib
+                touched = partial[candidates]
+            if len(touched) < k or (candidates is None and remaining[i + 1] >= touched.max()):
+                # 阈值不会超过最高部分得分，剩余上界仍不低于它时无法剪枝
+                continue
+
+            # 部分得分是最终得分的下界，任意k个文档中最低的部分得分都可作为剪枝阈值
+            threshold = np.partition(touched, len(touched) - k)[len(touched) - k]
+            # 留出浮点误差余量，避免因求和顺序不同误删同分文档
+            cutoff = threshold - remaining[i + 1] - 1e-9 * max(1.0, abs(threshold))
+            if candidates is None:
+                if cutoff <= 0:
+                    continue
+                candidates = np.flatnonzero(partial >= cutoff)
+            else:
+                member[candidates] = False
+                candidates = candidates[touched >= cutoff]
+            member[candidates] = True
+
+        if candidates is None:
+            candidates = np.flatnonzero(partial > 0)
+        else:
+            candidates = candidates[partial[candidates] > 0]
+        if len(candidates) == 0:
+            return []
+        if len(candidates) > k:
+            # 此时部分得分即完整得分（仅求和顺序不同），只需重算第k名附近的文档
+            final = partial[candidates]
+            kth = np.partition(final, len(final) - k)[len(final) - k]
+            candidates = candidates[final >= kth - 1e-9 * max(1.0, abs(kth))]
+
+        # 按原始词序重新计算候选文档得分，与全量打分逐位一致
+        scores = np.zeros(len(self.doc_ids), dtype=np.float64)
+        for term_id, count in term_ids:
+            docs, contrib = self._term_contributions(term_id, candidates)
+            scores[docs] += count * contrib
+        return self._rank(scores, candidates, k)
+
+    # === 快照持久化 ===
+
+    def save(self, path: str, fingerprint: str):
+        """
+        将索引统计信息序列化为可内存映射的快照文件
+
+        文件布局：魔数 | 版本 | 头部长度 | JSON头部 | 按8字节对齐的二进制数据段
+        二进制数据段：文档长度(int32)、倒排偏移(int64)、倒排文档编号(int32)、倒排词频(int32)、
+        正排偏移(int64)、正排词项编号(int32)
+
+        保存前会先压缩索引并释放原有内存映射，因此可以覆盖当前加载的快照文件；
+        快照已包含全部变化，原有的增量日志在替换快照前删除
+
+        Args:
+            path: 快照文件路径
+            fingerprint: 集合指纹，加载时用于判断快照是否过期
+        """
+        if self._tombstones or self._mmap is not None:
+            self.compact()
+
+        sections = [
+            ('doc_lengths', np.frombuffer(self.doc_lengths, dtype=np.intc).astype('<i4').tobytes()),
+            ('postings_offsets', self._segment_offsets(self.postings_docs)),
+            ('postings_docs', self._segment_bytes(self.postings_docs)),
+            ('postings_tfs', self._segment_bytes(self.postings_tfs)),
+            ('doc_terms_offsets', self._segment_offsets(self.doc_terms)),
+            ('doc_terms', self._segment_bytes(self.doc_terms)),
+            ('doc_ids', json.dumps(self.doc_ids, ensure_ascii=False).encode('utf-8')),
+            ('doc_hashes', json.dumps(self.doc_hashes).encode('utf-8')),
+            ('terms', json.dumps(self.terms, ensure_ascii=False).encode('utf-8')),
+        ]
+
+        layout = {}
+        position = 0
+        for name, data in sections:
+            layout[name] = [position, len(data)]
+            position += len(data) + (-len(data)) % _SNAPSHOT_ALIGN
+
+        header = json.dumps({
+            'fingerprint': fingerprint,
+            'doc_count': self.doc_count,
+            'term_count': len(self.terms),
+            'total_length': self.total_length,
+            'avg_doc_length': self.avg_doc_length,
+            'sections': layout
+        }, ensure_ascii=False).encode('utf-8')
+        header += b' ' * ((-(len(SNAPSHOT_MAGIC) + 8 + len(header))) % _SNAPSHOT_ALIGN)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(struct.pack('<II', SNAPSHOT_VERSION, len(header)))
+            f.write(header)
+            for _, data in sections:
+                f.write(data)
+                f.write(b'\x00' * ((-len(data)) % _SNAPSHOT_ALIGN))
+        # 先删日志再替换：中途失败时旧快照缺少日志中的变化，指纹不符而重建，不会重放到新快照上
+        delta_path = get_delta_path(path)
+        if os.path.exists(delta_path):
+            os.remove(delta_path)
+        os.replace(tmp_path, path)
+        self.fingerprint = fingerprint
+        self._journal = []
+
+    def save_changes(self, path: str, fingerprint: str) -> bool:
+        """
+        持久化自上次保存或加载快照以来的增量变化：作为一行记录追加到快照的增量日志，只写入变化的文档；
+        快照不存在、索引没有对应的快照或日志超过快照大小的DELTA_COMPACT_RATIO时改为整体保存
+
+        Args:
+            path: 快照文件路径
+            fingerprint: 变化后的集合指纹
+
+        Returns:
+            是否整体保存了快照
+        """
+        if self._journal is None or self.fingerprint is None or not os.path.exists(path):
+            self.save(path, fingerprint)
+            return True
+        if not self._journal and fingerprint == self.fingerprint:
+            return False
+
+        delta_path = get_delta_path(path)
+        record = {'base': self.fingerprint, 'fingerprint': fingerprint, 'changes': self._journal}
+        with open(delta_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.fingerprint = fingerprint
+        self._journal = []
+
+        if os.path.getsize(delta_path) > DELTA_COMPACT_RATIO * os.path.getsize(path):
+            self.save(path, fingerprint)
+            return True
+        return False
+
+    def _replay_delta(self, delta_path: str) -> int:
+        """
+        按顺序重放增量日志：每条记录的base须与当前指纹一致，遇到不衔接或不完整的记录即停止
+
+        Returns:
+            重放的记录数
+        """
+        if not os.path.exists(delta_path):
+            return 0
+        replayed = 0
+        with open(delta_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if record.get('base') != self.fingerprint:
+                    break
+                try:
+                    for change in record['changes']:
+                        if change[0] == 'del':
+                            self.remove_document(change[1])
+                        elif change[0] == 'add':
+                            self._upsert_counts(*change[1:])
+                        elif change[0] == 'ren':
+                            self.rename_documents(change[1])
+                except (KeyError, IndexError, TypeError, ValueError) as e:
+                    # 指纹不再前进，调用方按指纹不符处理
+                    print(f"⚠️ 增量日志记录格式不正确: {e}")
+                    break
+                self.fingerprint = record['fingerprint']
+                replayed += 1
+        return replayed
+
+    @staticmethod
+    def _segment_offsets(segments) -> bytes:
+        """分段数组的起始偏移（int64）"""
+        offsets = np.zeros(len(segments) + 1, dtype='<i8')
+        offsets[1:] = np.cumsum([len(segment) for segment in segments])
+        return offsets.tobytes()
+
+    @staticmethod
+    def _segment_bytes(segments) -> bytes:
+        """分段数组拼接后的数据（int32）"""
+        return b''.join(np.asarray(segment, dtype='<i4').tobytes() for segment in segments)
+
+    @classmethod
+    def load(cls, 
+             path: str, 
+             fingerprint: Optional[str] = None,
+             k1: float = 1.5, 
+             b: float = 0.75) -> Optional['BM25Index']:
+        """
+        以内存映射方式加载快照，倒排列表不复制到内存；随后重放快照的增量日志（只复制被修改的倒排列表）
+
+        Args:
+            path: 快照文件路径
+            fingerprint: 期望的集合指纹，不一致时视为过期
+            k1: BM25参数k1
+            b: BM25参数b
+
+        Returns:
+            索引实例；文件不存在、版本不符或指纹过期时返回None
+        """
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            prefix_size = len(SNAPSHOT_MAGIC) + 8
+            if mm[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise ValueError("快照文件格式不正确")
+            version, header_size = struct.unpack('<II', mm[len(SNAPSHOT_MAGIC):prefix_size])
+            if version != SNAPSHOT_VERSION:
+                print(f"BM25快照版本不匹配({version} != {SNAPSHOT_VERSION})，需要重建")
+                mm.close()
+                return None
+
+            header = json.loads(mm[prefix_size:prefix_size + header_size].decode('utf-8'))
+            delta_path = get_delta_path(path)
+            if fingerprint is not None and header['fingerprint'] != fingerprint and not os.path.exists(delta_path):
+                print("BM25快照与当前集合不一致，需要重建")
+                mm.close()
+                return None
+
+            base = prefix_size + header_size
+            view = memoryview(mm)
+
+            def section(name: str) -> memoryview:
+                start, size = header['sections'][name]
+                return view[base + start:base + start + size]
+
+            index = cls(k1=k1, b=b)
+            index.doc_ids = json.loads(bytes(section('doc_ids')).decode('utf-8'))
+            index.doc_index = {doc_id: i for i, doc_id in enumerate(index.doc_ids)}
+            index.terms = json.loads(bytes(section('terms')).decode('utf-8'))
+            index.term_index = {term: i for i, term in enumerate(index.terms)}
+            index.doc_lengths = array('i', np.frombuffer(section('doc_lengths'), dtype='<i4').astype(np.intc).tobytes())
+            index.doc_hashes = json.loads(bytes(section('doc_hashes')).decode('utf-8'))
+            index.total_length = header['total_length']
+
+            offsets = section('postings_offsets').cast('q')
+            index.postings_docs = _MappedPostings(offsets, section('postings_docs').cast('i'))
+            index.postings_tfs = _MappedPostings(offsets, section('postings_tfs').cast('i'))
+            index.doc_terms = _MappedPostings(section('doc_terms_offsets').cast('q'), section('doc_terms').cast('i'))
+            index._mmap = mm
+            index.fingerprint = header['fingerprint']
+
+            replayed = index._replay_delta(delta_path)
+            if fingerprint is not None and index.fingerprint != fingerprint:
+                print("BM25快照与当前集合不一致，需要重建")
+                index.close()
+                return None
+            if replayed:
+                print(f"已重放{replayed}条增量日志记录: {delta_path}")
+            index._journal = []
+            return index
+
+        except Exception:
+            mm.close()
+            raise
+
+    def close(self):
+        """释放快照的内存映射"""
+        if self._mmap is not None:
+            self.postings_docs = []
+            self.postings_tfs = []
+            self.doc_terms = []
+            try:
+                self._mmap.close()
+            except BufferError:
+                # 仍有外部引用的切片，交由垃圾回收释放
+                pass
+            self._mmap = None
+
+    # === 兼容旧接口：doc_id -> Counter ===
+
+    def term_frequencies(self, doc_id: str) -> Counter:
+        """
+        还原单个文档的词频（按正排列表在各倒排列表中二分查找）
+        """
+        doc_num = self.doc_index[doc_id]
+        freqs = Counter()
+        for term_id in self.doc_terms[doc_num]:
+            pos = bisect_left(self.postings_docs[term_id], doc_num)
+            freqs[self.terms[term_id]] = self.postings_tfs[term_id][pos]
+        return freqs
+
+    def __getitem__(self, doc_id: str) -> Counter:
+        return self.term_frequencies(doc_id)
+
+    def __iter__(self):
+        return (doc_id for doc_id in self.doc_ids if doc_id is not None)
+
+    def __len__(self) -> int:
+        return self.doc_count
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self.doc_index
+
+    def __bool__(self) -> bool:
+        return self.doc_count > 0
+
+
+def update_snapshot(path: str,
+                    entries: Dict[str, Optional[Dict[str, Any]]],
+                    upserts: Iterable[Tuple[str, str, Dict[str, Any]]] = (),
+                    deletions: Iterable[str] = (),
+                    renames: Optional[Dict[str, str]] = None) -> bool:
+    """
+    将集合的增量变化应用到磁盘上的BM25快照及字符n-gram快照（只对变化的文档分词，变化追加到增量日志）
+
+    供入库、清理等不常驻BM25索引的脚本使用：快照中的指纹按受影响文档增量更新，
+    快照与变化前的集合不一致时更新后的指纹仍与集合不符，由搜索系统下次启动时检测并重建
+
+    Args:
+        path: BM25快照文件路径
+        entries: 变化前受影响文档（删除、重命名及写入的文档中原已存在的）的 {doc_id: metadata}，
+                 用于更新指纹；也可以传入集合中的全部文档
+        upserts: 新增或更新的文档 (doc_id, content, metadata)
+        deletions: 删除的文档ID
+        renames: 可选，{旧ID: 新ID}
+
+    Returns:
+        BM25快照是否已更新
+    """
+    if not path:
+        return False
+
+    upserts = list(upserts)
+    deletions = list(deletions)
+    changes = _entry_changes(entries, upserts, deletions, renames)
+    updated = _update_snapshot_file(path, "BM25", tokenize, TOKENIZER_VERSION, changes, upserts, deletions, renames)
+    _update_snapshot_file(get_ngram_snapshot_path(path), "n-gram", char_ngrams, NGRAM_VERSION, changes, upserts, deletions, renames)
+    return updated
+
+
+def _entry_changes(entries: Dict[str, Optional[Dict[str, Any]]],
+                   upserts: List[Tuple[str, str, Dict[str, Any]]],
+                   deletions: List[str],
+                   renames: Optional[Dict[str, str]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    受影响文档变化前后的 {doc_id: metadata}（变化前不存在或变化后被删除的文档不出现在对应的字典中）
+    """
+    renames = renames or {}
+    affected = set(deletions) | set(renames) | set(renames.values()) | {doc_id for doc_id, _, _ in upserts}
+    before = {doc_id: entries[doc_id] for doc_id in affected if doc_id in entries}
+    after = dict(before)
+    for doc_id in deletions:
+        after.pop(doc_id, None)
+    if renames:
+        after = {renames.get(doc_id, doc_id): metadata for doc_id, metadata in after.items()}
+    for doc_id, _, metadata in upserts:
+        after[doc_id] = metadata
+    return before, after
+
+
+def _update_snapshot_file(path: str,
+                          label: str,
+                          tokenizer,
+                          tokenizer_version: str,
+                          changes: Tuple[Dict[str, Any], Dict[str, Any]],
+                          upserts: List[Tuple[str, str, Dict[str, Any]]],
+                          deletions: List[str],
+                          renames: Optional[Dict[str, str]]) -> bool:
+    """
+    增量更新单个快照文件（changes为_entry_changes的结果，其余参数含义同update_snapshot）
+    """
+    if not os.path.exists(path):
+        return False
+
+    try:
+        index = BM25Index.load(path)
+        if index is None:
+            return False
+        fingerprint = CollectionFingerprint.parse(index.fingerprint, tokenizer_version)
+        if fingerprint is None:
+            print(f"⚠️ {label}快照的指纹版本不符，保持原样")
+            index.close()
+            return False
+
+        before, after = changes
+        for doc_id, metadata in before.items():
+            fingerprint.remove(doc_id, metadata)
+        for doc_id, metadata in after.items():
+            fingerprint.add(doc_id, metadata)
+
+        for doc_id in deletions:
+            index.remove_document(str(doc_id).strip())
+        if renames:
+            index.rename_documents({str(old).strip(): str(new).strip() for old, new in renames.items()})
+        changed = 0
+        for doc_id, content, metadata in upserts:
+            if index.add_document(str(doc_id).strip(), tokenizer(content or ''), content_hash(content)):
+                changed += 1
+
+        rewritten = index.save_changes(path, fingerprint.hexdigest(tokenizer_version))
+        index.close()
+        print(f"💾 {label}快照已增量更新{'（已整体重写）' if rewritten else ''}：新增/更新{changed}个，删除{len(deletions)}个，重命名{len(renames or {})}个")
+        return True
+
+    except Exception as e:
+        print(f"⚠️ {label}快照增量更新失败: {e}")
+        return False
+
+
+def remove_snapshot(path: str) -> bool:
+    """
+    删除BM25快照及对应的字符n-gram快照（含增量日志，整个集合被删除或重建时调用）
+
+    Returns:
+        是否删除了BM25快照文件
+    """
+    if not path:
+        return False
+
+    removed = False
+    for snapshot_path in (path, get_ngram_snapshot_path(path)):
+        delta_path = get_delta_path(snapshot_path)
+        if os.path.exists(delta_path):
+            os.remove(delta_path)
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+            print(f"🗑️ 已删除快照: {snapshot_path}")
+            removed = removed or snapshot_path == path
+    return removed
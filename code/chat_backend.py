@@ -5,14 +5,20 @@ QA系统聊天后端服务
 基于FastAPI + DeepSeek + ChromaDB
 """
 
+import os
 import uuid
 import json
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 from pathlib import Path
 
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import chromadb
@@ -26,6 +32,7 @@ from health_check import generate_health_report
 # 导入搜索系统
 from search_interface import SearchInterface
 from dimension_analyzer import DimensionAnalyzer
+from query_classifier import QueryDimensionClassifier
 from multi_stage_query import MultiStageQuerySystem
 from context_manager import ContextManager
 
@@ -250,7 +257,14 @@ deepseek_client = DeepSeekClient(deepseek_config)
 search_interface = SearchInterface(config_name="balanced")
 
 # 初始化多阶段查询系统
-dimension_analyzer = DimensionAnalyzer(deepseek_client)
+# 维度分析先用本地分类器（有训练好的权重时加载），置信度不足时才调用DeepSeek；DeepSeek的分析结果记录下来用于继续训练
+DIMENSION_CLASSIFIER_PATH = os.getenv('DIMENSION_CLASSIFIER_PATH', os.path.join(os.path.dirname(__file__), 'dimension_classifier.npz'))
+DIMENSION_ANALYSIS_LOG = os.getenv('DIMENSION_ANALYSIS_LOG', os.path.join(os.path.dirname(__file__), 'dimension_analysis_log.jsonl'))
+dimension_analyzer = DimensionAnalyzer(
+    deepseek_client,
+    classifier=QueryDimensionClassifier.load(DIMENSION_CLASSIFIER_PATH),
+    analysis_log_path=DIMENSION_ANALYSIS_LOG
+)
 # 获取vectorizer实例用于关键词搜索
 vectorizer = None
 search_initialized = False
@@ -265,9 +279,19 @@ except Exception as e:
     print(f"❌ 搜索系统初始化异常: {e}")
     search_initialized = False
 
-multi_stage_query = MultiStageQuerySystem(search_interface, vectorizer)
+# 与chat接口共用同一个维度分析器（及其DeepSeek客户端），每轮对话至多一次维度分析调用
+multi_stage_query = MultiStageQuerySystem(search_interface, vectorizer, dimension_analyzer)
 # 延迟初始化context_manager，因为需要等search_interface初始化完成
 context_manager = None
+_components_lock = threading.Lock()
+
+# 聊天流水线的线程池：检索（分词、向量编码、ChromaDB读写）受CPU限制，线程数与核数相当；
+# 大模型调用主要在等待网络，线程数可以多一些。两者分开，慢的模型调用不会占满检索线程，
+# 事件循环也不再被阻塞，/health、/sessions 等接口不会排在聊天请求后面
+RETRIEVAL_WORKERS = int(os.getenv('CHAT_RETRIEVAL_WORKERS', str(min(4, os.cpu_count() or 1))))
+LLM_WORKERS = int(os.getenv('CHAT_LLM_WORKERS', '16'))
+retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="chat-retrieval")
+llm_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="chat-llm")
 
 @app.get("/")
 async def root():
@@ -281,7 +305,8 @@ async def health_check():
         global search_interface, deepseek_client
         
         # 生成健康检查报告
-        report = generate_health_report(
+        report = await run_in_threadpool(
+            generate_health_report,
             search_interface=search_interface,
             deepseek_client=deepseek_client,
             config=search_interface.config if search_interface else None
@@ -309,21 +334,44 @@ async def health_check():
             status_code=500
         )
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatMessage):
+@app.get("/ready")
+async def readiness_check():
+    """就绪检查端点：模型加载并预热完成后返回200，否则返回503（负载均衡据此决定是否转发流量）"""
+    global search_interface
+    try:
+        readiness = search_interface.get_readiness()
+        readiness['timestamp'] = datetime.now().isoformat()
+        return JSONResponse(
+            content=readiness,
+            status_code=200 if readiness['ready'] else 503
+        )
+    except Exception as e:
+        return JSONResponse(
+            content={
+                'timestamp': datetime.now().isoformat(),
+                'ready': False,
+                'error': f'就绪检查失败: {str(e)}'
+            },
+            status_code=503
+        )
+
+async def _run_in(executor: ThreadPoolExecutor, func, *args, **kwargs):
+    """在指定线程池中执行同步函数并等待结果（不阻塞事件循环）"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+def _ensure_chat_components():
     """
-    发送消息并获取AI回复
-    
-    Args:
-        request: 聊天请求
-    
-    Returns:
-        AI回复
+    检查搜索系统、向量化器和上下文管理器，必要时（重新）初始化
+
+    Raises:
+        HTTPException: 组件不可用
     """
-    try:
-        # 检查关键组件初始化状态
-        global search_interface, context_manager, vectorizer, search_initialized
-        
+    # 检查关键组件初始化状态
+    global search_interface, context_manager, vectorizer, search_initialized
+
+    # 多个会话并发时只由一个线程执行初始化
+    with _components_lock:
         if not search_initialized or not search_interface.initialized:
             print("⚠️ 搜索系统未正确初始化，尝试重新初始化...")
             try:
@@ -333,61 +381,30 @@ async def chat(request: ChatMessage):
                     print("✅ 搜索系统重新初始化成功")
                 else:
                     raise HTTPException(
-                        status_code=500, 
+                        status_code=500,
                         detail="搜索系统初始化失败，无法提供服务"
                     )
             except Exception as e:
                 print(f"❌ 搜索系统重新初始化失败: {e}")
                 raise HTTPException(
-                    status_code=500, 
+                    status_code=500,
                     detail=f"搜索系统不可用: {str(e)}"
                 )
-        
+
         if vectorizer is None:
             print("❌ 向量化器未初始化")
             raise HTTPException(
-                status_code=500, 
+                status_code=500,
                 detail="向量化器不可用"
             )
-        
-        # 生成或使用现有会话ID
-        session_id = request.session_id or str(uuid.uuid4())
-        user_message_id = str(uuid.uuid4())
-        ai_message_id = str(uuid.uuid4())
-        
-        # 获取会话历史用于上下文
-        history = storage.get_session_history(session_id)
-        
-        # 构建对话上下文
-        conversation_history = []
-        for msg in history[-10:]:  # 只取最近10条消息作为上下文
-            role = "user" if msg["speaker_id"] == "用户" else "assistant"
-            conversation_history.append({
-                "role": role,
-                "content": msg["content"]
-            })
-        
-        # 添加当前用户消息
-        conversation_history.append({
-            "role": "user",
-            "content": request.message
-        })
-        
-        # 使用多阶段查询系统进行智能搜索
-        search_start = datetime.now()
-        
-        # 确保搜索系统已初始化
-        if not search_interface.initialized:
-            search_interface.initialize()
-        
+
         # 延迟初始化context_manager
-        global context_manager
         if context_manager is None:
             try:
                 if search_interface.search_system is None:
                     print("❌ 搜索系统未正确初始化，无法创建上下文管理器")
                     raise HTTPException(
-                        status_code=500, 
+                        status_code=500,
                         detail="搜索系统未正确初始化"
                     )
                 # 直接传递collection给ContextManager
@@ -399,160 +416,351 @@ async def chat(request: ChatMessage):
             except Exception as e:
                 print(f"❌ 上下文管理器初始化失败: {e}")
                 raise HTTPException(
-                    status_code=500, 
+                    status_code=500,
                     detail=f"上下文管理器初始化失败: {str(e)}"
                 )
-        
-        # 构建历史上下文字符串用于多轮检索
-        history_context = ""
-        if len(conversation_history) > 1:  # 有历史对话
-            history_messages = conversation_history[:-1]  # 排除当前消息
-            history_context = "\n".join([
-                f"{msg['role']}: {msg['content']}" 
-                for msg in history_messages[-5:]  # 只取最近5轮对话作为上下文
-            ])
-            print(f"构建的历史上下文: {history_context[:200]}...")  # 打印前200字符用于调试
-        
-        # 1. 维度分析（传递历史上下文）
-        dimension_result = dimension_analyzer.analyze_query_dimensions(
+
+def _load_chat_history(request: ChatMessage) -> Dict[str, Any]:
+    """
+    读取会话历史，生成本轮的会话与消息ID
+
+    Args:
+        request: 聊天请求
+
+    Returns:
+        会话ID、消息ID、历史消息（供大模型多轮对话）和历史上下文字符串（供多轮检索）
+    """
+    # 生成或使用现有会话ID
+    session_id = request.session_id or str(uuid.uuid4())
+
+    # 获取会话历史用于上下文
+    history = storage.get_session_history(session_id)
+
+    # 构建对话上下文
+    history_messages = []
+    for msg in history[-10:]:  # 只取最近10条消息作为上下文
+        role = "user" if msg["speaker_id"] == "用户" else "assistant"
+        history_messages.append({
+            "role": role,
+            "content": msg["content"]
+        })
+
+    # 构建历史上下文字符串用于多轮检索
+    history_context = ""
+    if history_messages:  # 有历史对话
+        history_context = "\n".join([
+            f"{msg['role']}: {msg['content']}"
+            for msg in history_messages[-5:]  # 只取最近5轮对话作为上下文
+        ])
+        print(f"构建的历史上下文: {history_context[:200]}...")  # 打印前200字符用于调试
+
+    return {
+        "session_id": session_id,
+        "user_message_id": str(uuid.uuid4()),
+        "ai_message_id": str(uuid.uuid4()),
+        "message": request.message,
+        "history_messages": history_messages,
+        "history_context": history_context
+    }
+
+def _retrieve_chat_context(request: ChatMessage, history_context: str,
+                           dimension_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    多阶段检索、上下文去重并构建增强的prompt
+
+    Args:
+        request: 聊天请求
+        history_context: 历史上下文字符串
+        dimension_result: 维度分析结果；为None时在大模型线程池中分析，同时预先执行向量和关键词检索
+
+    Returns:
+        增强后的消息及检索统计
+    """
+    # 2. 多阶段搜索（传递历史上下文）
+    if dimension_result is None:
+        search_results = multi_stage_query.speculative_multi_stage_search(
             query=request.message,
-            current_context=history_context
+            current_context=history_context,
+            max_results=5,  # 每个维度获取5个结果
+            executor=llm_executor
         )
-        
-        # 2. 多阶段搜索（传递历史上下文）
+        dimension_result = search_results.get('dimension_analysis', {})
+    else:
         search_results = multi_stage_query.multi_stage_search(
             query=request.message,
             current_context=history_context,
             max_results=5,  # 每个维度获取5个结果
             dimension_analysis=dimension_result
         )
-        
-        # 3. 上下文管理和去重
-        # 从多阶段搜索结果中提取实际的搜索结果列表
-        actual_search_results = search_results.get('results', []) if isinstance(search_results, dict) else search_results
-        print(f"Debug: search_results type: {type(search_results)}")
-        print(f"Debug: actual_search_results type: {type(actual_search_results)}")
-        
-        context_result = context_manager.process_search_results(
-            search_results=actual_search_results,
-            query=request.message,
-            max_context_length=2000  # 限制上下文长度
-        )
-        print(f"Debug: context_result type: {type(context_result)}")
-        print(f"Debug: dimension_result type: {type(dimension_result)}")
-        
-        # 检查context_result是否为字符串
-        if isinstance(context_result, str):
-            print(f"ERROR: context_result is a string: {context_result[:100]}...")
-            # 如果是字符串，创建一个默认的字典结构
-            context_result = {
-                'processed_results': [],
-                'context': '',
-                'stats': {
-                    'original_count': 0,
-                    'deduplicated_count': 0,
-                    'final_count': 0,
-                    'context_length': 0
-                }
+
+    # 3. 上下文管理和去重
+    # 从多阶段搜索结果中提取实际的搜索结果列表
+    actual_search_results = search_results.get('results', []) if isinstance(search_results, dict) else search_results
+    print(f"Debug: search_results type: {type(search_results)}")
+    print(f"Debug: actual_search_results type: {type(actual_search_results)}")
+
+    context_result = context_manager.process_search_results(
+        search_results=actual_search_results,
+        query=request.message,
+        max_context_length=2000  # 限制上下文长度
+    )
+    print(f"Debug: context_result type: {type(context_result)}")
+    print(f"Debug: dimension_result type: {type(dimension_result)}")
+
+    # 检查context_result是否为字符串
+    if isinstance(context_result, str):
+        print(f"ERROR: context_result is a string: {context_result[:100]}...")
+        # 如果是字符串，创建一个默认的字典结构
+        context_result = {
+            'processed_results': [],
+            'context': '',
+            'stats': {
+                'original_count': 0,
+                'deduplicated_count': 0,
+                'final_count': 0,
+                'context_length': 0
             }
-        
-        search_time = (datetime.now() - search_start).total_seconds()
-        
-        # 构建增强的prompt
-        enhanced_message = request.message
-        if isinstance(context_result, dict) and context_result.get('context'):
-            enhanced_message = f"""基于以下相关文档内容回答问题：
+        }
+
+    # 构建增强的prompt
+    enhanced_message = request.message
+    if isinstance(context_result, dict) and context_result.get('context'):
+        enhanced_message = f"""基于以下相关文档内容回答问题：
 
 {context_result['context']}
 
 问题：{request.message}
 
 请根据上述相关内容回答问题。在回答时，如果相关内容不足以回答问题，你可以依照自身理解进行作答，并提供你的一般性建议以及正常回答，一般性建议和正常回答可以尽可能详细丰富。注意，上下文中的标识格式为[文件名-chunk编号 - 来源: 文件名]，请在回答时引用具体的文件名而不是使用"文档1"、"文档2"等通用标识。回答的结果不要包含上下文的json格式，对上下文信息进行总结作答即可。"""
-        
+
+    # 将列表类型转换为字符串以兼容ChromaDB
+    dimensions = dimension_result.get('dimensions', []) if isinstance(dimension_result, dict) else []
+
+    return {
+        "enhanced_message": enhanced_message,
+        "dimensions": dimensions,
+        "dimension_str": json.dumps(dimensions, ensure_ascii=False) if dimensions else "",
+        "search_results_count": context_result.get('stats', {}).get('final_count', 0) if isinstance(context_result, dict) else 0,
+        "search_stages": len([stage for stage in search_results.values() if isinstance(stage, dict) and stage.get('results')]) if isinstance(search_results, dict) else 1,
+        "deduplicated_count": context_result.get('stats', {}).get('deduplicated_count', 0) if isinstance(context_result, dict) else 0
+    }
+
+async def _prepare_chat_turn(request: ChatMessage) -> Dict[str, Any]:
+    """
+    准备一轮对话：检查搜索系统、读取会话历史、维度分析、多阶段检索并构建增强的prompt
+
+    检索和ChromaDB读写在检索线程池中执行，维度分析的大模型调用在大模型线程池中执行，事件循环只负责调度；
+    开启预先检索（config.speculative_retrieval）时维度分析与向量、关键词检索同时进行
+
+    Args:
+        request: 聊天请求
+
+    Returns:
+        本轮对话的上下文（会话与消息ID、历史消息、增强后的消息、检索结果及耗时）
+    """
+    await _run_in(retrieval_executor, _ensure_chat_components)
+    turn = await _run_in(retrieval_executor, _load_chat_history, request)
+
+    # 使用多阶段查询系统进行智能搜索
+    search_start = datetime.now()
+
+    if search_interface.config.speculative_retrieval:
+        # 1+2. 维度分析与预先检索同时进行，分析结果返回后再决定采用哪些检索结果
+        turn.update(await _run_in(
+            retrieval_executor, _retrieve_chat_context, request, turn["history_context"]
+        ))
+    else:
+        # 1. 维度分析（传递历史上下文）
+        dimension_result = await _run_in(
+            llm_executor,
+            dimension_analyzer.analyze_query_dimensions,
+            query=request.message,
+            current_context=turn["history_context"]
+        )
+
+        turn.update(await _run_in(
+            retrieval_executor, _retrieve_chat_context, request, turn["history_context"], dimension_result
+        ))
+    turn["search_time"] = (datetime.now() - search_start).total_seconds()
+    return turn
+
+def _save_chat_turn(turn: Dict[str, Any], ai_response: str, response_time: float, usage_info: Dict[str, Any]):
+    """
+    保存一轮对话的用户消息和AI回复
+
+    Args:
+        turn: _prepare_chat_turn返回的对话上下文
+        ai_response: AI回复
+        response_time: 模型生成耗时（秒）
+        usage_info: token用量
+    """
+    user_metadata = {
+        "model_config": "qa_system",
+        "response_time": response_time,
+        "search_time": turn["search_time"],
+        "search_results_count": turn["search_results_count"],
+        "dimension_analysis": turn["dimension_str"],
+        "search_stages": turn["search_stages"],
+        "deduplicated_count": turn["deduplicated_count"]
+    }
+    storage.save_message(turn["session_id"], turn["user_message_id"], "用户", turn["message"], user_metadata)
+
+    # 保存AI回复 - 展平token_usage字典
+    ai_metadata = dict(user_metadata)
+    ai_metadata.update({
+        "prompt_tokens": usage_info.get("prompt_tokens", 0),
+        "completion_tokens": usage_info.get("completion_tokens", 0),
+        "total_tokens": usage_info.get("total_tokens", 0)
+    })
+    storage.save_message(turn["session_id"], turn["ai_message_id"], "AI助手", ai_response, ai_metadata)
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatMessage):
+    """
+    发送消息并获取AI回复
+
+    Args:
+        request: 聊天请求
+
+    Returns:
+        AI回复
+    """
+    try:
+        turn = await _prepare_chat_turn(request)
+
         # 调用DeepSeek API
         start_time = datetime.now()
-        # 从conversation_history中分离出历史对话和当前消息
-        history_messages = conversation_history[:-1]  # 除了最后一条消息的所有历史
-        current_message = enhanced_message  # 使用增强后的消息
-        
+
         try:
-            ai_response, updated_conversation = deepseek_client.multi_turn_chat(
-                history_messages, 
-                current_message
+            ai_response, updated_conversation = await _run_in(
+                llm_executor,
+                deepseek_client.multi_turn_chat,
+                turn["history_messages"],
+                turn["enhanced_message"]
             )
         except Exception as e:
             print(f"DeepSeek API调用失败: {e}")
             ai_response = f"抱歉，我暂时无法回答您的问题。错误信息: {str(e)}"
-            # 移除未使用的变量赋值
-        
+
         end_time = datetime.now()
-        
-        # 构建result格式以保持兼容性
-        result = {
-            "content": ai_response,
-            "usage": {}  # 这里可以从deepseek_client获取usage信息
-        }
-        
+
         # 确保ai_response是字符串
         if not isinstance(ai_response, str):
             ai_response = str(ai_response)
         response_time = (end_time - start_time).total_seconds()
-        
+
         if not ai_response:
             raise HTTPException(status_code=500, detail="调用失败")
-        
-        usage_info = result.get("usage", {})
-        
-        # 保存用户消息
-        try:
-            # 将列表类型转换为字符串以兼容ChromaDB
-            dimensions = dimension_result.get('dimensions', []) if isinstance(dimension_result, dict) else []
-            dimension_str = json.dumps(dimensions, ensure_ascii=False) if dimensions else ""
-            
-            user_metadata = {
-                "model_config": "qa_system",
-                "response_time": response_time,
-                "search_time": search_time,
-                "search_results_count": context_result.get('stats', {}).get('final_count', 0) if isinstance(context_result, dict) else 0,
-                "dimension_analysis": dimension_str,
-                "search_stages": len([stage for stage in search_results.values() if isinstance(stage, dict) and stage.get('results')]) if isinstance(search_results, dict) else 1,
-                "deduplicated_count": context_result.get('stats', {}).get('deduplicated_count', 0) if isinstance(context_result, dict) else 0
-            }
-        except Exception as e:
-            print(f"ERROR in user_metadata creation: {e}")
-            print(f"context_result type: {type(context_result)}, value: {context_result}")
-            print(f"dimension_result type: {type(dimension_result)}, value: {dimension_result}")
-            print(f"search_results type: {type(search_results)}, value: {search_results}")
-            raise
-        storage.save_message(session_id, user_message_id, "用户", request.message, user_metadata)
-        
-        # 保存AI回复 - 展平token_usage字典
-        ai_metadata = {
-            "model_config": "qa_system",
-            "response_time": response_time,
-            "search_time": search_time,
-            "search_results_count": context_result.get('stats', {}).get('final_count', 0) if isinstance(context_result, dict) else 0,
-            "dimension_analysis": dimension_str,  # 使用已转换的字符串
-            "search_stages": len([stage for stage in search_results.values() if isinstance(stage, dict) and stage.get('results')]) if isinstance(search_results, dict) else 1,
-            "deduplicated_count": context_result.get('stats', {}).get('deduplicated_count', 0) if isinstance(context_result, dict) else 0,
-            "prompt_tokens": usage_info.get("prompt_tokens", 0),
-            "completion_tokens": usage_info.get("completion_tokens", 0),
-            "total_tokens": usage_info.get("total_tokens", 0)
-        }
-        storage.save_message(session_id, ai_message_id, "AI助手", ai_response, ai_metadata)
-        
+
+        usage_info = {}  # 这里可以从deepseek_client获取usage信息
+        await _run_in(retrieval_executor, _save_chat_turn, turn, ai_response, response_time, usage_info)
+
         return ChatResponse(
             response=ai_response,
-            session_id=session_id,
-            message_id=ai_message_id,
+            session_id=turn["session_id"],
+            message_id=turn["ai_message_id"],
             timestamp=datetime.now().isoformat(),
             usage=usage_info
         )
-        
+
+    except Exception as e:
+        print(f"聊天处理失败: {e}")
+        raise HTTPException(status_code=500, detail="调用失败")
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatMessage):
+    """
+    发送消息并以Server-Sent Events流式返回AI回复
+
+    先发送metadata事件（会话ID、消息ID、检索耗时和结果数），随后逐个发送delta事件（模型生成的文本增量），
+    最后发送done事件（完整耗时和token用量）；模型调用失败时发送error事件。
+    流结束（包括客户端中途断开）后将用户消息和已生成的回复保存到对话存储
+
+    Args:
+        request: 聊天请求
+
+    Returns:
+        text/event-stream 响应
+    """
+    try:
+        turn = await _prepare_chat_turn(request)
     except Exception as e:
         print(f"聊天处理失败: {e}")
         raise HTTPException(status_code=500, detail="调用失败")
 
+    async def event_stream():
+        yield _sse_event("metadata", {
+            "session_id": turn["session_id"],
+            "message_id": turn["ai_message_id"],
+            "search_time": turn["search_time"],
+            "search_results_count": turn["search_results_count"],
+            "dimensions": turn["dimensions"]
+        })
+
+        messages = turn["history_messages"] + [{"role": "user", "content": turn["enhanced_message"]}]
+        chunks = []
+        usage_info = {}
+        start_time = datetime.now()
+        # 流式响应的网络读取在大模型线程池中逐块进行
+        stream = deepseek_client.chat_completion_stream(messages)
+        pending = None
+        saved = False
+        try:
+            try:
+                while True:
+                    pending = llm_executor.submit(next, stream, None)
+                    chunk = await asyncio.wrap_future(pending)
+                    if chunk is None:
+                        break
+                    if chunk.get('usage'):
+                        usage_info = chunk['usage']
+                    if 'choices' in chunk and len(chunk['choices']) > 0:
+                        content = chunk['choices'][0].get('delta', {}).get('content', '')
+                        if content:
+                            chunks.append(content)
+                            yield _sse_event("delta", {"content": content})
+            except Exception as e:
+                print(f"DeepSeek 流式API调用失败: {e}")
+                error_message = f"抱歉，我暂时无法回答您的问题。错误信息: {str(e)}"
+                if not chunks:
+                    chunks.append(error_message)
+                yield _sse_event("error", {"detail": "调用失败", "message": error_message})
+
+            # 与非流式接口一致，没有内容时不保存
+            response_time = (datetime.now() - start_time).total_seconds()
+            if chunks:
+                await _run_in(retrieval_executor, _save_chat_turn, turn, "".join(chunks), response_time, usage_info)
+            saved = True
+
+            yield _sse_event("done", {
+                "message_id": turn["ai_message_id"],
+                "timestamp": datetime.now().isoformat(),
+                "response_time": response_time,
+                "usage": usage_info
+            })
+        finally:
+            # 正在读取的数据块返回后再关闭流（生成器不能在读取线程之外被并发关闭）
+            if pending is not None and not pending.done():
+                pending.add_done_callback(lambda _: stream.close())
+            else:
+                stream.close()
+            # 客户端中途断开时当前任务已被取消，在检索线程池中后台保存已生成的回复
+            if not saved and chunks:
+                retrieval_executor.submit(
+                    _save_chat_turn, turn, "".join(chunks),
+                    (datetime.now() - start_time).total_seconds(), usage_info
+                )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/sessions", response_model=List[SessionInfo])
 async def get_sessions():
     """
@@ -562,7 +770,7 @@ async def get_sessions():
         会话信息列表
     """
     try:
-        sessions = storage.get_all_sessions()
+        sessions = await run_in_threadpool(storage.get_all_sessions)
         return [SessionInfo(**session) for session in sessions]
     except Exception as e:
         print(f"获取会话列表失败: {e}")
@@ -580,7 +788,7 @@ async def get_session_history(session_id: str):
         对话历史
     """
     try:
-        messages = storage.get_session_history(session_id)
+        messages = await run_in_threadpool(storage.get_session_history, session_id)
         conversation_messages = [ConversationMessage(**msg) for msg in messages]
         
         return ConversationHistory(
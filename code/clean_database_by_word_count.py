@@ -11,6 +11,7 @@ import os
 from datetime import datetime
 import json
 import re
+from bm25_index import get_snapshot_path, update_snapshot
 
 def clean_database_by_word_count():
     """
@@ -172,6 +173,15 @@ def clean_database_by_word_count():
                 embeddings=embeddings_to_keep
             )
         
+        # 同步BM25快照：删除的文档移出索引，保留的文档只改ID，无需重新分词
+        kept_ids = set(ids_to_keep)
+        update_snapshot(
+            get_snapshot_path(main_db_path, "qa_system_chunks"),
+            dict(zip(all_results['ids'], all_results['metadatas'])),
+            deletions=[doc_id for doc_id in all_results['ids'] if doc_id not in kept_ids],
+            renames=dict(zip(ids_to_keep, new_ids))
+        )
+        
         # 验证结果
         final_count = new_collection.count()
         print(f"\n✅ 清理完成!")
@@ -8,6 +8,7 @@
 import chromadb
 import os
 from datetime import datetime
+from bm25_index import get_snapshot_path, remove_snapshot
 
 def clean_session_qa_chunks():
     """
@@ -47,6 +48,7 @@ def clean_session_qa_chunks():
                 try:
                     client.delete_collection("qa_system_chunks")
                     print("✅ 成功删除qa_system_chunks集合")
+                    remove_snapshot(get_snapshot_path(session_db_path, "qa_system_chunks"))
                     
                     # 再次检查
                     remaining_collections = client.list_collections()
@@ -63,7 +63,7 @@ def debug_none_id_issue():
         # 3. 测试多阶段查询系统
         print("\n\n3. 测试多阶段查询系统...")
         dimension_analyzer = DimensionAnalyzer()
-        multi_stage_query = MultiStageQuerySystem(search_interface)
+        multi_stage_query = MultiStageQuerySystem(search_interface, dimension_analyzer=dimension_analyzer)
         
         dimension_result = dimension_analyzer.analyze_query_dimensions(test_query)
         multi_stage_result = multi_stage_query.multi_stage_search(
@@ -1,28 +1,53 @@
 # -*- coding: utf-8 -*-
 """
 维度分析器
-使用DeepSeek判断查询是否需要额外搜索以及缺失的维度
+先用本地分类器判断查询是否需要额外搜索以及缺失的维度，置信度不足时使用DeepSeek判断
 """
 
 import json
+import random
 import re
+import threading
+from datetime import datetime
 from typing import Dict, List, Any, Optional
 from deepseek_client import DeepSeekClient
 from deepseek_config_presets import DeepSeekPresets
+from query_classifier import QueryDimensionClassifier, LOCAL_CONFIDENCE_THRESHOLD
+
+# 本地判断置信度足够时，仍按该比例抽样交给DeepSeek复核并记录，使训练记录覆盖本地判断的查询
+LOCAL_AUDIT_RATE = 0.05
 
 class DimensionAnalyzer:
     """
-    维度分析器：使用DeepSeek判断查询的缺失维度
+    维度分析器：本地分类器优先，置信度不足时使用DeepSeek判断查询的缺失维度
     """
     
-    def __init__(self, deepseek_client: DeepSeekClient = None):
+    def __init__(self,
+                 deepseek_client: DeepSeekClient = None,
+                 classifier: Optional[QueryDimensionClassifier] = None,
+                 confidence_threshold: float = LOCAL_CONFIDENCE_THRESHOLD,
+                 analysis_log_path: Optional[str] = None,
+                 audit_rate: float = LOCAL_AUDIT_RATE,
+                 random_seed: Optional[int] = None):
         """
         初始化维度分析器
         
         Args:
             deepseek_client: DeepSeek客户端实例
+            classifier: 本地分类器（None表示使用规则初始权重的分类器）
+            confidence_threshold: 本地判断的置信度阈值，低于该值时调用DeepSeek（大于1表示总是调用DeepSeek）
+            analysis_log_path: DeepSeek分析结果的记录文件（JSONL，用于训练本地分类器），None表示不记录
+            audit_rate: 置信的本地判断抽样交给DeepSeek复核的比例（仅在记录分析结果时生效）
+            random_seed: 抽样的随机种子
         """
         self.deepseek_client = deepseek_client or DeepSeekClient(DeepSeekPresets.get_precise())
+        self.classifier = classifier or QueryDimensionClassifier()
+        self.confidence_threshold = confidence_threshold
+        self.analysis_log_path = analysis_log_path
+        self.audit_rate = audit_rate
+        self._rng = random.Random(random_seed)
+        self._log_lock = threading.Lock()
+        self.stats = {'local': 0, 'llm': 0, 'audit': 0}
         
         # 维度判断的提示词模板
         self.dimension_prompt_template = """
@@ -68,7 +93,38 @@ class DimensionAnalyzer:
         Returns:
             维度分析结果
         """
-        # 首先尝试使用DeepSeek进行分析
+        # 本地分类器置信度足够时直接采用，不调用DeepSeek（按比例抽样复核）
+        local_result = None
+        try:
+            local_result = self.classifier.predict(query, current_context)
+            if local_result["confidence"] >= self.confidence_threshold:
+                if self.analysis_log_path and self._rng.random() < self.audit_rate:
+                    self.stats['audit'] += 1
+                    print(f"抽样复核本地判断: {local_result['missing_dimensions']}（置信度{local_result['confidence']:.2f}）")
+                    return self._deepseek_analysis(query, current_context, local_result)
+                self.stats['local'] += 1
+                print(f"本地分类器判断查询维度: {local_result['missing_dimensions']}（置信度{local_result['confidence']:.2f}）")
+                return local_result
+            print(f"本地分类器置信度{local_result['confidence']:.2f}低于阈值{self.confidence_threshold}，使用DeepSeek分析")
+        except Exception as e:
+            print(f"本地分类器判断失败: {e}，使用DeepSeek分析")
+        
+        self.stats['llm'] += 1
+        return self._deepseek_analysis(query, current_context, local_result)
+    
+    def _deepseek_analysis(self, query: str, current_context: str = None,
+                           local_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        使用DeepSeek分析查询的维度需求（失败时回退到规则分析）
+        
+        Args:
+            query: 用户查询
+            current_context: 当前上下文（可选）
+            local_result: 本地分类器的判断（一并记录，便于对比）
+            
+        Returns:
+            维度分析结果
+        """
         try:
             print(f"使用DeepSeek分析查询维度: {query}")
             
@@ -122,6 +178,7 @@ class DimensionAnalyzer:
                     # 添加兼容性字段
                     result["dimensions"] = result["missing_dimensions"]
                     print("DeepSeek分析成功")
+                    self._log_analysis(query, current_context, result, local_result)
                     return result
                 else:
                     print("DeepSeek结果格式验证失败，使用规则分析")
@@ -142,6 +199,42 @@ class DimensionAnalyzer:
             print(f"DeepSeek分析失败: {e}，回退到规则分析")
             return self._rule_based_analysis(query)
     
+    def _log_analysis(self, query: str, current_context: Optional[str], result: Dict[str, Any],
+                      local_result: Optional[Dict[str, Any]] = None):
+        """
+        追加一条DeepSeek分析记录（供QueryDimensionClassifier.fit_log训练）
+        
+        Args:
+            query: 用户查询
+            current_context: 当前上下文
+            result: 分析结果
+            local_result: 本地分类器的判断
+        """
+        if not self.analysis_log_path:
+            return
+        record = {
+            "timestamp": datetime.now().isoformat(),
+            "query": query,
+            "current_context": current_context or "",
+            "result": {
+                "needs_additional_search": result["needs_additional_search"],
+                "missing_dimensions": result["missing_dimensions"],
+                "confidence": result["confidence"]
+            }
+        }
+        if local_result is not None:
+            record["local"] = {
+                "needs_additional_search": local_result["needs_additional_search"],
+                "missing_dimensions": local_result["missing_dimensions"],
+                "confidence": local_result["confidence"]
+            }
+        try:
+            with self._log_lock:
+                with open(self.analysis_log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"记录维度分析失败: {e}")
+    
     def _rule_based_analysis(self, query: str) -> Dict[str, Any]:
         """
         基于规则的维度分析（作为DeepSeek的回退方案）
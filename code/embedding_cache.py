@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+查询向量缓存
+以规范化后的查询文本为键缓存float32查询向量，按LRU淘汰并设置过期时间；
+同一次对话中重复编码的查询及高频问题直接复用向量，不再调用编码模型
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_query(query_text: str) -> str:
+    """
+    规范化查询文本：去除首尾空白，连续空白合并为一个空格
+
+    Args:
+        query_text: 查询文本
+
+    Returns:
+        规范化后的文本（编码时也使用该文本，保证缓存命中与否结果一致）
+    """
+    return _WHITESPACE_PATTERN.sub(' ', query_text or '').strip()
+
+
+class QueryEmbeddingCache:
+    """
+    有界查询向量缓存（线程安全）
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600):
+        """
+        初始化查询向量缓存
+
+        Args:
+            max_size: 最多缓存的查询数，0表示关闭缓存
+            ttl_seconds: 缓存过期时间（秒），None表示不过期
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: 'OrderedDict[str, Tuple[float, np.ndarray]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        查找缓存的向量并标记为最近使用，已过期的条目会被删除
+
+        Args:
+            key: 规范化后的查询文本
+
+        Returns:
+            只读的float32向量，未命中时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, embedding = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expired += 1
+                return None
+            self._entries.move_to_end(key)
+            return embedding
+
+    def put(self, key: str, embedding) -> np.ndarray:
+        """
+        写入向量并按LRU淘汰
+
+        Args:
+            key: 规范化后的查询文本
+            embedding: 查询向量
+
+        Returns:
+            缓存中保存的只读float32向量
+        """
+        embedding = np.array(embedding, dtype=np.float32).reshape(-1)
+        embedding.setflags(write=False)
+        if self.max_size <= 0:
+            return embedding
+        with self._lock:
+            self._entries[key] = (time.monotonic(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return embedding
+
+    def get_or_encode(self, query_text: str, encoder: Callable[[str], np.ndarray]) -> np.ndarray:
+        """
+        获取查询向量，未命中时调用encoder编码一次
+
+        Args:
+            query_text: 查询文本
+            encoder: 编码函数，输入规范化后的查询文本，返回一维向量
+
+        Returns:
+            只读的float32查询向量
+        """
+        key = normalize_query(query_text)
+        embedding = self.get(key)
+        if embedding is not None:
+            self.hits += 1
+            return embedding
+
+        self.misses += 1
+        return self.put(key, encoder(key))
+
+    def get_or_encode_batch(self, 
+                            query_texts: List[str], 
+                            batch_encoder: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        批量获取查询向量，未命中的查询（去重后）一次性交给batch_encoder编码
+
+        Args:
+            query_texts: 查询文本列表
+            batch_encoder: 批量编码函数，输入规范化后的查询列表，返回(N, 维度)矩阵
+
+        Returns:
+            形状为(N, 维度)的float32向量矩阵，与query_texts一一对应
+        """
+        embeddings: List[Optional[np.ndarray]] = [None] * len(query_texts)
+        pending: Dict[str, List[int]] = {}  # 未命中的规范化查询 -> 在query_texts中的位置
+        for i, query_text in enumerate(query_texts):
+            key = normalize_query(query_text)
+            embedding = self.get(key)
+            if embedding is not None:
+                self.hits += 1
+                embeddings[i] = embedding
+            else:
+                pending.setdefault(key, []).append(i)
+
+        if pending:
+            self.misses += len(pending)
+            keys = list(pending.keys())
+            for key, embedding in zip(keys, batch_encoder(keys)):
+                embedding = self.put(key, embedding)
+                for i in pending[key]:
+                    embeddings[i] = embedding
+
+        if not embeddings:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(embeddings)
+
+    def clear(self):
+        """清空缓存（更换编码模型后调用）"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        获取缓存统计信息
+
+        Returns:
+            命中/未命中/过期次数、命中率及当前缓存大小
+        """
+        total = self.hits + self.misses
+        return {
+            'cached_queries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'hit_rate': self.hits / total if total else 0.0
+        }
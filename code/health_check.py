@@ -91,6 +91,8 @@ def check_search_interface_health(search_interface) -> Dict[str, Any]:
         'initialized': False,
         'vectorizer_available': False,
         'search_system_available': False,
+        'ready': False,
+        'model': None,
         'error': None
     }
     
@@ -98,8 +100,13 @@ def check_search_interface_health(search_interface) -> Dict[str, Any]:
         result['initialized'] = getattr(search_interface, 'initialized', False)
         result['vectorizer_available'] = search_interface.vectorizer is not None
         result['search_system_available'] = search_interface.search_system is not None
+        if hasattr(search_interface, 'get_readiness'):
+            readiness = search_interface.get_readiness()
+            result['ready'] = readiness['ready']
+            result['model'] = readiness['model']
+            result['startup_timings'] = readiness['startup_timings']
         
-        if result['initialized'] and result['vectorizer_available'] and result['search_system_available']:
+        if result['initialized'] and result['vectorizer_available'] and result['search_system_available'] and result['ready']:
             result['status'] = 'healthy'
         else:
             result['status'] = 'degraded'
@@ -110,6 +117,8 @@ def check_search_interface_health(search_interface) -> Dict[str, Any]:
                 issues.append('向量化器不可用')
             if not result['search_system_available']:
                 issues.append('搜索系统不可用')
+            if not result['ready']:
+                issues.append('模型未预热')
             result['error'] = '问题: ' + ', '.join(issues)
         
     except Exception as e:
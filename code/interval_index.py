@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+时间区间索引
+对传统对话文档块的 [start_timestamp, end_timestamp] 建立内存索引，
+支持“与时间窗口有交集”和“完全落在时间窗口内”两种查询，结果按时间排序
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+SUPPORTED_TIME_MODES = ('overlap', 'contained')
+
+
+class TimeIntervalIndex:
+    """
+    按时长分级的有序区间数组
+
+    时长在 [2^(c-1), 2^c) 的区间归入第c级，每级按开始时间排序。
+    与窗口 [s, e] 有交集的区间满足 start <= e 且 end >= s，而同一级区间的开始时间不早于 s - 该级最大时长，
+    因此每级只需二分定位 [s - 最大时长, e] 一段再按结束时间过滤；
+    同一级内互不重叠的区间（同一文件的连续文档块）在窗口前至多多扫描两个，查询为O(级数·log n + k)
+    """
+
+    def __init__(self):
+        self._intervals: Dict[str, Tuple[int, int]] = {}
+        # [(该级最大时长, 开始时间数组, 结束时间数组, ID数组)]，为None表示需要重建
+        self._levels: Optional[List[Tuple[int, np.ndarray, np.ndarray, np.ndarray]]] = None
+
+    # === 构建与维护 ===
+
+    @staticmethod
+    def _interval(metadata: Optional[Dict[str, Any]]) -> Optional[Tuple[int, int]]:
+        """元数据中的时间区间（秒），没有时间戳的文档块（问答对、普通文本）返回None"""
+        if not metadata:
+            return None
+        start, end = metadata.get('start_timestamp'), metadata.get('end_timestamp')
+        if not isinstance(start, (int, float)) or not isinstance(end, (int, float)):
+            return None
+        start, end = int(start), int(end)
+        return (start, end) if end >= start else (end, start)
+
+    def upsert(self, ids: Sequence[str], metadatas: Sequence[Optional[Dict[str, Any]]]) -> int:
+        """
+        新增或更新文档块的时间区间（元数据没有时间戳的文档块会从索引中移除）
+
+        Args:
+            ids: 文档ID
+            metadatas: 元数据
+
+        Returns:
+            带时间区间的文档数
+        """
+        count = 0
+        for doc_id, metadata in zip(ids, metadatas):
+            interval = self._interval(metadata)
+            if interval is None:
+                self._intervals.pop(doc_id, None)
+            else:
+                self._intervals[doc_id] = interval
+                count += 1
+        self._levels = None
+        return count
+
+    def remove(self, ids: Sequence[str]) -> int:
+        """
+        删除文档块
+
+        Args:
+            ids: 文档ID
+
+        Returns:
+            删除的数量
+        """
+        removed = sum(self._intervals.pop(doc_id, None) is not None for doc_id in ids)
+        if removed:
+            self._levels = None
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def _build(self):
+        """按时长分级并排序"""
+        ids = np.array(list(self._intervals.keys()), dtype=object)
+        bounds = np.array(list(self._intervals.values()), dtype=np.int64).reshape(-1, 2)
+        starts, ends = bounds[:, 0], bounds[:, 1]
+        durations = ends - starts
+        levels = np.array([int(d).bit_length() for d in durations], dtype=np.int64)
+
+        self._levels = []
+        for level in np.unique(levels):
+            members = np.flatnonzero(levels == level)
+            order = members[np.lexsort((ends[members], starts[members]))]
+            self._levels.append((int(durations[members].max()), starts[order], ends[order], ids[order]))
+
+    # === 查询 ===
+
+    def query(self, start: int, end: int, mode: str = 'overlap') -> List[str]:
+        """
+        查询时间窗口内的文档块
+
+        Args:
+            start: 窗口开始时间（秒）
+            end: 窗口结束时间（秒）
+            mode: overlap（与窗口有交集）/ contained（完全落在窗口内）
+
+        Returns:
+            文档ID列表，按开始时间、结束时间、ID升序
+        """
+        if mode not in SUPPORTED_TIME_MODES:
+            raise ValueError(f"不支持的时间查询方式: {mode}")
+        if self._levels is None:
+            self._build()
+
+        matched_starts, matched_ends, matched_ids = [], [], []
+        for max_duration, starts, ends, ids in self._levels:
+            if mode == 'overlap':
+                lo = np.searchsorted(starts, start - max_duration, side='left')
+                hi = np.searchsorted(starts, end, side='right')
+                mask = ends[lo:hi] >= start
+            else:
+                lo = np.searchsorted(starts, start, side='left')
+                hi = np.searchsorted(starts, end, side='right')
+                mask = ends[lo:hi] <= end
+            matched_starts.append(starts[lo:hi][mask])
+            matched_ends.append(ends[lo:hi][mask])
+            matched_ids.append(ids[lo:hi][mask])
+
+        if not matched_ids:
+            return []
+        ids = np.concatenate(matched_ids)
+        order = np.lexsort((ids.astype(str), np.concatenate(matched_ends), np.concatenate(matched_starts)))
+        return ids[order].tolist()
+
+    def overlapping(self, start: int, end: int) -> List[str]:
+        """与窗口 [start, end] 有交集的文档块（按时间排序）"""
+        return self.query(start, end, 'overlap')
+
+    def contained(self, start: int, end: int) -> List[str]:
+        """完全落在窗口 [start, end] 内的文档块（按时间排序）"""
+        return self.query(start, end, 'contained')
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+元数据过滤位图
+为source_file、chunk_type、speakers的每个取值预先计算文档位图（按行号的布尔数组），
+过滤条件解析为位图的与/或运算，供向量索引和BM25索引在取top-k时只扫描满足条件的文档
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 支持过滤的元数据字段
+FILTER_FIELDS = ('source_file', 'chunk_type', 'speakers')
+
+# 缓存的过滤掩码数量（相同过滤条件的重复查询直接复用）
+_MASK_CACHE_SIZE = 64
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, Tuple[str, ...]]:
+    """
+    规范化过滤条件
+
+    Args:
+        filters: {字段: 取值或取值列表}；同一字段的多个取值为“或”，不同字段之间为“与”。
+                 source_file按子串匹配（如"chap02"），chunk_type按原值匹配，
+                 speakers匹配说话人列表中的任一说话人
+
+    Returns:
+        {字段: 去重排序后的取值元组}，没有条件时为空字典
+    """
+    normalized = {}
+    for field, values in (filters or {}).items():
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"不支持的过滤字段: {field}（可用字段: {', '.join(FILTER_FIELDS)}）")
+        if values is None:
+            continue
+        if isinstance(values, str):
+            values = [values]
+        normalized[field] = tuple(sorted({str(value).strip() for value in values}))
+    return normalized
+
+
+def _value_matches(field: str, stored: str, value: str) -> bool:
+    """元数据中的原值是否满足单个过滤取值"""
+    if field == 'source_file':
+        return value in stored
+    if field == 'speakers':
+        return value in (speaker.strip() for speaker in stored.split(','))
+    return stored == value
+
+
+class MetadataBitmapIndex:
+    """
+    按行号对齐的元数据位图
+
+    每个字段的每个原值对应一个布尔数组；过滤时先找出满足条件的原值，再对其位图求或，字段之间求与。
+    用文档ID列表构建时行号与列表下标一致（None表示空位），向量索引和BM25索引据此直接得到过滤掩码
+    """
+
+    def __init__(self,
+                 ids: Sequence[Optional[str]] = (),
+                 metadatas: Sequence[Optional[Dict[str, Any]]] = ()):
+        """
+        初始化位图索引
+
+        Args:
+            ids: 按行号排列的文档ID（None表示空位，如BM25索引中已删除文档的编号）
+            metadatas: 与ids一一对应的元数据
+        """
+        self.ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._values: List[Optional[Tuple[str, ...]]] = []  # 行号 -> 各字段的原值（空位为None）
+        self._vacant = 0
+        self._bitmaps: Optional[Dict[str, Dict[str, np.ndarray]]] = None
+        self._mask_cache: Dict[Tuple, np.ndarray] = {}
+
+        for doc_id, metadata in zip(ids, metadatas):
+            self._append(doc_id, metadata)
+
+    @staticmethod
+    def _field_values(metadata: Optional[Dict[str, Any]]) -> Tuple[str, ...]:
+        """提取过滤字段的原值（缺失为空字符串）"""
+        metadata = metadata or {}
+        return tuple(str(metadata.get(field) or '') for field in FILTER_FIELDS)
+
+    def _append(self, doc_id: Optional[str], metadata: Optional[Dict[str, Any]]):
+        """追加一行"""
+        if doc_id is None:
+            self.ids.append(None)
+            self._values.append(None)
+            self._vacant += 1
+            return
+        self._rows[doc_id] = len(self.ids)
+        self.ids.append(doc_id)
+        self._values.append(self._field_values(metadata))
+
+    def _invalidate(self):
+        self._bitmaps = None
+        self._mask_cache = {}
+
+    # === 增量维护（行号可能因回收空位而变化，按行号对齐的用法应重新构建） ===
+
+    def upsert(self, ids: Sequence[str], metadatas: Sequence[Optional[Dict[str, Any]]]):
+        """
+        新增或更新文档的元数据
+
+        Args:
+            ids: 文档ID
+            metadatas: 元数据
+        """
+        for doc_id, metadata in zip(ids, metadatas):
+            row = self._rows.get(doc_id)
+            if row is None:
+                self._append(doc_id, metadata)
+            else:
+                self._values[row] = self._field_values(metadata)
+        self._invalidate()
+
+    def remove(self, ids: Sequence[str]) -> int:
+        """
+        删除文档（空位过半时回收）
+
+        Args:
+            ids: 文档ID
+
+        Returns:
+            删除的数量
+        """
+        removed = 0
+        for doc_id in ids:
+            row = self._rows.pop(doc_id, None)
+            if row is not None:
+                self.ids[row] = None
+                self._values[row] = None
+                removed += 1
+        if removed:
+            self._vacant += removed
+            if self._vacant * 2 > len(self.ids):
+                live = [row for row, doc_id in enumerate(self.ids) if doc_id is not None]
+                self.ids = [self.ids[row] for row in live]
+                self._values = [self._values[row] for row in live]
+                self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+                self._vacant = 0
+            self._invalidate()
+        return removed
+
+    @property
+    def size(self) -> int:
+        """行数（含空位）"""
+        return len(self.ids)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _build(self):
+        """按字段和原值生成位图"""
+        rows_by_value: Dict[str, Dict[str, List[int]]] = {field: {} for field in FILTER_FIELDS}
+        for row, values in enumerate(self._values):
+            if values is None:
+                continue
+            for field, value in zip(FILTER_FIELDS, values):
+                rows_by_value[field].setdefault(value, []).append(row)
+
+        self._bitmaps = {}
+        for field, value_rows in rows_by_value.items():
+            self._bitmaps[field] = {}
+            for value, rows in value_rows.items():
+                bitmap = np.zeros(len(self.ids), dtype=bool)
+                bitmap[rows] = True
+                self._bitmaps[field][value] = bitmap
+
+    # === 查询 ===
+
+    def matching_values(self, field: str, values: Sequence[str]) -> List[str]:
+        """
+        满足过滤取值的元数据原值
+
+        Args:
+            field: 过滤字段
+            values: 过滤取值
+
+        Returns:
+            元数据中实际出现的原值（可用于ChromaDB的$in条件）
+        """
+        if self._bitmaps is None:
+            self._build()
+        return sorted(stored for stored in self._bitmaps[field]
+                      if stored and any(_value_matches(field, stored, value) for value in values))
+
+    def mask(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        过滤条件对应的行掩码
+
+        Args:
+            filters: 过滤条件（见normalize_filters）
+
+        Returns:
+            长度为size的只读布尔数组；没有过滤条件时返回None
+        """
+        normalized = normalize_filters(filters)
+        if not normalized:
+            return None
+        key = tuple(sorted(normalized.items()))
+        cached = self._mask_cache.get(key)
+        if cached is not None:
+            return cached
+
+        if self._bitmaps is None:
+            self._build()
+        mask = np.ones(len(self.ids), dtype=bool)
+        for field, values in normalized.items():
+            field_mask = np.zeros(len(self.ids), dtype=bool)
+            for stored in self.matching_values(field, values):
+                field_mask |= self._bitmaps[field][stored]
+            mask &= field_mask
+
+        mask.setflags(write=False)
+        if len(self._mask_cache) >= _MASK_CACHE_SIZE:
+            self._mask_cache.pop(next(iter(self._mask_cache)))
+        self._mask_cache[key] = mask
+        return mask
+
+    def count(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        """
+        满足过滤条件的文档数
+
+        Args:
+            filters: 过滤条件，None表示全部文档
+
+        Returns:
+            文档数
+        """
+        mask = self.mask(filters)
+        return len(self) if mask is None else int(np.count_nonzero(mask))
+
+    def value_counts(self, field: str) -> Dict[str, int]:
+        """
+        字段各原值的文档数
+
+        Args:
+            field: 过滤字段
+
+        Returns:
+            {原值: 文档数}
+        """
+        if self._bitmaps is None:
+            self._build()
+        return {value: int(np.count_nonzero(bitmap)) for value, bitmap in self._bitmaps[field].items() if value}
+
+    def where_clause(self, filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        转换为ChromaDB的where条件（把子串/说话人匹配展开为原值的$in）
+
+        Args:
+            filters: 过滤条件
+
+        Returns:
+            where条件；没有过滤条件时返回None
+        """
+        clauses = [{field: {"$in": self.matching_values(field, values)}}
+                   for field, values in normalize_filters(filters).items()]
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
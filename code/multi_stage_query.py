@@ -4,12 +4,17 @@
 根据维度分析结果执行不同的搜索策略并整合结果
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Sequence
 from datetime import datetime
+from concurrent.futures import Executor, ThreadPoolExecutor
 from search_interface import SearchInterface
+from advanced_search_system import truncate_reranked
 from vectorize_chunks import ChunkVectorizer
 from dimension_analyzer import DimensionAnalyzer
 
+# 预先检索的维度：规则回退分析总会加入向量检索，大多数查询也需要关键词检索
+SPECULATIVE_DIMENSIONS = ("vector_search", "keyword_search")
+
 class MultiStageQuerySystem:
     """
     多阶段查询系统：根据缺失维度执行不同搜索策略
@@ -30,6 +35,8 @@ class MultiStageQuerySystem:
         self.search_interface = search_interface or SearchInterface(config_name="balanced")
         self.vectorizer = vectorizer
         self.dimension_analyzer = dimension_analyzer or DimensionAnalyzer()
+        # 预先检索时执行维度分析的线程池（调用方未提供时按需创建）
+        self._analysis_executor = None
         
         # 搜索策略优先级（向量搜索 > 关键词搜索 > 时间搜索）
         self.search_priority = {
@@ -101,17 +108,10 @@ class MultiStageQuerySystem:
         try:
             print(f"执行关键词搜索: {query}")
             
-            # 使用vectorizer的关键词搜索功能
-            if not self.vectorizer:
-                print("vectorizer未初始化，跳过关键词搜索")
-                return []
-            
-            # 这里可以实现基于关键词的搜索逻辑
-            # 暂时使用向量搜索作为替代（实际项目中可以实现专门的关键词搜索）
-            search_result = self.search_interface.search(
+            # 在全局BM25倒排索引上独立检索，不重复向量检索
+            search_result = self.search_interface.keyword_search(
                 query=query,
-                top_k=top_k,
-                return_prompt=False
+                top_k=top_k
             )
             
             if search_result.get('error'):
@@ -158,11 +158,13 @@ class MultiStageQuerySystem:
                 print("vectorizer未初始化，跳过时间搜索")
                 return []
             
-            # 使用vectorizer的时间范围搜索
+            # 使用vectorizer的时间范围搜索：取与时间范围有交集的chunks，按与查询的相关性排序
             time_results = self.vectorizer.search_by_time_range(
                 start_time=start_time or "00:00",
                 end_time=end_time or "99:99",
-                n_results=top_k
+                n_results=top_k,
+                mode='overlap',
+                query_text=query
             )
             
             if not time_results or 'ids' not in time_results:
@@ -193,10 +195,35 @@ class MultiStageQuerySystem:
             print(f"时间搜索异常: {e}")
             return []
     
+    @staticmethod
+    def _cut_prefetched(dimension: str,
+                        results: List[Dict[str, Any]],
+                        top_k: int) -> List[Dict[str, Any]]:
+        """
+        把按更大top-k预先检索的结果截取为直接按top_k检索的结果
+        
+        关键词检索按综合得分重新排序，不能直接取前top_k个：BM25的top-k前缀一致，
+        保留BM25名次在top_k以内的结果（综合得分顺序不变）；向量检索按BRE重排序的截取规则截取
+        
+        Args:
+            dimension: 搜索维度
+            results: 预先检索的结果
+            top_k: 每个维度返回的结果数量
+            
+        Returns:
+            截取后的结果
+        """
+        if dimension == "keyword_search" and all('bm25_rank' in r for r in results):
+            return [r for r in results if r['bm25_rank'] < top_k]
+        if dimension == "vector_search":
+            return truncate_reranked(results, top_k, score_key='score')
+        return results[:top_k]
+    
     def execute_serial_search(self, 
                             query: str,
                             missing_dimensions: List[str],
                             top_k_per_dimension: int = 5,
+                            prefetched_results: Optional[Dict[str, List[Dict[str, Any]]]] = None,
                             **kwargs) -> List[Dict[str, Any]]:
         """
         串行执行多个搜索维度
@@ -205,6 +232,7 @@ class MultiStageQuerySystem:
             query: 查询文本
             missing_dimensions: 需要搜索的维度列表
             top_k_per_dimension: 每个维度返回的结果数量
+            prefetched_results: 已预先检索的维度结果 {维度: 按相关度排序的结果}，命中的维度直接截取不再检索
             **kwargs: 其他参数
             
         Returns:
@@ -226,7 +254,10 @@ class MultiStageQuerySystem:
             # 过滤kwargs，避免top_k参数冲突
             filtered_kwargs = {k: v for k, v in kwargs.items() if k != 'top_k'}
             
-            if dimension == "vector_search":
+            if prefetched_results and dimension in prefetched_results:
+                results = self._cut_prefetched(dimension, prefetched_results[dimension], top_k_per_dimension)
+                print(f"使用预先检索的结果: {len(results)}个")
+            elif dimension == "vector_search":
                 results = self.execute_vector_search(
                     query=query, 
                     top_k=top_k_per_dimension,
@@ -257,6 +288,8 @@ class MultiStageQuerySystem:
                          query: str,
                          current_context: str = "",
                          max_results: int = 10,
+                         dimension_analysis: Optional[Dict[str, Any]] = None,
+                         prefetched_results: Optional[Dict[str, List[Dict[str, Any]]]] = None,
                          **kwargs) -> Dict[str, Any]:
         """
         执行完整的多阶段搜索
@@ -265,6 +298,8 @@ class MultiStageQuerySystem:
             query: 用户查询
             current_context: 当前上下文
             max_results: 最大结果数量
+            dimension_analysis: 调用方已完成的维度分析结果（提供时不再重复调用维度分析器）
+            prefetched_results: 已预先检索的维度结果（见execute_serial_search）
             **kwargs: 其他参数
             
         Returns:
@@ -277,15 +312,19 @@ class MultiStageQuerySystem:
         try:
             # 1. 维度分析
             print("\n步骤1: 维度分析")
-            dimension_result = self.dimension_analyzer.analyze_query_dimensions(
-                query=query,
-                current_context=current_context
-            )
+            if dimension_analysis is not None:
+                print("使用调用方提供的维度分析结果")
+                dimension_result = dimension_analysis
+            else:
+                dimension_result = self.dimension_analyzer.analyze_query_dimensions(
+                    query=query,
+                    current_context=current_context
+                )
             
             print(f"分析结果: {dimension_result}")
             
             # 2. 判断是否需要额外搜索
-            if not dimension_result["needs_additional_search"]:
+            if not dimension_result.get("needs_additional_search", True):
                 print("当前上下文足够，无需额外搜索")
                 return {
                     'query': query,
@@ -298,7 +337,7 @@ class MultiStageQuerySystem:
             
             # 3. 执行串行搜索
             print("\n步骤2: 执行搜索")
-            missing_dimensions = dimension_result["missing_dimensions"]
+            missing_dimensions = dimension_result.get("missing_dimensions", [])
             
             if not missing_dimensions:
                 print("没有指定搜索维度，使用默认向量搜索")
@@ -310,6 +349,7 @@ class MultiStageQuerySystem:
                 query=query,
                 missing_dimensions=missing_dimensions,
                 top_k_per_dimension=per_dimension_results,
+                prefetched_results=prefetched_results,
                 **kwargs
             )
             
@@ -353,6 +393,86 @@ class MultiStageQuerySystem:
                 'error': str(e)
             }
 
+    def speculative_multi_stage_search(self,
+                                       query: str,
+                                       current_context: str = "",
+                                       max_results: int = 10,
+                                       executor: Optional[Executor] = None,
+                                       speculative_dimensions: Sequence[str] = SPECULATIVE_DIMENSIONS,
+                                       **kwargs) -> Dict[str, Any]:
+        """
+        预先检索的多阶段搜索：维度分析（大模型调用）在线程池中执行，
+        同时在当前线程预先执行向量和关键词检索；分析结果返回后丢弃不需要的维度，补充执行其余维度（如时间检索）
+
+        预先检索按单一维度时的结果数取top-k，分析需要多个维度时按较小的top-k截取（见_cut_prefetched，与直接检索的结果一致）
+
+        Args:
+            query: 用户查询
+            current_context: 当前上下文
+            max_results: 最大结果数量
+            executor: 执行维度分析的线程池（None表示使用内部线程池）
+            speculative_dimensions: 预先检索的维度
+            **kwargs: 其他参数
+
+        Returns:
+            与multi_stage_search相同格式的结果，另含speculative字段（被采用和被丢弃的预先检索维度）
+        """
+        start_time = datetime.now()
+        if executor is None:
+            if self._analysis_executor is None:
+                self._analysis_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="dimension-analysis")
+            executor = self._analysis_executor
+
+        analysis_future = executor.submit(
+            self.dimension_analyzer.analyze_query_dimensions,
+            query=query,
+            current_context=current_context
+        )
+
+        # 分析等待网络期间预先检索（取单一维度时需要的结果数）
+        print(f"\n=== 预先检索: {list(speculative_dimensions)} ===")
+        top_k = max(max_results + 5, 10)
+        filtered_kwargs = {k: v for k, v in kwargs.items() if k != 'top_k'}
+        prefetched_results = {}
+        for dimension in speculative_dimensions:
+            if dimension == "vector_search":
+                prefetched_results[dimension] = self.execute_vector_search(query=query, top_k=top_k, **filtered_kwargs)
+            elif dimension == "keyword_search":
+                prefetched_results[dimension] = self.execute_keyword_search(query=query, top_k=top_k, **filtered_kwargs)
+        prefetch_time = (datetime.now() - start_time).total_seconds()
+
+        try:
+            dimension_result = analysis_future.result()
+        except Exception as e:
+            print(f"维度分析失败: {e}，使用预先检索的维度")
+            dimension_result = {
+                "needs_additional_search": True,
+                "missing_dimensions": list(prefetched_results),
+                "confidence": 0.5,
+                "reasoning": f"维度分析失败，使用预先检索的维度: {e}",
+                "dimensions": list(prefetched_results)
+            }
+        analysis_wait = (datetime.now() - start_time).total_seconds() - prefetch_time
+        print(f"预先检索耗时{prefetch_time:.2f}秒，之后等待维度分析{max(analysis_wait, 0):.2f}秒")
+
+        result = self.multi_stage_search(
+            query=query,
+            current_context=current_context,
+            max_results=max_results,
+            dimension_analysis=dimension_result,
+            prefetched_results=prefetched_results,
+            **kwargs
+        )
+
+        used = [d for d in result.get('search_dimensions', []) if d in prefetched_results] if result.get('needs_search') else []
+        result['search_time'] = (datetime.now() - start_time).total_seconds()
+        result['speculative'] = {
+            'used': used,
+            'discarded': [d for d in prefetched_results if d not in used],
+            'prefetch_time': prefetch_time
+        }
+        return result
+
 # 使用示例
 if __name__ == "__main__":
     # 创建多阶段查询系统
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+字符n-gram倒排索引
+对全部文档块的小写文本建立二元/三元字符组倒排列表，提供不依赖向量召回的字面短语检索通道；
+存储、增量维护和快照复用BM25Index，与BM25索引同时构建
+"""
+
+import heapq
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from bm25_index import BM25Index, NGRAM_SIZES, char_ngrams, content_hash
+
+
+class NGramIndex(BM25Index):
+    """
+    字符n-gram倒排索引
+
+    词项为字符n-gram，倒排列表记录包含该n-gram的文档。
+    长度不超过3的短语由单个n-gram的倒排列表精确给出；更长的短语取其三元组倒排列表的交集，
+    再对少量候选文档核对原文
+    """
+
+    def build_from_texts(self, documents: Dict[str, str], workers: Optional[int] = None):
+        """
+        从文档内容构建索引
+
+        Args:
+            documents: {doc_id: content}
+            workers: 切分进程数，None表示使用全部CPU核，1表示不并行
+        """
+        super().build_from_texts(documents, tokenizer=char_ngrams, workers=workers)
+
+    def add_text(self, doc_id: str, content: str) -> bool:
+        """
+        新增或更新单个文档
+
+        Returns:
+            索引是否发生变化
+        """
+        return self.add_document(doc_id, char_ngrams(content), content_hash(content))
+
+    def phrase_postings(self, phrase: str) -> np.ndarray:
+        """
+        可能包含短语的文档编号（升序）
+
+        Args:
+            phrase: 小写短语
+
+        Returns:
+            文档编号数组；短语不超过3个字符时结果是精确的，否则可能包含误报
+        """
+        if len(phrase) < min(NGRAM_SIZES):
+            return np.zeros(0, dtype=np.intc)
+
+        n = min(len(phrase), max(NGRAM_SIZES))
+        postings = []
+        for gram in {phrase[i:i + n] for i in range(len(phrase) - n + 1)}:
+            term_id = self.term_index.get(gram)
+            if term_id is None:
+                return np.zeros(0, dtype=np.intc)
+            postings.append(np.frombuffer(self.postings_docs[term_id], dtype=np.intc))
+
+        # 从最短的倒排列表开始求交集
+        postings.sort(key=len)
+        docs = postings[0]
+        for other in postings[1:]:
+            if len(docs) == 0:
+                break
+            docs = np.intersect1d(docs, other, assume_unique=True)
+        return docs
+
+    def search_phrases(self,
+                       phrases: Iterable[str],
+                       top_k: int = 10,
+                       fetch_documents: Optional[Callable[[List[str]], Dict[str, str]]] = None,
+                       exclude: Optional[Set[str]] = None,
+                       allowed: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        检索字面包含查询短语的文档
+
+        文档得分为其包含的短语长度之和。先用n-gram倒排列表求得分上界，
+        按上界从高到低核对原文，第k名的实际得分不低于剩余上界时提前结束
+
+        Args:
+            phrases: 查询短语
+            top_k: 返回数量
+            fetch_documents: 获取文档内容的函数，用于核对长度超过3的短语；为None时不核对
+            exclude: 需要跳过的文档ID
+            allowed: 可选，按文档编号的布尔掩码（元数据过滤），只返回掩码为True的文档
+
+        Returns:
+            [(doc_id, score)]，按得分降序（同分按文档编号升序）
+        """
+        phrases = [p for p in dict.fromkeys(p.lower() for p in phrases) if len(p) >= min(NGRAM_SIZES)]
+        if not phrases or top_k <= 0 or self.doc_count == 0:
+            return []
+
+        upper = np.zeros(len(self.doc_ids), dtype=np.float64)
+        for phrase in phrases:
+            upper[self.phrase_postings(phrase)] += len(phrase)
+
+        candidates = np.flatnonzero(upper > 0 if allowed is None else (upper > 0) & allowed)
+        if exclude:
+            candidates = np.array([n for n in candidates if self.doc_ids[n] not in exclude], dtype=np.int64)
+        if len(candidates) == 0:
+            return []
+        candidates = candidates[np.lexsort((candidates, -upper[candidates]))]
+
+        needs_check = fetch_documents is not None and any(len(p) > max(NGRAM_SIZES) for p in phrases)
+        if not needs_check:
+            return [(self.doc_ids[n], float(upper[n])) for n in candidates[:top_k]]
+
+        # 按上界分批核对原文，维护实际得分最高的k个文档
+        top: List[Tuple[float, int]] = []
+        batch_size = max(top_k, 16)
+        for start in range(0, len(candidates), batch_size):
+            batch = candidates[start:start + batch_size]
+            if len(top) >= top_k and upper[batch[0]] < top[0][0]:
+                break
+            contents = fetch_documents([self.doc_ids[n] for n in batch])
+            for n in batch:
+                content = (contents.get(self.doc_ids[n]) or '').lower()
+                score = float(sum(len(p) for p in phrases if p in content))
+                if score <= 0:
+                    continue
+                item = (score, -int(n))
+                if len(top) < top_k:
+                    heapq.heappush(top, item)
+                elif item > top[0]:
+                    heapq.heapreplace(top, item)
+
+        return [(self.doc_ids[-n], score) for score, n in sorted(top, reverse=True)]
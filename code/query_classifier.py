@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+查询维度的本地分类器
+用查询的表层特征（时间词、时间表达、实体标记、长度、是否有对话上下文）和字符二元组，
+以逻辑回归判断是否需要额外搜索及各搜索维度；初始权重由规则分析的规则换算而来，
+用大模型维度分析的记录训练后，置信度足够时不必调用大模型（未训练时总是交给大模型）
+"""
+
+import json
+import os
+import re
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 输出：是否需要额外搜索，以及三个搜索维度
+SEARCH_DIMENSIONS = ('vector_search', 'keyword_search', 'time_search')
+LABELS = ('needs_additional_search',) + SEARCH_DIMENSIONS
+
+# 本地判断的置信度达到该值时直接采用，否则交给大模型分析
+LOCAL_CONFIDENCE_THRESHOLD = 0.85
+
+# 训练记录少于该数量时，本地判断的置信度最高为UNTRAINED_CONFIDENCE（低于阈值，仍由大模型分析）
+MIN_TRAINED_SAMPLES = 200
+UNTRAINED_CONFIDENCE = 0.5
+
+TIME_KEYWORDS = ('时间', '分钟', '秒', '小时', '开始', '结束', '期间', '之间')
+QUESTION_WORDS = ('什么', '为什么', '如何', '怎么', '哪些', '介绍', '总结', '讲了', '说了')
+_TIME_PATTERN = re.compile(r'\d+\s*(?:分钟|分|秒|小时)|\d{1,2}[:：]\d{2}')
+_ENTITY_PATTERN = re.compile(r'[《“"「][^》”"」]+[》”"」]|[A-Za-z]{2,}|\d+')
+
+# 表层特征（顺序即权重下标）
+SURFACE_FEATURES = ('bias', 'has_context', 'time_keyword', 'time_pattern',
+                    'length_short', 'length_medium', 'length_long', 'entity', 'question_word')
+
+# 规则分析换算的初始权重：总是需要搜索（有对话上下文时不确定）、总是向量搜索、
+# 查询长于2个字时关键词搜索、含时间词时时间搜索
+SEED_WEIGHTS = {
+    'needs_additional_search': {'bias': 3.0, 'has_context': -3.0},
+    'vector_search': {'bias': 3.0},
+    'keyword_search': {'bias': -2.0, 'length_medium': 5.0, 'length_long': 5.0, 'entity': 1.0},
+    'time_search': {'bias': -3.0, 'time_keyword': 5.0, 'time_pattern': 6.0},
+}
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-np.clip(x, -30, 30)))
+
+
+class QueryDimensionClassifier:
+    """
+    查询维度的逻辑回归分类器
+
+    每个输出一组权重，特征为表层特征加上按crc32散列到hash_buckets个桶的字符二元组；
+    训练时以L2正则把权重拉向初始（规则）权重；训练记录不足MIN_TRAINED_SAMPLES条时置信度封顶，不替代大模型
+    """
+
+    def __init__(self, hash_buckets: int = 4096):
+        """
+        初始化分类器（使用规则换算的初始权重）
+
+        Args:
+            hash_buckets: 字符二元组散列的桶数
+        """
+        self.hash_buckets = hash_buckets
+        self.dim = len(SURFACE_FEATURES) + hash_buckets
+        self.seed_weights = np.zeros((len(LABELS), self.dim))
+        for label, weights in SEED_WEIGHTS.items():
+            for feature, weight in weights.items():
+                self.seed_weights[LABELS.index(label), SURFACE_FEATURES.index(feature)] = weight
+        self.weights = self.seed_weights.copy()
+        self.trained_samples = 0
+
+    # === 特征 ===
+
+    def features(self, query: str, current_context: Optional[str] = None) -> np.ndarray:
+        """
+        提取特征下标（取值均为1的稀疏特征）
+
+        Args:
+            query: 用户查询
+            current_context: 当前上下文（对话历史）
+
+        Returns:
+            特征下标数组
+        """
+        query = (query or '').strip()
+        length = len(query)
+        active = [
+            True,
+            bool(current_context and current_context.strip() and current_context != "当前没有上下文信息"),
+            any(keyword in query for keyword in TIME_KEYWORDS),
+            _TIME_PATTERN.search(query) is not None,
+            length <= 2,
+            2 < length <= 15,
+            length > 15,
+            _ENTITY_PATTERN.search(query) is not None,
+            any(word in query for word in QUESTION_WORDS),
+        ]
+        indices = [i for i, flag in enumerate(active) if flag]
+        offset = len(SURFACE_FEATURES)
+        indices.extend(sorted({offset + zlib.crc32(query[i:i + 2].encode('utf-8')) % self.hash_buckets
+                               for i in range(length - 1)}))
+        return np.array(indices, dtype=np.int64)
+
+    # === 预测 ===
+
+    def predict_proba(self, query: str, current_context: Optional[str] = None) -> Dict[str, float]:
+        """
+        各输出为真的概率
+
+        Args:
+            query: 用户查询
+            current_context: 当前上下文
+
+        Returns:
+            {输出名: 概率}
+        """
+        scores = self.weights[:, self.features(query, current_context)].sum(axis=1)
+        return dict(zip(LABELS, _sigmoid(scores).tolist()))
+
+    def predict(self, query: str, current_context: Optional[str] = None) -> Dict[str, Any]:
+        """
+        判断查询的维度需求（与DimensionAnalyzer.analyze_query_dimensions的结果格式相同）
+
+        Args:
+            query: 用户查询
+            current_context: 当前上下文
+
+        Returns:
+            分析结果；confidence为参与判断的各输出中最低的置信度（训练记录不足时不超过UNTRAINED_CONFIDENCE）
+        """
+        probabilities = self.predict_proba(query, current_context)
+        needs_search = probabilities['needs_additional_search'] >= 0.5
+        confidences = [max(probabilities['needs_additional_search'], 1 - probabilities['needs_additional_search'])]
+
+        missing_dimensions = []
+        if needs_search:
+            for dimension in SEARCH_DIMENSIONS:
+                probability = probabilities[dimension]
+                confidences.append(max(probability, 1 - probability))
+                if probability >= 0.5:
+                    missing_dimensions.append(dimension)
+            if not missing_dimensions:
+                missing_dimensions = ['vector_search']
+
+        confidence = float(min(confidences))
+        reasoning = f"本地分类器判断（置信度{confidence:.2f}）"
+        if self.trained_samples < MIN_TRAINED_SAMPLES:
+            # 只有规则初始权重时不替代大模型
+            confidence = min(confidence, UNTRAINED_CONFIDENCE)
+            reasoning = f"本地分类器训练记录不足（{self.trained_samples}/{MIN_TRAINED_SAMPLES}条），仅供参考"
+        return {
+            "needs_additional_search": needs_search,
+            "missing_dimensions": missing_dimensions,
+            "confidence": round(confidence, 4),
+            "reasoning": reasoning,
+            "dimensions": missing_dimensions,
+            "source": "local"
+        }
+
+    # === 训练 ===
+
+    def fit(self,
+            records: Iterable[Dict[str, Any]],
+            epochs: int = 200,
+            learning_rate: float = 0.5,
+            l2: float = 0.01) -> int:
+        """
+        用维度分析记录训练（从规则初始权重开始的全批量梯度下降，L2正则以初始权重为中心）
+
+        特征按稀疏下标存放（每条记录只有几十个非零特征），内存与记录数的非零特征总数成正比
+
+        Args:
+            records: 分析记录，每条包含query、current_context（可选）和result（大模型的分析结果）
+            epochs: 迭代次数
+            learning_rate: 学习率
+            l2: 正则强度
+
+        Returns:
+            使用的记录数
+        """
+        indices, lengths, targets, weights = [], [], [], []
+        for record in records:
+            result = record.get('result') or {}
+            if 'needs_additional_search' not in result:
+                continue
+            needs_search = bool(result['needs_additional_search'])
+            dimensions = set(result.get('missing_dimensions') or [])
+            row = self.features(record.get('query', ''), record.get('current_context'))
+            indices.append(row)
+            lengths.append(len(row))
+            targets.append([needs_search] + [dimension in dimensions for dimension in SEARCH_DIMENSIONS])
+            # 不需要搜索时各维度没有标注，不参与训练
+            weights.append([1.0] + [1.0 if needs_search else 0.0] * len(SEARCH_DIMENSIONS))
+
+        if not indices:
+            return 0
+
+        count = len(indices)
+        columns = np.concatenate(indices)
+        rows = np.repeat(np.arange(count), lengths)
+        targets = np.array(targets, dtype=np.float64).T
+        sample_weights = np.array(weights).T
+        sample_weights /= np.maximum(sample_weights.sum(axis=1, keepdims=True), 1.0)
+
+        self.weights = self.seed_weights.copy()
+        for _ in range(epochs):
+            for label in range(len(LABELS)):
+                scores = np.bincount(rows, weights=self.weights[label, columns], minlength=count)
+                errors = (_sigmoid(scores) - targets[label]) * sample_weights[label]
+                gradient = np.bincount(columns, weights=errors[rows], minlength=self.dim)
+                gradient += l2 * (self.weights[label] - self.seed_weights[label])
+                self.weights[label] -= learning_rate * gradient
+
+        self.trained_samples = count
+        return count
+
+    def fit_log(self, log_path: str, **kwargs) -> int:
+        """
+        用维度分析日志（JSONL，每行一条记录）重新训练（每次都从初始权重开始，不会重复计入旧记录）
+
+        Args:
+            log_path: 日志文件路径
+            **kwargs: 传给fit的参数
+
+        Returns:
+            使用的记录数
+        """
+        def read_records():
+            with open(log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+        return self.fit(read_records(), **kwargs)
+
+    # === 保存与加载 ===
+
+    def save(self, path: str):
+        """
+        保存权重
+
+        Args:
+            path: 文件路径（.npz）
+        """
+        np.savez(path, weights=self.weights, seed_weights=self.seed_weights,
+                 hash_buckets=self.hash_buckets, trained_samples=self.trained_samples)
+
+    @classmethod
+    def load(cls, path: Optional[str]) -> 'QueryDimensionClassifier':
+        """
+        加载训练后的权重；文件不存在或格式不符时使用初始权重
+
+        Args:
+            path: 文件路径（.npz）
+
+        Returns:
+            分类器
+        """
+        if not path or not os.path.exists(path):
+            return cls()
+        try:
+            data = np.load(path)
+            classifier = cls(hash_buckets=int(data['hash_buckets']))
+            if data['weights'].shape != classifier.weights.shape:
+                raise ValueError(f"权重形状不符: {data['weights'].shape}")
+            classifier.weights = data['weights'].astype(np.float64)
+            classifier.trained_samples = int(data['trained_samples'])
+            print(f"✅ 已加载查询维度分类器: {path}（训练记录{classifier.trained_samples}条）")
+            return classifier
+        except Exception as e:
+            print(f"⚠️ 加载查询维度分类器失败: {e}，使用规则初始权重")
+            return cls()
+
+
+# 用维度分析日志训练并保存分类器
+if __name__ == "__main__":
+    import sys
+
+    log_path = sys.argv[1] if len(sys.argv) > 1 else "dimension_analysis_log.jsonl"
+    model_path = sys.argv[2] if len(sys.argv) > 2 else "dimension_classifier.npz"
+
+    classifier = QueryDimensionClassifier()
+    count = classifier.fit_log(log_path)
+    print(f"训练记录数: {count}")
+    classifier.save(model_path)
+    print(f"已保存到: {model_path}")
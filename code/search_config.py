@@ -27,6 +27,15 @@ class SearchConfig:
     max_candidates: int = 50     # 最大候选文档数
     default_top_k: int = 10      # 默认返回结果数
     max_context_length: int = 2000  # 最大上下文长度
+    phrase_candidates: int = 10  # 字面短语检索补充的候选文档数（0表示关闭）
+    index_workers: Optional[int] = None  # 全量构建索引的分词进程数（None表示全部CPU核）
+    vector_backend: str = "chromadb"  # 向量检索后端：chromadb（直接查询集合）/ flat（进程内精确索引）/ ivf（进程内近似索引）
+    ivf_nlist: Optional[int] = None   # IVF倒排列表数（None表示按向量数自动选择）
+    ivf_nprobe: int = 8               # IVF每次查询扫描的倒排列表数，越大召回率越高、延迟越高
+    vector_quantization: Optional[str] = None  # 进程内索引的向量压缩：None / int8（约1/4内存）/ pq（约1/16内存），候选用float32精确重算
+    pq_subspaces: Optional[int] = None         # 乘积量化子空间数（每个向量的编码字节数，None表示维度的1/4）
+    model_warmup_rounds: int = 2      # 启动时用示例文本预热编码模型的轮数（0表示不预热）
+    speculative_retrieval: bool = True  # 多阶段检索时在维度分析的同时预先执行向量和关键词检索
     
     # === 关键词抽取参数 ===
     max_keywords: int = 10       # 最大关键词数量
@@ -138,6 +147,38 @@ class SearchConfig:
             print("错误: max_context_length必须大于0")
             return False
         
+        if self.phrase_candidates < 0:
+            print("错误: phrase_candidates不能为负数")
+            return False
+        
+        if self.index_workers is not None and self.index_workers <= 0:
+            print("错误: index_workers必须大于0")
+            return False
+        
+        if self.vector_backend not in ("chromadb", "flat", "ivf"):
+            print("错误: vector_backend必须为chromadb、flat或ivf")
+            return False
+        
+        if self.ivf_nlist is not None and self.ivf_nlist <= 0:
+            print("错误: ivf_nlist必须大于0")
+            return False
+        
+        if self.ivf_nprobe <= 0:
+            print("错误: ivf_nprobe必须大于0")
+            return False
+        
+        if self.vector_quantization not in (None, "int8", "pq"):
+            print("错误: vector_quantization必须为None、int8或pq")
+            return False
+        
+        if self.pq_subspaces is not None and self.pq_subspaces <= 0:
+            print("错误: pq_subspaces必须大于0")
+            return False
+        
+        if self.model_warmup_rounds < 0:
+            print("错误: model_warmup_rounds不能小于0")
+            return False
+        
         return True
     
     def to_dict(self) -> Dict:
@@ -156,6 +197,15 @@ class SearchConfig:
             'max_candidates': self.max_candidates,
             'default_top_k': self.default_top_k,
             'max_context_length': self.max_context_length,
+            'phrase_candidates': self.phrase_candidates,
+            'index_workers': self.index_workers,
+            'vector_backend': self.vector_backend,
+            'ivf_nlist': self.ivf_nlist,
+            'ivf_nprobe': self.ivf_nprobe,
+            'vector_quantization': self.vector_quantization,
+            'pq_subspaces': self.pq_subspaces,
+            'model_warmup_rounds': self.model_warmup_rounds,
+            'speculative_retrieval': self.speculative_retrieval,
             'max_keywords': self.max_keywords,
             'keyword_min_length': self.keyword_min_length,
             'model_name': self.model_name,
@@ -173,9 +223,15 @@ class SearchConfig:
         print(f"BM25参数: k1={self.bm25_k1}, b={self.bm25_b}")
         print(f"权重配置: 向量={self.vector_weight}, BM25={self.bm25_weight}, 精确={self.exact_weight}")
         print(f"搜索参数: 候选数={self.max_candidates}, 返回数={self.default_top_k}, 上下文长度={self.max_context_length}")
+        print(f"预先检索: {'开启' if self.speculative_retrieval else '关闭'}")
         print(f"关键词: 最大数量={self.max_keywords}, 最小长度={self.keyword_min_length}")
-        print(f"模型: {self.model_name}")
+        print(f"模型: {self.model_name}（预热{self.model_warmup_rounds}轮）")
         print(f"数据库: {self.chroma_db_path}")
+        print(f"向量检索后端: {self.vector_backend}")
+        if self.vector_backend == "ivf":
+            print(f"IVF参数: nlist={self.ivf_nlist or '自动'}, nprobe={self.ivf_nprobe}")
+        if self.vector_quantization and self.vector_backend != "chromadb":
+            print(f"向量压缩: {self.vector_quantization}")
         print(f"停用词数量: {len(self.stop_words)}")
         print(f"允许词性数量: {len(self.allowed_pos)}")
         print("=" * 30)
@@ -255,7 +311,7 @@ class PresetConfigs:
     @staticmethod
     def fast_search() -> SearchConfig:
         """
-        快速搜索配置：减少候选数量，提高速度
+        快速搜索配置：减少候选数量，IVF近似向量检索只扫描少量倒排列表，以召回率换取速度
         
         Returns:
             快速搜索配置
@@ -267,13 +323,15 @@ class PresetConfigs:
             max_candidates=20,
             default_top_k=3,
             max_context_length=1000,
-            max_keywords=5
+            max_keywords=5,
+            vector_backend="ivf",
+            ivf_nprobe=4
         )
     
     @staticmethod
     def comprehensive() -> SearchConfig:
         """
-        全面搜索配置：更多候选，更详细结果
+        全面搜索配置：更多候选，更详细结果，IVF近似向量检索扫描更多倒排列表以提高召回率
         
         Returns:
             全面搜索配置
@@ -285,7 +343,9 @@ class PresetConfigs:
             max_candidates=100,
             default_top_k=10,
             max_context_length=3000,
-            max_keywords=15
+            max_keywords=15,
+            vector_backend="ivf",
+            ivf_nprobe=32
         )
 
 
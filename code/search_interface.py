@@ -7,6 +7,7 @@
 
 import json
 import os
+import time
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 
@@ -32,6 +33,10 @@ class SearchInterface:
         self.search_system = None
         self.initialized = False
         
+        # 就绪状态：模型已加载并预热、搜索系统可用时才对外接收流量
+        self.ready = False
+        self.startup_timings: Dict[str, float] = {}
+        
         print(f"搜索接口初始化完成，使用配置: {config_name}")
     
     def initialize(self) -> bool:
@@ -43,12 +48,18 @@ class SearchInterface:
         """
         try:
             print("正在初始化搜索系统...")
+            self.ready = False
+            self.startup_timings = {}
+            init_start = time.perf_counter()
             
-            # 1. 初始化向量化器
-            self.vectorizer = ChunkVectorizer(
-                model_name=self.config.model_name,
-                collection_name=self.config.collection_name
-            )
+            # 1. 初始化向量化器（重新初始化时复用已加载的模型）
+            if not (self.vectorizer is not None and self.vectorizer.model is not None
+                    and self.vectorizer.model_name == self.config.model_name
+                    and self.vectorizer.collection_name == self.config.collection_name):
+                self.vectorizer = ChunkVectorizer(
+                    model_name=self.config.model_name,
+                    collection_name=self.config.collection_name
+                )
             
             # 2. 初始化ChromaDB
             if not os.path.exists(self.config.chroma_db_path):
@@ -73,24 +84,16 @@ class SearchInterface:
             
             print(f"加载了{total_records}条向量数据")
             
-            # 4. 检查chap02数据是否存在
+            # 4. 构建时间区间索引和元数据过滤位图，并检查chap02数据是否存在
+            phase_start = time.perf_counter()
+            self.vectorizer.build_metadata_indexes()
+            self.startup_timings['metadata_index'] = time.perf_counter() - phase_start
             try:
-                # 检查所有记录而不是只检查前100条
-                all_results = self.vectorizer.collection.get()
-                chap02_count = 0
-                qa_count = 0
-                
-                for metadata in all_results.get('metadatas', []):
-                    if metadata:
-                        source_file = metadata.get('source_file', '')
-                        question = metadata.get('question', '')
-                        
-                        # 检测chap02文件
-                        if 'chap02' in source_file:
-                            chap02_count += 1
-                        # 检测QA数据
-                        elif question and question.strip():
-                            qa_count += 1
+                # 按位图计数，不再逐条扫描全部元数据
+                filter_index = self.vectorizer.filter_index
+                chap02_count = filter_index.count({'source_file': 'chap02'})
+                qa_count = filter_index.count({'chunk_type': 'qa_pair'}) - filter_index.count(
+                    {'source_file': 'chap02', 'chunk_type': 'qa_pair'})
                 
                 total_chap02_related = chap02_count + qa_count
                 if total_chap02_related > 0:
@@ -100,8 +103,20 @@ class SearchInterface:
             except Exception as e:
                 print(f"⚠️ 检查chap02数据时出错: {e}")
             
-            # 4. 加载模型
+            # 4. 加载并预热模型
+            phase_start = time.perf_counter()
             self.vectorizer.load_model()
+            self.startup_timings['model_load'] = time.perf_counter() - phase_start
+            if self.config.model_warmup_rounds > 0 and not self.vectorizer.warmed_up:
+                self.startup_timings['model_warmup'] = self.vectorizer.warm_up(self.config.model_warmup_rounds)
+            
+            phase_start = time.perf_counter()
+            self.vectorizer.build_vector_index(self.config.vector_backend,
+                                               nlist=self.config.ivf_nlist,
+                                               nprobe=self.config.ivf_nprobe,
+                                               quantization=self.config.vector_quantization,
+                                               pq_subspaces=self.config.pq_subspaces)
+            self.startup_timings['vector_index'] = time.perf_counter() - phase_start
             
             # 5. 初始化搜索系统
             self.search_system = AdvancedSearchSystem(
@@ -110,11 +125,15 @@ class SearchInterface:
                 bm25_b=self.config.bm25_b,
                 vector_weight=self.config.vector_weight,
                 bm25_weight=self.config.bm25_weight,
-                exact_weight=self.config.exact_weight
+                exact_weight=self.config.exact_weight,
+                phrase_candidates=self.config.phrase_candidates,
+                index_workers=self.config.index_workers
             )
             
             self.initialized = True
-            print("搜索系统初始化成功！")
+            self.ready = self.vectorizer.warmed_up or self.config.model_warmup_rounds == 0
+            self.startup_timings['total'] = time.perf_counter() - init_start
+            print(f"搜索系统初始化成功！耗时{self.startup_timings['total']:.2f}秒")
             return True
             
         except Exception as e:
@@ -126,7 +145,8 @@ class SearchInterface:
     def search(self, 
                query: str, 
                top_k: Optional[int] = None,
-               return_prompt: bool = True) -> Dict[str, Any]:
+               return_prompt: bool = True,
+               filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         执行搜索
         
@@ -134,6 +154,7 @@ class SearchInterface:
             query: 查询文本
             top_k: 返回结果数量
             return_prompt: 是否返回提示词
+            filters: 可选，元数据过滤条件，如 {'source_file': 'chap02', 'chunk_type': 'qa_pair'}
             
         Returns:
             搜索结果
@@ -162,68 +183,136 @@ class SearchInterface:
             result = self.search_system.search(
                 query=query,
                 top_k=top_k,
-                max_context_length=self.config.max_context_length
+                max_context_length=self.config.max_context_length,
+                filters=filters
             )
             
-            # 格式化结果
-            formatted_result = {
-                'query': result['query'],
-                'total_results': len(result['results']),
-                'search_time': result['search_time'],
-                'total_candidates': result['total_candidates'],
-                'keywords_extracted': result['keywords_extracted'],
+            return self._format_search_result(result, return_prompt)
+            
+        except Exception as e:
+            print(f"搜索过程中出现错误: {e}")
+            import traceback
+            traceback.print_exc()
+            
+            return {
+                'error': f'搜索失败: {str(e)}',
+                'query': query,
                 'results': []
             }
+    
+    def _format_search_result(self, 
+                              result: Dict[str, Any], 
+                              return_prompt: bool = True) -> Dict[str, Any]:
+        """
+        将搜索系统的原始结果格式化为接口输出格式
+        
+        Args:
+            result: AdvancedSearchSystem返回的结果
+            return_prompt: 是否返回提示词
             
-            # 格式化每个结果
-            for i, res in enumerate(result['results']):
-                # 基础格式化结果
-                formatted_res = {
-                    'rank': i + 1,
-                    'document_id': res['id'],
-                    'content': res['content'],
-                    'metadata': {},
-                    'score': res.get('score', res['final_score']),  # 添加score键以保持兼容性
-                    'scores': {
-                        'final_score': res['final_score'],
-                        'vector_score': res['score_breakdown']['vector'],
-                        'bm25_score': res['score_breakdown']['bm25'],
-                        'exact_score': res['score_breakdown']['exact']
-                    }
-                }
-                
-                # 处理元数据
-                metadata = res['metadata']
-                
-                # 统一的元数据格式
-                formatted_res['metadata'] = {
-                    'source_file': metadata.get('source_file', ''),
-                    'chunk_type': metadata.get('chunk_type', 'text'),
-                    'word_count': metadata.get('word_count', 0)
+        Returns:
+            格式化后的搜索结果
+        """
+        # 格式化结果
+        formatted_result = {
+            'query': result['query'],
+            'total_results': len(result['results']),
+            'search_time': result['search_time'],
+            'total_candidates': result['total_candidates'],
+            'keywords_extracted': result['keywords_extracted'],
+            'results': []
+        }
+        
+        # 格式化每个结果
+        for i, res in enumerate(result['results']):
+            # 基础格式化结果
+            formatted_res = {
+                'rank': i + 1,
+                'document_id': res['id'],
+                'content': res['content'],
+                'metadata': {},
+                'score': res.get('score', res['final_score']),  # 添加score键以保持兼容性
+                'scores': {
+                    'final_score': res['final_score'],
+                    'vector_score': res['score_breakdown']['vector'],
+                    'bm25_score': res['score_breakdown']['bm25'],
+                    'exact_score': res['score_breakdown']['exact']
                 }
-                
-                # 如果是QA格式数据，添加问答信息
-                if 'question' in metadata and 'answer' in metadata:
-                    formatted_res['metadata'].update({
-                        'question': metadata.get('question', ''),
-                        'answer': metadata.get('answer', '')
-                    })
-                
-                formatted_result['results'].append(formatted_res)
+            }
             
-            # 添加提示词
-            if return_prompt:
-                formatted_result['prompt'] = result['prompt']
+            # 关键词检索结果保留BM25名次（按更大top_k检索的结果据此截取）
+            if 'bm25_rank' in res:
+                formatted_res['bm25_rank'] = res['bm25_rank']
             
-            return formatted_result
+            # 处理元数据
+            metadata = res['metadata']
+            
+            # 统一的元数据格式
+            formatted_res['metadata'] = {
+                'source_file': metadata.get('source_file', ''),
+                'chunk_type': metadata.get('chunk_type', 'text'),
+                'word_count': metadata.get('word_count', 0)
+            }
+            
+            # 如果是QA格式数据，添加问答信息
+            if 'question' in metadata and 'answer' in metadata:
+                formatted_res['metadata'].update({
+                    'question': metadata.get('question', ''),
+                    'answer': metadata.get('answer', '')
+                })
+            
+            formatted_result['results'].append(formatted_res)
+        
+        # 添加提示词
+        if return_prompt:
+            formatted_result['prompt'] = result.get('prompt', '')
+        
+        return formatted_result
+    
+    def keyword_search(self, 
+                       query: str, 
+                       top_k: Optional[int] = None,
+                       filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        执行独立的关键词检索（BM25倒排索引），不调用向量模型
+        
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+            filters: 可选，元数据过滤条件
+            
+        Returns:
+            搜索结果（格式与search()一致，不含提示词）
+        """
+        if not self.initialized:
+            if not self.initialize():
+                return {
+                    'error': '搜索系统初始化失败',
+                    'query': query,
+                    'results': []
+                }
+        
+        if not query.strip():
+            return {
+                'error': '查询不能为空',
+                'query': query,
+                'results': []
+            }
+        
+        try:
+            if top_k is None:
+                top_k = self.config.default_top_k
+            
+            result = self.search_system.keyword_search(query=query, top_k=top_k, filters=filters)
+            return self._format_search_result(result, return_prompt=False)
             
         except Exception as e:
-            print(f"搜索过程中出现错误: {e}")
+            print(f"关键词检索过程中出现错误: {e}")
             import traceback
             traceback.print_exc()
             
             return {
-                'error': f'搜索失败: {str(e)}',
+                'error': f'关键词检索失败: {str(e)}',
                 'query': query,
                 'results': []
             }
@@ -276,22 +365,47 @@ class SearchInterface:
         
         return "\n".join(output_lines)
     
-    def batch_search(self, queries: List[str], top_k: int = 3) -> List[Dict[str, Any]]:
+    def batch_search(self, 
+                     queries: List[str], 
+                     top_k: int = 3,
+                     filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         批量搜索
         
         Args:
             queries: 查询列表
             top_k: 每个查询返回的结果数量
+            filters: 可选，元数据过滤条件（对全部查询生效）
             
         Returns:
             批量搜索结果
         """
+        if not self.initialized:
+            if not self.initialize():
+                return [{'error': '搜索系统初始化失败', 'query': query, 'results': []} for query in queries]
+        
+        # 空查询单独处理，其余查询走批量路径（一次编码、一次向量检索）
+        valid_queries = [query for query in queries if query.strip()]
+        try:
+            raw_results = iter(self.search_system.batch_search(
+                valid_queries,
+                top_k=top_k,
+                max_context_length=self.config.max_context_length,
+                filters=filters
+            ))
+            return [
+                self._format_search_result(next(raw_results)) if query.strip()
+                else {'error': '查询不能为空', 'query': query, 'results': []}
+                for query in queries
+            ]
+        except Exception as e:
+            print(f"批量搜索失败，改为逐个查询: {e}")
+        
         results = []
         
         for i, query in enumerate(queries):
             print(f"处理查询 {i+1}/{len(queries)}: {query}")
-            result = self.search(query, top_k=top_k)
+            result = self.search(query, top_k=top_k, filters=filters)
             results.append(result)
         
         return results
@@ -338,9 +452,24 @@ class SearchInterface:
                 info['database'] = collection_info
             except Exception as e:
                 info['database_error'] = str(e)
+            info['query_cache'] = self.vectorizer.get_query_cache_stats()
         
+        info['readiness'] = self.get_readiness()
         return info
     
+    def get_readiness(self) -> Dict[str, Any]:
+        """
+        获取就绪状态（供负载均衡判断是否向本实例转发请求）
+        
+        Returns:
+            是否就绪、模型加载与预热状态及启动各阶段耗时（秒）
+        """
+        return {
+            'ready': self.ready and self.initialized,
+            'model': self.vectorizer.get_model_status() if self.vectorizer else None,
+            'startup_timings': dict(self.startup_timings)
+        }
+    
     def save_search_results(self, results: Dict[str, Any], filename: str):
         """
         保存搜索结果到文件
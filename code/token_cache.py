@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+分词缓存
+以内容哈希为键缓存查询和文档的分词结果：
+- 查询：每个查询只分析一次（关键词抽取 + 分词），按LRU淘汰
+- 文档：优先取BM25索引构建时保存的正排列表，查询时不再对文档块分词
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from bm25_index import BM25Index, content_hash
+
+
+@dataclass(frozen=True)
+class QueryTokens:
+    """单个查询的分析结果"""
+    tags: List[Tuple[str, float]]  # jieba TF-IDF关键词（全部，按权重降序）
+    tokens: List[str]  # BM25分词结果
+    token_set: FrozenSet[str]
+
+
+class TokenCache:
+    """
+    有界分词缓存（线程安全）
+    """
+
+    def __init__(self, max_queries: int = 256, max_documents: int = 2048):
+        """
+        初始化分词缓存
+
+        Args:
+            max_queries: 最多缓存的查询数
+            max_documents: 最多缓存的文档词项集合数
+        """
+        self.max_queries = max_queries
+        self.max_documents = max_documents
+        self._queries: 'OrderedDict[str, QueryTokens]' = OrderedDict()
+        self._documents: 'OrderedDict[str, FrozenSet[str]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.query_hits = 0
+        self.query_misses = 0
+        self.document_hits = 0
+        self.document_index_hits = 0
+        self.document_misses = 0
+
+    def _lookup(self, cache: OrderedDict, key: str):
+        """查找并标记为最近使用"""
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _store(self, cache: OrderedDict, key: str, value, max_size: int):
+        """写入并按LRU淘汰"""
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > max_size:
+                cache.popitem(last=False)
+
+    def get_query(self, query: str, analyzer: Callable[[str], QueryTokens]) -> QueryTokens:
+        """
+        获取查询分析结果，未命中时调用analyzer分析一次
+
+        Args:
+            query: 查询文本
+            analyzer: 查询分析函数
+
+        Returns:
+            查询分析结果
+        """
+        key = content_hash(query)
+        cached = self._lookup(self._queries, key)
+        if cached is not None:
+            self.query_hits += 1
+            return cached
+
+        self.query_misses += 1
+        analysis = analyzer(query)
+        self._store(self._queries, key, analysis, self.max_queries)
+        return analysis
+
+    def get_document_terms(self,
+                           content: str,
+                           index: Optional[BM25Index],
+                           tokenizer: Callable[[str], List[str]]) -> FrozenSet[str]:
+        """
+        获取文档的词项集合
+
+        按内容哈希依次查找：缓存 -> BM25索引正排列表；只有未被索引的内容才会分词
+
+        Args:
+            content: 文档内容
+            index: BM25索引
+            tokenizer: 分词函数（仅在索引中找不到该内容时使用）
+
+        Returns:
+            词项集合
+        """
+        key = content_hash(content)
+        cached = self._lookup(self._documents, key)
+        if cached is not None:
+            self.document_hits += 1
+            return cached
+
+        doc_num = index.find_by_hash(key) if index is not None else None
+        if doc_num is not None:
+            self.document_index_hits += 1
+            terms = frozenset(index.document_terms(doc_num))
+        else:
+            self.document_misses += 1
+            terms = frozenset(tokenizer(content))
+
+        self._store(self._documents, key, terms, self.max_documents)
+        return terms
+
+    def clear(self):
+        """清空缓存（分词规则或索引重建后调用）"""
+        with self._lock:
+            self._queries.clear()
+            self._documents.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取缓存统计信息
+
+        Returns:
+            命中/未命中次数及当前缓存大小
+        """
+        return {
+            'cached_queries': len(self._queries),
+            'cached_documents': len(self._documents),
+            'query_hits': self.query_hits,
+            'query_misses': self.query_misses,
+            'document_hits': self.document_hits,
+            'document_index_hits': self.document_index_hits,
+            'document_misses': self.document_misses
+        }
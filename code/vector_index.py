@@ -0,0 +1,944 @@
+# -*- coding: utf-8 -*-
+"""
+进程内向量索引
+把集合中的全部向量载入一个连续的float32矩阵，查询时一次矩阵-向量乘积加argpartition取top-k，
+不经过ChromaDB查询；返回结果的格式与ChunkVectorizer.search_similar_chunks相同。
+IVFVectorIndex用k-means把向量划分为倒排列表，查询只扫描最近的nprobe个列表（近似top-k）。
+启用int8/乘积量化后用压缩编码计算近似距离，float32向量可放到磁盘内存映射，只对少量候选精确重算
+"""
+
+import io
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from bm25_index import CollectionFingerprint
+from metadata_filter import MetadataBitmapIndex
+from vector_quantization import create_quantizer
+
+# 与ChromaDB一致的距离度量（集合元数据中的hnsw:space，默认l2）
+SUPPORTED_SPACES = ('l2', 'ip', 'cosine')
+
+# IVF索引文件格式版本，训练或存储方式变化时应同步修改
+IVF_VERSION = "2"
+
+# 向量数少于该值时不划分倒排列表，直接精确检索
+IVF_MIN_VECTORS = 1000
+
+# 每个倒排列表至少对应的向量数（限制自动选择的列表数）
+IVF_MIN_LIST_SIZE = 32
+
+# 训练k-means时每个聚类中心使用的最多样本数
+IVF_TRAIN_SAMPLES_PER_LIST = 64
+
+# 分配向量到聚类中心时每批处理的行数（限制距离矩阵的内存）
+_ASSIGN_BATCH = 4096
+
+# 已删除的行（空位）超过总行数的该比例时压缩：去掉空位并重排行号（均摊开销与删除数成正比）
+TOMBSTONE_COMPACT_RATIO = 0.25
+
+# 行数组扩容时的最小容量
+_MIN_CAPACITY = 64
+
+# 新增向量中尚未并入倒排列表的行数超过已并入行数的该比例时重建倒排列表
+IVF_TAIL_RATIO = 0.25
+
+# 量化索引按近似距离保留n_results的多少倍候选（至少RESCORE_MIN_CANDIDATES个），再用float32向量精确重算
+RESCORE_FACTOR = 4
+RESCORE_MIN_CANDIDATES = 100
+
+
+def get_vectors_path(index_path: str) -> str:
+    """索引文件对应的float32向量文件路径（同目录、同名、扩展名.vectors.npy）"""
+    return os.path.splitext(index_path)[0] + ".vectors.npy"
+
+
+def _save_array(path: str, array: np.ndarray):
+    """写入.npy文件（先写临时文件再替换）"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _append_array_rows(path: str, rows: np.ndarray) -> bool:
+    """
+    把rows追加到二维float32 .npy文件的末尾并改写文件头中的行数（只写新增的行）
+
+    先写数据再改写文件头，中途中断时文件头仍是原来的行数
+
+    Returns:
+        是否追加成功；文件格式不符或改写后文件头长度变化时返回False（调用方应重写整个文件）
+    """
+    rows = np.ascontiguousarray(rows, dtype=np.float32)
+    with open(path, 'r+b') as f:
+        if np.lib.format.read_magic(f) != (1, 0):
+            return False
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        header_size = f.tell()
+        if fortran_order or dtype != rows.dtype or len(shape) != 2 or shape[1] != rows.shape[1]:
+            return False
+
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {
+            'descr': np.lib.format.dtype_to_descr(dtype),
+            'fortran_order': False,
+            'shape': (shape[0] + len(rows), shape[1])
+        })
+        if header.tell() != header_size:
+            return False
+
+        f.seek(header_size + shape[0] * shape[1] * dtype.itemsize)
+        f.write(rows.tobytes())
+        f.flush()
+        f.seek(0)
+        f.write(header.getvalue())
+    return True
+
+
+class FlatVectorIndex:
+    """
+    暴力检索向量索引（精确top-k）
+
+    距离定义与ChromaDB相同：l2为欧氏距离的平方，ip为1-内积，cosine为1-余弦相似度。
+    新增的向量追加到按倍数扩容的行数组末尾，删除只把对应行标记为空位（ids中为None），
+    空位超过TOMBSTONE_COMPACT_RATIO时才压缩，增量维护的开销与变化的文档数成正比
+    """
+
+    def __init__(self, space: str = 'l2'):
+        """
+        初始化向量索引
+
+        Args:
+            space: 距离度量，l2 / ip / cosine
+        """
+        if space not in SUPPORTED_SPACES:
+            raise ValueError(f"不支持的距离度量: {space}")
+        self.space = space
+        # 按行号排列，已删除的行为None
+        self.ids: List[Optional[str]] = []
+        self.documents: List[Optional[str]] = []
+        self.metadatas: List[Optional[Dict[str, Any]]] = []
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self._id_index: Dict[str, int] = {}
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        # 各行是否有效，以及已删除的行数
+        self._live = np.zeros(0, dtype=bool)
+        self._removed = 0
+        # 行数组的预留缓冲区（属性名 -> 缓冲区），行数组是缓冲区前若干行的视图
+        self._buffers: Dict[str, np.ndarray] = {}
+
+        # 压缩编码（quantize启用）：近似距离用编码计算，float32向量只用于重算候选
+        self.quantizer = None
+        self.rescore_factor = RESCORE_FACTOR
+        self._codes = np.zeros((0, 0), dtype=np.uint8)
+        self._code_sq_norms = np.zeros(0, dtype=np.float32)
+        # float32向量的.npy文件路径（offload_embeddings设置），为None时向量保存在内存中
+        self.embeddings_path: Optional[str] = None
+        # 按行号对齐的元数据过滤位图，数据变化后按需重建
+        self._filter_index: Optional[MetadataBitmapIndex] = None
+
+    # === 构建与维护 ===
+
+    @classmethod
+    def from_collection(cls, collection, page_size: int = 5000) -> 'FlatVectorIndex':
+        """
+        从ChromaDB集合分页载入全部向量、文档和元数据
+
+        Args:
+            collection: ChromaDB集合
+            page_size: 每次从集合读取的记录数
+
+        Returns:
+            向量索引
+        """
+        space = (getattr(collection, 'metadata', None) or {}).get('hnsw:space', 'l2')
+        index = cls(space=space)
+
+        ids, documents, metadatas, pages = [], [], [], []
+        total = collection.count()
+        for offset in range(0, total, page_size):
+            page = collection.get(include=['embeddings', 'documents', 'metadatas'], limit=page_size, offset=offset)
+            if not page['ids']:
+                break
+            ids.extend(page['ids'])
+            documents.extend(page.get('documents') or [''] * len(page['ids']))
+            metadatas.extend(page.get('metadatas') or [None] * len(page['ids']))
+            pages.append(np.asarray(page['embeddings'], dtype=np.float32))
+
+        index._set_rows(ids, documents, metadatas, np.concatenate(pages) if pages else np.zeros((0, 0), dtype=np.float32))
+        return index
+
+    def _set_rows(self, ids: List[str], documents: List[str], metadatas: List[Any], embeddings: np.ndarray):
+        """替换全部数据并重算辅助数组"""
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self._id_index = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self._live = np.ones(len(self.ids), dtype=bool)
+        self._removed = 0
+        self._buffers = {}
+        self._filter_index = None
+        self._refresh()
+
+        if self.quantizer is not None:
+            self._encode_all()
+        if self.embeddings_path:
+            self.offload_embeddings(self.embeddings_path)
+
+    def _refresh(self):
+        """重算向量范数（l2距离展开式与cosine归一化使用；ip度量和启用压缩编码后不需要）"""
+        if self.quantizer is not None or self.space == 'ip' or len(self.embeddings) == 0:
+            self._sq_norms = np.zeros(0, dtype=np.float32)
+        else:
+            self._sq_norms = np.einsum('ij,ij->i', self.embeddings, self.embeddings)
+
+    def _append(self, name: str, values: np.ndarray, order: str = 'C'):
+        """
+        把values追加到行数组self.<name>的末尾：缓冲区容量不足时按两倍扩容，
+        否则直接写入预留的行，均摊开销与追加的行数成正比
+
+        Args:
+            name: 行数组的属性名
+            values: 追加的行
+            order: 缓冲区的内存布局（C按行连续，F按列连续）
+        """
+        current = getattr(self, name)
+        size = len(current) + len(values)
+        buffer = self._buffers.get(name)
+        if buffer is None or current.base is not buffer or len(buffer) < size:
+            capacity = max(size, 2 * len(current), _MIN_CAPACITY)
+            buffer = np.empty((capacity,) + values.shape[1:], dtype=values.dtype, order=order)
+            if len(current):
+                buffer[:len(current)] = current
+            self._buffers[name] = buffer
+        buffer[len(current):size] = values
+        setattr(self, name, buffer[:size])
+
+    def _append_embeddings(self, embeddings: np.ndarray):
+        """追加float32向量；向量内存映射到文件时只把新增的行追加到文件末尾"""
+        if (isinstance(self.embeddings, np.memmap) and len(self.embeddings)
+                and _append_array_rows(self.embeddings_path, embeddings)):
+            self.embeddings = np.load(self.embeddings_path, mmap_mode='r')
+            return
+        self._append('embeddings', embeddings)
+        if self.embeddings_path:
+            self.offload_embeddings(self.embeddings_path)
+
+    def upsert(self,
+               ids: List[str],
+               embeddings: Sequence[Sequence[float]],
+               documents: List[str],
+               metadatas: List[Any]):
+        """
+        新增或更新向量（已存在的ID先删除再追加到末尾，与集合的删除+新增一致）
+
+        Args:
+            ids: 文档ID
+            embeddings: 向量
+            documents: 文档内容
+            metadatas: 元数据
+        """
+        if not ids:
+            return
+        self.remove(ids)
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+
+        start = len(self.ids)
+        self.ids.extend(ids)
+        self.documents.extend(documents)
+        self.metadatas.extend(metadatas)
+        self._id_index.update((doc_id, start + i) for i, doc_id in enumerate(ids))
+        self._append('_live', np.ones(len(ids), dtype=bool))
+        self._append_embeddings(embeddings)
+        self._filter_index = None
+
+        if self.quantizer is None:
+            if self.space != 'ip':
+                self._append('_sq_norms', np.einsum('ij,ij->i', embeddings, embeddings))
+        elif not self.quantizer.is_trained:
+            self._encode_all()
+        else:
+            codes = self.quantizer.encode(embeddings)
+            self._append('_codes', codes, self.quantizer.code_order)
+            self._append('_code_sq_norms', self.quantizer.sq_norms(codes))
+
+    def remove(self, ids: List[str]) -> int:
+        """
+        删除向量（对应行标记为空位，空位过多时压缩）
+
+        Args:
+            ids: 文档ID
+
+        Returns:
+            删除的数量
+        """
+        rows = [self._id_index.pop(doc_id) for doc_id in dict.fromkeys(ids) if doc_id in self._id_index]
+        if not rows:
+            return 0
+        for row in rows:
+            self.ids[row] = None
+            self.documents[row] = None
+            self.metadatas[row] = None
+        self._live[rows] = False
+        self._removed += len(rows)
+        self._filter_index = None
+        if self._removed > TOMBSTONE_COMPACT_RATIO * len(self.ids):
+            self._compact()
+        return len(rows)
+
+    def _compact(self):
+        """去掉已删除的行并重排行号（向量内存映射到文件时重写该文件）"""
+        if not self._removed:
+            return
+        keep = np.flatnonzero(self._live)
+        self.ids = [self.ids[i] for i in keep]
+        self.documents = [self.documents[i] for i in keep]
+        self.metadatas = [self.metadatas[i] for i in keep]
+        self._id_index = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self._live = np.ones(len(keep), dtype=bool)
+        self._removed = 0
+        self._buffers = {}
+        self._filter_index = None
+
+        if len(self._sq_norms):
+            self._sq_norms = self._sq_norms[keep]
+        if self.quantizer is not None and len(self._codes):
+            self._codes = np.array(self._codes[keep], order=self.quantizer.code_order)
+            self._code_sq_norms = self._code_sq_norms[keep]
+        embeddings = np.ascontiguousarray(self.embeddings[keep], dtype=np.float32)
+        if isinstance(self.embeddings, np.memmap):
+            # 先释放旧的内存映射再重写文件
+            self.embeddings = embeddings
+            self.offload_embeddings(self.embeddings_path)
+        else:
+            self.embeddings = embeddings
+
+    def _live_rows(self) -> Optional[np.ndarray]:
+        """有效行的行号（升序）；没有已删除的行时返回None"""
+        return np.flatnonzero(self._live) if self._removed else None
+
+    def __len__(self) -> int:
+        return len(self._id_index)
+
+    @property
+    def memory_bytes(self) -> int:
+        """向量矩阵、压缩编码及辅助数组占用的内存（字节，内存映射的float32向量不计入）"""
+        total = self._sq_norms.nbytes + self._live.nbytes
+        if not self.embeddings_path:
+            total += self.embeddings.nbytes
+        if self.quantizer is not None:
+            total += self._codes.nbytes + self._code_sq_norms.nbytes + self.quantizer.nbytes
+        return total
+
+    # === 压缩编码 ===
+
+    def quantize(self, method: str = 'int8', pq_subspaces: Optional[int] = None):
+        """
+        启用压缩编码：训练量化器并编码全部向量，之后新增的向量沿用该量化器编码
+
+        Args:
+            method: int8（逐维量化，压缩4倍）/ pq（乘积量化，默认压缩16倍）
+            pq_subspaces: 乘积量化的子空间数（每个向量的编码字节数），None表示维度的1/4
+        """
+        self.quantizer = create_quantizer(method, pq_subspaces)
+        self._compact()
+        self._encode_all()
+        self._refresh()
+
+    def _encode_all(self):
+        """
+        编码全部行；量化器尚未训练时（启用后的第一批向量）先用当前全部向量训练
+        """
+        if len(self.ids) == 0:
+            self._codes = np.zeros((0, 0), dtype=np.uint8)
+            self._code_sq_norms = np.zeros(0, dtype=np.float32)
+            return
+        if not self.quantizer.is_trained:
+            self.quantizer.train(self.embeddings)
+        self._codes = np.array(self.quantizer.encode(self.embeddings), order=self.quantizer.code_order)
+        self._code_sq_norms = self.quantizer.sq_norms(self._codes)
+
+    def offload_embeddings(self, path: str):
+        """
+        把float32向量写入.npy文件并改为只读内存映射（启用压缩编码后只在精确重算时读取少量行）；
+        之后新增的向量只追加到文件末尾，删除的行在压缩时才重写该文件
+
+        Args:
+            path: 向量文件路径
+        """
+        if len(self.embeddings) and not (self.embeddings_path == path and isinstance(self.embeddings, np.memmap)):
+            _save_array(path, self.embeddings)
+            self.embeddings = np.load(path, mmap_mode='r')
+        self.embeddings_path = path
+
+    # === 检索 ===
+
+    def _distances(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        计算查询与向量的精确距离
+
+        Args:
+            queries: (查询数, 维度)
+            rows: 只计算这些行的距离（升序），None表示全部向量
+
+        Returns:
+            (查询数, 向量数或len(rows))
+        """
+        embeddings = self.embeddings if rows is None else self.embeddings[rows]
+        if self.space == 'ip':
+            sq_norms = None
+        elif len(self._sq_norms) == len(self.ids):
+            sq_norms = self._sq_norms if rows is None else self._sq_norms[rows]
+        else:
+            sq_norms = np.einsum('ij,ij->i', embeddings, embeddings)
+        return self._products_to_distances(queries, queries @ embeddings.T, sq_norms)
+
+    def _scan_distances(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        扫描阶段的距离：启用压缩编码时为编码解码后向量的近似距离，否则为精确距离
+        """
+        if self.quantizer is None:
+            return self._distances(queries, rows)
+        codes = self._codes if rows is None else self._codes[rows]
+        sq_norms = self._code_sq_norms if rows is None else self._code_sq_norms[rows]
+        return self._products_to_distances(queries, self.quantizer.inner_products(queries, codes), sq_norms)
+
+    def _products_to_distances(self, queries: np.ndarray, products: np.ndarray, sq_norms: np.ndarray) -> np.ndarray:
+        """由内积和向量平方范数计算距离"""
+        if self.space == 'ip':
+            return 1.0 - products
+        if self.space == 'cosine':
+            norms = np.sqrt(sq_norms)[None, :] * np.linalg.norm(queries, axis=1)[:, None]
+            return 1.0 - products / np.maximum(norms, np.finfo(np.float32).tiny)
+        q_norms = np.einsum('ij,ij->i', queries, queries)[:, None]
+        return np.maximum(q_norms + sq_norms[None, :] - 2.0 * products, 0.0)
+
+    def _top_k(self, distances: np.ndarray, n_results: int) -> np.ndarray:
+        """单个查询距离最小的n_results个向量的行号（按距离升序，同距离按行号）"""
+        if n_results < len(distances):
+            rows = np.argpartition(distances, n_results - 1)[:n_results]
+        else:
+            rows = np.arange(len(distances))
+        return rows[np.lexsort((rows, distances[rows]))]
+
+    def _select(self,
+                query: np.ndarray,
+                rows: Optional[np.ndarray],
+                distances: np.ndarray,
+                n_results: int) -> Dict[str, Any]:
+        """
+        从扫描阶段的距离中取top-k；启用压缩编码时先按近似距离保留rescore_factor倍候选，
+        再用float32向量精确重算这些候选的距离
+
+        Args:
+            query: 查询向量
+            rows: distances对应的行号（升序），None表示全部向量
+            distances: 扫描阶段的距离
+            n_results: 返回结果数量
+
+        Returns:
+            检索结果
+        """
+        if self.quantizer is not None:
+            shortlist = self._top_k(distances, max(n_results * self.rescore_factor, RESCORE_MIN_CANDIDATES))
+            rows = np.sort(shortlist if rows is None else rows[shortlist])
+            distances = self._distances(query[None, :], rows)[0]
+        top = self._top_k(distances, n_results)
+        return self._format(top if rows is None else rows[top], distances[top])
+
+    def _format(self, rows: np.ndarray, distances: np.ndarray) -> Dict[str, Any]:
+        """组装与collection.query相同的嵌套结果格式（distances与rows一一对应）"""
+        return {
+            'ids': [[self.ids[i] for i in rows]],
+            'documents': [[self.documents[i] for i in rows]],
+            'metadatas': [[self.metadatas[i] for i in rows]],
+            'distances': [[float(distance) for distance in distances]],
+            'embeddings': None
+        }
+
+    def filter_rows(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        满足元数据过滤条件的行号（升序）
+
+        Args:
+            filters: 过滤条件（见metadata_filter.normalize_filters）
+
+        Returns:
+            行号数组；没有过滤条件时返回None
+        """
+        if not filters:
+            return None
+        if self._filter_index is None:
+            # 已删除的行在位图中为空位，不满足任何过滤条件
+            self._filter_index = MetadataBitmapIndex(self.ids, self.metadatas)
+        mask = self._filter_index.mask(filters)
+        return self._live_rows() if mask is None else np.flatnonzero(mask)
+
+    def search_batch(self, 
+                     query_embeddings: np.ndarray, 
+                     n_results: int = 5,
+                     filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        批量检索（一次矩阵乘积计算全部查询的距离）
+
+        Args:
+            query_embeddings: (查询数, 维度)
+            n_results: 每个查询返回的结果数量
+            filters: 可选，元数据过滤条件；只计算满足条件的向量的距离
+
+        Returns:
+            与查询一一对应的检索结果
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        rows = self.filter_rows(filters)
+        if rows is None:
+            rows = self._live_rows()
+        if len(self) == 0 or n_results <= 0 or (rows is not None and len(rows) == 0):
+            return [self._format(np.zeros(0, dtype=np.int64), np.zeros(0)) for _ in range(len(queries))]
+
+        distances = self._scan_distances(queries, rows)
+        return [self._select(query, rows, row, n_results) for query, row in zip(queries, distances)]
+
+    def distances_to(self, query_embedding: np.ndarray, ids: Sequence[str]) -> np.ndarray:
+        """
+        查询与指定文档的精确距离（用于对其他通道召回的候选按语义排序）
+
+        Args:
+            query_embedding: 查询向量
+            ids: 文档ID
+
+        Returns:
+            与ids一一对应的距离，索引中不存在的文档为inf
+        """
+        distances = np.full(len(ids), np.inf)
+        positions = [i for i, doc_id in enumerate(ids) if doc_id in self._id_index]
+        if positions:
+            rows = np.array([self._id_index[ids[i]] for i in positions], dtype=np.int64)
+            order = np.argsort(rows)
+            query = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
+            distances[np.array(positions)[order]] = self._distances(query, rows[order])[0]
+        return distances
+
+    def search(self, 
+               query_embedding: np.ndarray, 
+               n_results: int = 5,
+               filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        检索距离最近的n_results个向量
+
+        Args:
+            query_embedding: 查询向量
+            n_results: 返回结果数量
+            filters: 可选，元数据过滤条件
+
+        Returns:
+            检索结果（格式与collection.query相同）
+        """
+        return self.search_batch(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1), n_results, filters)[0]
+
+
+class IVFVectorIndex(FlatVectorIndex):
+    """
+    倒排文件（IVF）近似向量索引
+
+    用k-means把向量划分为nlist个倒排列表，查询时先找最近的nprobe个聚类中心，
+    只计算这些列表中向量的精确距离。nprobe越大召回率越高、耗时越长，nprobe不小于nlist时等价于精确检索。
+    新增向量分配到已有的最近聚类中心，先放在倒排列表之外的末尾区间（查询时按分配结果筛选），
+    末尾区间超过IVF_TAIL_RATIO时并入倒排列表；向量数翻倍后重新训练
+    """
+
+    def __init__(self, space: str = 'l2', nlist: Optional[int] = None, nprobe: int = 8):
+        """
+        初始化IVF索引
+
+        Args:
+            space: 距离度量，l2 / ip / cosine
+            nlist: 倒排列表数，None表示按向量数自动选择（约4*sqrt(N)）
+            nprobe: 每次查询扫描的倒排列表数
+        """
+        super().__init__(space=space)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        # 各行所属的倒排列表（已删除的行为-1）
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._list_order = np.zeros(0, dtype=np.int64)
+        self._list_offsets = np.zeros(1, dtype=np.int64)
+        # 已并入倒排列表的行数，之后的行只在_assignments中
+        self._listed_rows = 0
+        self._fingerprint = CollectionFingerprint()
+
+    # === 构建与维护 ===
+
+    @classmethod
+    def from_collection(cls,
+                        collection,
+                        page_size: int = 5000,
+                        nlist: Optional[int] = None,
+                        nprobe: int = 8,
+                        path: Optional[str] = None,
+                        quantization: Optional[str] = None,
+                        pq_subspaces: Optional[int] = None) -> 'IVFVectorIndex':
+        """
+        从ChromaDB集合构建IVF索引；指定path时优先加载与集合一致的索引文件，重新训练后写回
+
+        Args:
+            collection: ChromaDB集合
+            page_size: 每次从集合读取的记录数
+            nlist: 倒排列表数，None表示自动选择
+            nprobe: 每次查询扫描的倒排列表数
+            path: 索引文件路径
+            quantization: 压缩编码方式，None / int8 / pq；指定path时float32向量以内存映射方式读取
+            pq_subspaces: 乘积量化的子空间数
+
+        Returns:
+            IVF索引
+        """
+        if path:
+            index = cls._load_for_collection(collection, path, page_size, nlist, nprobe, quantization, pq_subspaces)
+            if index is not None:
+                return index
+
+        index = super().from_collection(collection, page_size)
+        index.nlist = nlist
+        index.nprobe = nprobe
+        index.train()
+        if quantization:
+            index.quantize(quantization, pq_subspaces)
+        if path:
+            if quantization:
+                index.offload_embeddings(get_vectors_path(path))
+            index.save(path)
+        return index
+
+    def _effective_nlist(self) -> int:
+        """实际使用的倒排列表数"""
+        nlist = self.nlist or int(round(4 * np.sqrt(len(self))))
+        return max(1, min(nlist, len(self) // IVF_MIN_LIST_SIZE))
+
+    def _partition_vectors(self, vectors: np.ndarray) -> np.ndarray:
+        """用于聚类和分配的向量（cosine度量先归一化）"""
+        if self.space != 'cosine':
+            return vectors
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), np.finfo(np.float32).tiny)
+
+    def _nearest_centroids(self, vectors: np.ndarray, centroids: np.ndarray, n: int) -> np.ndarray:
+        """
+        每个向量最近的n个聚类中心
+
+        Args:
+            vectors: (向量数, 维度)，已经过_partition_vectors处理
+            centroids: (聚类中心数, 维度)
+            n: 返回的聚类中心数
+
+        Returns:
+            (向量数, n)，按距离从近到远
+        """
+        n = min(n, len(centroids))
+        c_norms = np.einsum('ij,ij->i', centroids, centroids) if self.space == 'l2' else None
+        nearest = np.empty((len(vectors), n), dtype=np.int64)
+        for start in range(0, len(vectors), _ASSIGN_BATCH):
+            products = vectors[start:start + _ASSIGN_BATCH] @ centroids.T
+            scores = c_norms[None, :] - 2.0 * products if c_norms is not None else -products
+            if n < len(centroids):
+                top = np.argpartition(scores, n - 1, axis=1)[:, :n]
+            else:
+                top = np.broadcast_to(np.arange(len(centroids)), scores.shape)
+            order = np.argsort(np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+            nearest[start:start + _ASSIGN_BATCH] = np.take_along_axis(top, order, axis=1)
+        return nearest
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """把向量分配到最近的聚类中心"""
+        if len(vectors) == 0:
+            return np.zeros(0, dtype=np.int32)
+        return self._nearest_centroids(self._partition_vectors(vectors), self.centroids, 1)[:, 0].astype(np.int32)
+
+    def train(self, iterations: int = 10, seed: int = 0):
+        """
+        用k-means训练聚类中心并重新划分全部向量（向量数少于IVF_MIN_VECTORS时不划分）
+
+        Args:
+            iterations: k-means迭代次数
+            seed: 随机种子（抽样与初始化），固定后结果可复现
+        """
+        self._compact()
+        nlist = self._effective_nlist()
+        if len(self) < IVF_MIN_VECTORS or nlist <= 1:
+            self.centroids = None
+            self.trained_size = 0
+            self._assignments = np.zeros(len(self), dtype=np.int32)
+            self._build_lists()
+            return
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(self), nlist * IVF_TRAIN_SAMPLES_PER_LIST)
+        data = self._partition_vectors(self.embeddings[np.sort(rng.choice(len(self), sample_size, replace=False))])
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = self._nearest_centroids(data, centroids, 1)[:, 0]
+            counts = np.bincount(labels, minlength=nlist)
+            order = np.argsort(labels, kind='stable')
+            filled = np.flatnonzero(counts)
+            starts = np.concatenate(([0], np.cumsum(counts[filled])[:-1]))
+            centroids[filled] = np.add.reduceat(data[order], starts, axis=0) / counts[filled, None]
+            # 空列表用随机样本重新初始化
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+            centroids = self._partition_vectors(centroids)
+
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.trained_size = len(self)
+        self._assignments = self._assign(self.embeddings)
+        self._build_lists()
+
+    def _set_rows(self, ids: List[str], documents: List[str], metadatas: List[Any], embeddings: np.ndarray):
+        """替换全部数据，向量分配到最近的聚类中心"""
+        super()._set_rows(ids, documents, metadatas, embeddings)
+        self._fingerprint = CollectionFingerprint.from_entries(self.ids, self.metadatas)
+        if self.centroids is not None:
+            self._assignments = self._assign(self.embeddings)
+        else:
+            self._assignments = np.zeros(len(self.ids), dtype=np.int32)
+        self._build_lists()
+
+    def _build_lists(self):
+        """按聚类中心重排行号，生成各倒排列表的起止偏移（已删除的行排在第一个列表之前）"""
+        nlist = len(self.centroids) if self.centroids is not None else 1
+        self._list_order = np.argsort(self._assignments, kind='stable')
+        self._list_offsets = np.searchsorted(self._assignments[self._list_order], np.arange(nlist + 1))
+        self._listed_rows = len(self._assignments)
+
+    def upsert(self,
+               ids: List[str],
+               embeddings: Sequence[Sequence[float]],
+               documents: List[str],
+               metadatas: List[Any]):
+        """
+        新增或更新向量；未训练的索引达到IVF_MIN_VECTORS或向量数超过训练时的两倍时重新训练
+        """
+        if not ids:
+            return
+        super().upsert(ids, embeddings, documents, metadatas)
+        for doc_id, metadata in zip(ids, metadatas):
+            self._fingerprint.add(doc_id, metadata)
+
+        if self.centroids is None:
+            assignments = np.zeros(len(ids), dtype=np.int32)
+        else:
+            assignments = self._assign(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        self._append('_assignments', assignments)
+
+        if self.centroids is None:
+            if len(self) >= IVF_MIN_VECTORS:
+                self.train()
+                return
+        elif len(self) > 2 * self.trained_size:
+            self.train()
+            return
+        if len(self.ids) - self._listed_rows > IVF_TAIL_RATIO * self._listed_rows:
+            self._build_lists()
+
+    def remove(self, ids: List[str]) -> int:
+        """删除向量（从集合指纹中减去，并移出所属的倒排列表）"""
+        for doc_id in dict.fromkeys(ids):
+            row = self._id_index.get(doc_id)
+            if row is not None:
+                self._fingerprint.remove(doc_id, self.metadatas[row])
+                self._assignments[row] = -1
+        return super().remove(ids)
+
+    def _compact(self):
+        """去掉已删除的行并重排行号，重建倒排列表"""
+        if not self._removed:
+            return
+        self._assignments = self._assignments[self._live]
+        super()._compact()
+        self._build_lists()
+
+    @property
+    def memory_bytes(self) -> int:
+        """向量矩阵、聚类中心和倒排列表占用的内存（字节）"""
+        centroid_bytes = self.centroids.nbytes if self.centroids is not None else 0
+        return super().memory_bytes + centroid_bytes + self._assignments.nbytes + self._list_order.nbytes
+
+    # === 检索 ===
+
+    def search_batch(self, 
+                     query_embeddings: np.ndarray, 
+                     n_results: int = 5,
+                     filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        批量近似检索：每个查询只计算最近nprobe个倒排列表中向量的距离
+
+        指定过滤条件时，满足条件的向量不多于nprobe个列表的平均规模则直接精确扫描这些向量；
+        否则只保留探查列表中满足条件的向量，不足n_results个时对该查询改为精确扫描
+
+        Args:
+            query_embeddings: (查询数, 维度)
+            n_results: 每个查询返回的结果数量
+            filters: 可选，元数据过滤条件
+
+        Returns:
+            与查询一一对应的检索结果
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if (self.centroids is None or self.nprobe >= len(self.centroids)
+                or len(self) == 0 or n_results <= 0):
+            return super().search_batch(queries, n_results, filters)
+
+        allowed = self._live if self._removed else None
+        filtered_rows = self.filter_rows(filters)
+        if filtered_rows is not None:
+            if len(filtered_rows) <= len(self) * self.nprobe / len(self.centroids):
+                return super().search_batch(queries, n_results, filters)
+            allowed = np.zeros(len(self.ids), dtype=bool)
+            allowed[filtered_rows] = True
+
+        probes = self._nearest_centroids(self._partition_vectors(queries), self.centroids, self.nprobe)
+        tail_assignments = self._assignments[self._listed_rows:]
+        results = []
+        for query, lists in zip(queries, probes):
+            segments = [self._list_order[self._list_offsets[l]:self._list_offsets[l + 1]] for l in lists]
+            if len(tail_assignments):
+                segments.append(self._listed_rows + np.flatnonzero(np.isin(tail_assignments, lists)))
+            rows = np.sort(np.concatenate(segments))
+            if allowed is not None:
+                rows = rows[allowed[rows]]
+                if filtered_rows is not None and len(rows) < n_results:
+                    rows = filtered_rows
+            distances = self._scan_distances(query[None, :], rows)[0]
+            results.append(self._select(query, rows, distances, n_results))
+        return results
+
+    # === 持久化 ===
+
+    def fingerprint(self) -> str:
+        """索引对应的集合指纹（文档ID与写入时间）"""
+        return self._fingerprint.hexdigest(IVF_VERSION)
+
+    def save(self, path: str):
+        """
+        保存聚类中心、列表分配和压缩编码（.npz），float32向量单独保存为同名.vectors.npy
+        （文档内容和元数据加载时从集合读取）；有已删除的行时先压缩
+
+        Args:
+            path: 索引文件路径（.npz）
+        """
+        self._compact()
+        vectors_path = get_vectors_path(path)
+        if self.embeddings_path != vectors_path:
+            _save_array(vectors_path, self.embeddings)
+
+        header = {
+            'version': IVF_VERSION,
+            'fingerprint': self.fingerprint(),
+            'space': self.space,
+            'nlist': self.nlist,
+            'trained_size': self.trained_size,
+            'row_count': len(self),
+            'quantization': self.quantizer.method if self.quantizer is not None else None,
+            'pq_subspaces': getattr(self.quantizer, 'subspaces', None)
+        }
+        arrays = {
+            'header': np.frombuffer(json.dumps(header).encode('utf-8'), dtype=np.uint8),
+            'ids': np.frombuffer(json.dumps(self.ids, ensure_ascii=False).encode('utf-8'), dtype=np.uint8),
+            'centroids': self.centroids if self.centroids is not None else np.zeros((0, 0), dtype=np.float32),
+            'assignments': self._assignments
+        }
+        if self.quantizer is not None and self.quantizer.is_trained:
+            arrays['codes'] = self._codes
+            arrays.update({f"quantizer_{name}": value for name, value in self.quantizer.get_state().items()})
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def _load_for_collection(cls,
+                             collection,
+                             path: str,
+                             page_size: int,
+                             nlist: Optional[int],
+                             nprobe: int,
+                             quantization: Optional[str] = None,
+                             pq_subspaces: Optional[int] = None) -> Optional['IVFVectorIndex']:
+        """
+        加载索引文件，文件与集合内容或列表数、压缩编码配置不一致时返回None
+
+        Returns:
+            IVF索引；文件不存在、版本不符或已过期时返回None
+        """
+        vectors_path = get_vectors_path(path)
+        if not os.path.exists(path) or not os.path.exists(vectors_path):
+            return None
+
+        try:
+            with np.load(path) as data:
+                header = json.loads(data['header'].tobytes().decode('utf-8'))
+                if (header.get('version') != IVF_VERSION or header.get('nlist') != nlist
+                        or header.get('quantization') != quantization
+                        or (quantization == 'pq' and pq_subspaces and header.get('pq_subspaces') != pq_subspaces)):
+                    print("IVF索引文件版本或列表数、压缩编码配置不一致，需要重建")
+                    return None
+
+                # 只读取集合的文档和元数据，向量从索引文件加载
+                entries = {}
+                total = collection.count()
+                for offset in range(0, total, page_size):
+                    page = collection.get(include=['documents', 'metadatas'], limit=page_size, offset=offset)
+                    if not page['ids']:
+                        break
+                    documents = page.get('documents') or [''] * len(page['ids'])
+                    metadatas = page.get('metadatas') or [None] * len(page['ids'])
+                    entries.update(zip(page['ids'], zip(documents, metadatas)))
+
+                ids = json.loads(data['ids'].tobytes().decode('utf-8'))
+                fingerprint = CollectionFingerprint.from_entries(entries, (metadata for _, metadata in entries.values()))
+                if header['fingerprint'] != fingerprint.hexdigest(IVF_VERSION):
+                    print("IVF索引文件与当前集合不一致，需要重建")
+                    return None
+
+                index = cls(space=header['space'], nlist=nlist, nprobe=nprobe)
+                centroids = data['centroids']
+                index.centroids = np.ascontiguousarray(centroids, dtype=np.float32) if centroids.size else None
+                index.trained_size = header['trained_size']
+                index.ids = ids
+                index.documents = [entries[doc_id][0] for doc_id in ids]
+                index.metadatas = [entries[doc_id][1] for doc_id in ids]
+                # 启用压缩编码时float32向量保持内存映射，只在精确重算候选时读取
+                embeddings = np.load(vectors_path, mmap_mode='r' if quantization else None)
+                if len(embeddings) != header['row_count'] or len(ids) != header['row_count']:
+                    print("IVF向量文件与索引文件不一致，需要重建")
+                    return None
+                index.embeddings = embeddings
+                index.embeddings_path = vectors_path if quantization else None
+                index._id_index = {doc_id: i for i, doc_id in enumerate(ids)}
+                index._live = np.ones(len(ids), dtype=bool)
+                index._fingerprint = fingerprint
+                index._assignments = np.asarray(data['assignments'], dtype=np.int32)
+                if quantization:
+                    index.quantizer = create_quantizer(quantization, pq_subspaces)
+                    index.quantizer.set_state({
+                        name[len('quantizer_'):]: data[name] for name in data.files if name.startswith('quantizer_')
+                    })
+                    index._codes = np.asarray(data['codes'], dtype=np.uint8)
+                    index._code_sq_norms = index.quantizer.sq_norms(index._codes)
+                index._refresh()
+                index._build_lists()
+                return index
+        except Exception as e:
+            print(f"⚠️ IVF索引文件加载失败: {e}，重新构建")
+            return None
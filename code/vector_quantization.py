@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+向量压缩编码
+ScalarQuantizer把每个维度线性量化为uint8（内存约为float32的1/4），
+ProductQuantizer把向量切分为若干子空间、每个子空间用256个中心的编号表示（每个子空间1字节）；
+两者都只用于计算近似内积，进程内向量索引再用float32向量对少量候选精确重算距离
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+
+# 计算近似内积时每批解码的行数（限制临时float32矩阵的内存）
+_DECODE_BATCH = 8192
+
+# 标量量化统计取值范围时使用的最多样本数
+QUANTIZER_TRAIN_SAMPLES = 65536
+
+# 乘积量化每个子空间的中心数（编号用uint8保存）
+PQ_CENTROIDS = 256
+
+# 乘积量化训练时每个中心使用的最多样本数
+PQ_TRAIN_SAMPLES_PER_CENTROID = 64
+
+SUPPORTED_QUANTIZATIONS = ('int8', 'pq')
+
+
+def _sample(vectors: np.ndarray, size: int, rng: np.random.Generator) -> np.ndarray:
+    """抽取训练样本（保持原有顺序）"""
+    if len(vectors) <= size:
+        return np.asarray(vectors, dtype=np.float32)
+    return np.asarray(vectors[np.sort(rng.choice(len(vectors), size, replace=False))], dtype=np.float32)
+
+
+def _columns(codes: np.ndarray) -> np.ndarray:
+    """按列连续的编码（各列已连续时不复制，如按列布局的缓冲区前若干行的视图）"""
+    return codes if codes.strides[0] == codes.itemsize else np.asfortranarray(codes)
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    欧氏距离k-means（Lloyd迭代）
+
+    Args:
+        data: (样本数, 维度)
+        k: 聚类中心数
+        iterations: 迭代次数
+        seed: 随机种子
+
+    Returns:
+        (k, 维度)的聚类中心
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        labels = nearest_centroid(data, centroids)
+        counts = np.bincount(labels, minlength=k)
+        filled = np.flatnonzero(counts)
+        order = np.argsort(labels, kind='stable')
+        starts = np.concatenate(([0], np.cumsum(counts[filled])[:-1]))
+        centroids[filled] = np.add.reduceat(data[order], starts, axis=0) / counts[filled, None]
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+def nearest_centroid(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """每个向量欧氏距离最近的聚类中心编号"""
+    c_norms = np.einsum('ij,ij->i', centroids, centroids)
+    labels = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), _DECODE_BATCH):
+        labels[start:start + _DECODE_BATCH] = np.argmin(
+            c_norms[None, :] - 2.0 * (data[start:start + _DECODE_BATCH] @ centroids.T), axis=1
+        )
+    return labels
+
+
+class ScalarQuantizer:
+    """
+    逐维线性量化：code = round((x - lower) / scale)，取值0~255
+    """
+
+    method = 'int8'
+    code_order = 'C'
+
+    def __init__(self):
+        self.lower: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+
+    def train(self, vectors: np.ndarray, seed: int = 0):
+        """
+        按样本每个维度的最小值和最大值确定量化区间
+
+        Args:
+            vectors: (向量数, 维度)
+            seed: 抽样随机种子
+        """
+        data = _sample(vectors, QUANTIZER_TRAIN_SAMPLES, np.random.default_rng(seed))
+        self.lower = data.min(axis=0)
+        span = data.max(axis=0) - self.lower
+        self.scale = np.where(span > 0, span / 255.0, 1.0).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """编码为(向量数, 维度)的uint8矩阵"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return np.clip(np.rint((vectors - self.lower) / self.scale), 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """解码为float32向量"""
+        return codes.astype(np.float32) * self.scale + self.lower
+
+    def inner_products(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """
+        查询与解码后向量的内积：q·x = q·lower + (q*scale)·code
+
+        Args:
+            queries: (查询数, 维度)
+            codes: (向量数, 维度)
+
+        Returns:
+            (查询数, 向量数)
+        """
+        offsets = queries @ self.lower
+        weighted = queries * self.scale
+        products = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), _DECODE_BATCH):
+            block = codes[start:start + _DECODE_BATCH].astype(np.float32)
+            products[:, start:start + len(block)] = weighted @ block.T
+        return products + offsets[:, None]
+
+    def sq_norms(self, codes: np.ndarray) -> np.ndarray:
+        """解码后向量的平方范数"""
+        norms = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _DECODE_BATCH):
+            block = self.decode(codes[start:start + _DECODE_BATCH])
+            norms[start:start + len(block)] = np.einsum('ij,ij->i', block, block)
+        return norms
+
+    @property
+    def is_trained(self) -> bool:
+        return self.lower is not None
+
+    @property
+    def nbytes(self) -> int:
+        return self.lower.nbytes + self.scale.nbytes
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        """可持久化的参数"""
+        return {'lower': self.lower, 'scale': self.scale}
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        """恢复get_state保存的参数"""
+        self.lower = np.asarray(state['lower'], dtype=np.float32)
+        self.scale = np.asarray(state['scale'], dtype=np.float32)
+
+
+class ProductQuantizer:
+    """
+    乘积量化：向量切分为subspaces段，每段用该子空间k-means中心的编号（uint8）表示
+    """
+
+    method = 'pq'
+    # 编码按列存储，查表时每个子空间的编号是连续内存
+    code_order = 'F'
+
+    def __init__(self, subspaces: Optional[int] = None):
+        """
+        Args:
+            subspaces: 子空间数（每个向量的编码字节数），None表示维度的1/4（压缩16倍）；
+                       不能整除维度时取不超过该值的最大约数
+        """
+        self.subspaces = subspaces
+        self.centroids: Optional[np.ndarray] = None  # (子空间数, 256, 子空间维度)
+        self._centroid_sq_norms: Optional[np.ndarray] = None
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """(向量数, 维度) -> (向量数, 子空间数, 子空间维度)"""
+        return np.asarray(vectors, dtype=np.float32).reshape(len(vectors), len(self.centroids), -1)
+
+    def train(self, vectors: np.ndarray, seed: int = 0):
+        """
+        每个子空间独立训练k-means
+
+        Args:
+            vectors: (向量数, 维度)
+            seed: 随机种子
+        """
+        dim = vectors.shape[1]
+        subspaces = min(self.subspaces or max(1, dim // 4), dim)
+        while dim % subspaces:
+            subspaces -= 1
+        self.subspaces = subspaces
+
+        data = _sample(vectors, PQ_CENTROIDS * PQ_TRAIN_SAMPLES_PER_CENTROID, np.random.default_rng(seed))
+        data = data.reshape(len(data), subspaces, -1)
+        centroids = np.zeros((subspaces, PQ_CENTROIDS, dim // subspaces), dtype=np.float32)
+        for j in range(subspaces):
+            trained = kmeans(np.ascontiguousarray(data[:, j]), PQ_CENTROIDS, seed=seed + j)
+            centroids[j, :len(trained)] = trained
+            # 样本不足256个时，多余的中心复制第一个中心（不会被编码使用）
+            centroids[j, len(trained):] = trained[0]
+        self.set_state({'centroids': centroids})
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """编码为(向量数, 子空间数)的uint8矩阵"""
+        parts = self._split(vectors)
+        codes = np.empty((len(parts), len(self.centroids)), dtype=np.uint8)
+        for j in range(len(self.centroids)):
+            codes[:, j] = nearest_centroid(np.ascontiguousarray(parts[:, j]), self.centroids[j])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """解码为float32向量"""
+        parts = self.centroids[np.arange(len(self.centroids))[None, :], codes]
+        return parts.reshape(len(codes), -1)
+
+    def inner_products(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """
+        查询与解码后向量的内积：先算每个子空间查询与256个中心的内积表，再按编号查表求和
+
+        Args:
+            queries: (查询数, 维度)
+            codes: (向量数, 子空间数)
+
+        Returns:
+            (查询数, 向量数)
+        """
+        tables = np.einsum('bjd,jkd->bjk', self._split(queries), self.centroids)
+        columns = _columns(codes)
+        products = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for b in range(len(queries)):
+            for j in range(len(self.centroids)):
+                products[b] += tables[b, j].take(columns[:, j])
+        return products
+
+    def sq_norms(self, codes: np.ndarray) -> np.ndarray:
+        """解码后向量的平方范数（子空间中心范数之和）"""
+        columns = _columns(codes)
+        norms = np.zeros(len(codes), dtype=np.float32)
+        for j in range(len(self.centroids)):
+            norms += self._centroid_sq_norms[j].take(columns[:, j])
+        return norms
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def nbytes(self) -> int:
+        return self.centroids.nbytes + self._centroid_sq_norms.nbytes
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        """可持久化的参数"""
+        return {'centroids': self.centroids}
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        """恢复get_state保存的参数"""
+        self.centroids = np.ascontiguousarray(state['centroids'], dtype=np.float32)
+        self.subspaces = len(self.centroids)
+        self._centroid_sq_norms = np.einsum('jkd,jkd->jk', self.centroids, self.centroids)
+
+
+def create_quantizer(method: str, pq_subspaces: Optional[int] = None):
+    """
+    创建向量量化器
+
+    Args:
+        method: int8 / pq
+        pq_subspaces: 乘积量化的子空间数
+
+    Returns:
+        未训练的量化器
+    """
+    if method == 'int8':
+        return ScalarQuantizer()
+    if method == 'pq':
+        return ProductQuantizer(pq_subspaces)
+    raise ValueError(f"不支持的向量量化方式: {method}")
@@ -1,10 +1,38 @@
 import json
+import hashlib
 import chromadb
 from FlagEmbedding import FlagModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
 import os
+import time
 from datetime import datetime, timedelta
 import re
+import numpy as np
+import bm25_index
+from embedding_cache import QueryEmbeddingCache
+from vector_index import FlatVectorIndex, IVFVectorIndex
+from interval_index import TimeIntervalIndex
+from metadata_filter import MetadataBitmapIndex
+
+# 预热用的示例查询（覆盖短问句、带时间的问句和较长的描述性问句）
+WARMUP_QUERIES = [
+    "什么是向量检索？",
+    "老师在00:15:30左右讲了哪些关于聚类算法的内容？",
+    "请总结课程中关于检索增强生成系统的设计思路、主要模块以及评估方法，并说明各模块之间如何协作。",
+]
+
+# 预热用的示例文档块（长度从一句话到接近一个完整文档块）
+WARMUP_PASSAGES = [
+    "今天我们讨论信息检索的基本概念。",
+    "倒排索引记录每个词出现在哪些文档中，查询时只需要合并相关词的倒排列表，"
+    "再按BM25等打分函数排序，就能快速找到包含查询词的文档。" * 3,
+    "向量检索把查询和文档编码为稠密向量，通过内积或余弦相似度衡量语义相关性；"
+    "为了在大规模数据上保持低延迟，通常使用倒排文件、乘积量化等近似最近邻方法，"
+    "并在召回的少量候选上精确重算距离。" * 8,
+]
+
+# 批量入库时每写入多少批把IVF索引文件和BM25快照的变化写入磁盘（其余批次只更新内存中的索引）
+INDEX_FLUSH_BATCHES = 16
 
 class ChunkVectorizer:
     """
@@ -12,35 +40,119 @@ class ChunkVectorizer:
     支持时间戳转换，便于时间范围查询
     """
     
-    def __init__(self, model_name: str = "e:\\PyProjects\\QASystem\\code\\model", collection_name: str = "qa_system_chunks"):
+    def __init__(self, model_name: str = "e:\\PyProjects\\QASystem\\code\\model", collection_name: str = "qa_system_chunks",
+                 query_cache_size: int = 1024, query_cache_ttl: float = 3600):
         """
         初始化向量化器
         
         Args:
             model_name: FlagEmbedding模型名称或本地路径
             collection_name: ChromaDB集合名称
+            query_cache_size: 查询向量缓存的最大条目数（0表示不缓存）
+            query_cache_ttl: 查询向量缓存的过期时间（秒）
         """
         self.model_name = model_name
         self.collection_name = collection_name
         self.model = None
         self.client = None
         self.collection = None
+        self.persist_directory = None
+        
+        # 词法索引监听器：入库/删除后回调 listener(upserts, deletions) -> bool
+        self._index_listeners: List[Callable[[List[Dict[str, Any]], List[str]], bool]] = []
+        
+        # 批量入库期间推迟写入磁盘的索引变化（见flush_index_changes）
+        self._defer_index_saves = False
+        self._vector_index_dirty = False
+        self._pending_snapshot_changes: Optional[Dict[str, Any]] = None
+        
+        # 查询向量缓存：规范化查询文本 -> float32向量
+        self.query_cache = QueryEmbeddingCache(max_size=query_cache_size, ttl_seconds=query_cache_ttl)
+        
+        # 进程内向量索引：为None时向量检索直接查询ChromaDB
+        self.vector_index = None
+        
+        # 时间区间索引与元数据过滤位图：首次使用时从集合元数据构建，入库/删除后增量维护
+        self.time_index: Optional[TimeIntervalIndex] = None
+        self.filter_index: Optional[MetadataBitmapIndex] = None
         
-    def load_model(self):
+        # 模型加载与预热状态（秒）
+        self.model_load_time: Optional[float] = None
+        self.warmup_time: Optional[float] = None
+        self.warmed_up = False
+        
+    def load_model(self, force: bool = False):
         """
-        加载FlagEmbedding模型
+        加载FlagEmbedding模型（已加载时直接复用）
+        
+        Args:
+            force: 是否强制重新加载
         """
+        if self.model is not None and not force:
+            return
         try:
             print(f"正在加载模型: {self.model_name}")
+            start_time = time.perf_counter()
             self.model = FlagModel(self.model_name, 
                                  query_instruction_for_retrieval="为这个句子生成表示以用于检索相关文章：",
                                  use_fp16=True)  # 使用fp16加速
-            print("模型加载成功")
+            self.model_load_time = time.perf_counter() - start_time
+            self.warmup_time = None
+            self.warmed_up = False
+            self.query_cache.clear()
+            print(f"模型加载成功，耗时{self.model_load_time:.2f}秒")
         except Exception as e:
             print(f"模型加载失败: {e}")
             print("请确保已安装FlagEmbedding: pip install FlagEmbedding")
             raise
     
+    def warm_up(self, rounds: int = 2,
+                queries: Optional[List[str]] = None,
+                passages: Optional[List[str]] = None) -> float:
+        """
+        用示例文本预热编码模型
+        
+        首次编码会触发分词器初始化、计算图构建和显存分配，预热后第一个真实查询不再承担这部分开销。
+        预热直接调用模型，不写入查询向量缓存
+        
+        Args:
+            rounds: 预热轮数（每轮都编码全部示例查询和文档块）
+            queries: 示例查询，None表示使用WARMUP_QUERIES
+            passages: 示例文档块，None表示使用WARMUP_PASSAGES
+            
+        Returns:
+            预热耗时（秒）
+        """
+        self.load_model()
+        queries = queries or WARMUP_QUERIES
+        passages = passages or WARMUP_PASSAGES
+        
+        start_time = time.perf_counter()
+        for _ in range(max(rounds, 1)):
+            # 单条查询与批量查询走不同的批大小，两种形状都预热
+            self.model.encode_queries(queries[:1])
+            self.model.encode_queries(queries)
+            self.model.encode(passages)
+        self.warmup_time = time.perf_counter() - start_time
+        self.warmed_up = True
+        print(f"✅ 模型预热完成: {max(rounds, 1)}轮，耗时{self.warmup_time:.2f}秒")
+        return self.warmup_time
+    
+    def get_model_status(self) -> Dict[str, Any]:
+        """
+        获取模型加载与预热状态
+        
+        Returns:
+            是否已加载、是否已预热及各阶段耗时（秒）
+        """
+        return {
+            'model_name': self.model_name,
+            'loaded': self.model is not None,
+            'warmed_up': self.warmed_up,
+            'load_time': self.model_load_time,
+            'warmup_time': self.warmup_time
+        }
+    
     def init_chromadb(self, persist_directory: str = "./chroma_db"):
         """
         初始化ChromaDB客户端和集合
@@ -53,6 +165,7 @@ class ChunkVectorizer:
             
             # 创建持久化客户端
             self.client = chromadb.PersistentClient(path=persist_directory)
+            self.persist_directory = persist_directory
             
             # 获取或创建集合
             try:
@@ -70,6 +183,243 @@ class ChunkVectorizer:
             print("请确保已安装chromadb: pip install chromadb")
             raise
     
+    def get_index_directory(self) -> str:
+        """
+        获取派生索引（BM25快照等）的存放目录：与ChromaDB目录同级的"<目录名>_indexes"
+        
+        Returns:
+            索引目录路径，ChromaDB未初始化时返回None
+        """
+        if not self.persist_directory:
+            return None
+        return bm25_index.get_index_directory(self.persist_directory)
+    
+    def get_bm25_snapshot_path(self) -> Optional[str]:
+        """
+        获取当前集合的BM25快照路径
+        
+        Returns:
+            快照路径，ChromaDB未初始化时返回None
+        """
+        if not self.persist_directory:
+            return None
+        return bm25_index.get_snapshot_path(self.persist_directory, self.collection_name)
+    
+    def get_vector_index_path(self) -> Optional[str]:
+        """
+        获取当前集合的IVF向量索引文件路径
+        
+        Returns:
+            索引文件路径，ChromaDB未初始化时返回None
+        """
+        if not self.persist_directory:
+            return None
+        return os.path.join(self.get_index_directory(), f"{self.collection_name}.ivf.npz")
+    
+    def build_vector_index(self, 
+                           backend: str = "flat", 
+                           nlist: Optional[int] = None, 
+                           nprobe: int = 8,
+                           quantization: Optional[str] = None,
+                           pq_subspaces: Optional[int] = None) -> bool:
+        """
+        选择向量检索后端：flat为进程内精确向量索引（一次性载入全部向量），
+        ivf为进程内近似向量索引（持久化到索引目录），chromadb为直接查询集合
+        
+        Args:
+            backend: 向量检索后端，flat / ivf / chromadb
+            nlist: IVF倒排列表数，None表示按向量数自动选择
+            nprobe: IVF每次查询扫描的倒排列表数（越大召回率越高、越慢）
+            quantization: 进程内索引的压缩编码，None / int8 / pq；启用后内存中只保留编码，
+                          float32向量写入索引目录并内存映射，仅用于精确重算候选距离
+            pq_subspaces: 乘积量化的子空间数（每个向量的编码字节数），None表示维度的1/4
+            
+        Returns:
+            是否启用了进程内向量索引
+        """
+        if backend == "chromadb":
+            self.vector_index = None
+            return False
+        if backend not in ("flat", "ivf"):
+            raise ValueError(f"未知的向量检索后端: {backend}")
+        
+        # 先释放旧索引（其内存映射的向量文件可能被重写）
+        self.vector_index = None
+        try:
+            start_time = datetime.now()
+            if backend == "ivf":
+                self.vector_index = IVFVectorIndex.from_collection(
+                    self.collection, nlist=nlist, nprobe=nprobe, path=self.get_vector_index_path(),
+                    quantization=quantization, pq_subspaces=pq_subspaces
+                )
+            else:
+                self.vector_index = FlatVectorIndex.from_collection(self.collection)
+                if quantization:
+                    self.vector_index.quantize(quantization, pq_subspaces)
+                    if self.persist_directory:
+                        self.vector_index.offload_embeddings(
+                            os.path.join(self.get_index_directory(), f"{self.collection_name}.vectors.npy")
+                        )
+            load_time = (datetime.now() - start_time).total_seconds()
+            print(f"✅ 进程内向量索引({backend}{'/' + quantization if quantization else ''})已加载: {len(self.vector_index)}个向量，"
+                  f"{self.vector_index.memory_bytes / 1024 / 1024:.1f}MB，耗时{load_time:.2f}秒")
+            return True
+        except Exception as e:
+            print(f"⚠️ 进程内向量索引加载失败，改为直接查询ChromaDB: {e}")
+            self.vector_index = None
+            return False
+    
+    def build_metadata_indexes(self, page_size: int = 5000) -> bool:
+        """
+        分页读取集合元数据（不读取向量和文档），构建时间区间索引和元数据过滤位图
+        
+        Args:
+            page_size: 每次从集合读取的记录数
+            
+        Returns:
+            是否构建成功
+        """
+        try:
+            time_index = TimeIntervalIndex()
+            filter_index = MetadataBitmapIndex()
+            total = self.collection.count()
+            for offset in range(0, total, page_size):
+                page = self.collection.get(include=['metadatas'], limit=page_size, offset=offset)
+                if not page['ids']:
+                    break
+                metadatas = page.get('metadatas') or [None] * len(page['ids'])
+                time_index.upsert(page['ids'], metadatas)
+                filter_index.upsert(page['ids'], metadatas)
+            self.time_index = time_index
+            self.filter_index = filter_index
+            print(f"✅ 元数据索引构建完成: {len(filter_index)}个文档块，其中{len(time_index)}个带时间戳")
+            return True
+        except Exception as e:
+            print(f"⚠️ 元数据索引构建失败: {e}")
+            self.time_index = None
+            self.filter_index = None
+            return False
+    
+    def _save_vector_index(self):
+        """入库/删除后写回IVF索引文件，保证下次启动时与集合一致（批量入库期间推迟到flush_index_changes）"""
+        if self._defer_index_saves:
+            self._vector_index_dirty = True
+            return
+        self._write_vector_index()
+    
+    def _write_vector_index(self):
+        """写入IVF索引文件"""
+        self._vector_index_dirty = False
+        path = self.get_vector_index_path()
+        if not isinstance(self.vector_index, IVFVectorIndex) or not path:
+            return
+        try:
+            self.vector_index.save(path)
+        except Exception as e:
+            print(f"⚠️ IVF索引文件保存失败: {e}")
+    
+    def _defer_snapshot_changes(self, 
+                                upserts: List[Dict[str, Any]], 
+                                deletions: List[str], 
+                                entries: Dict[str, Any]):
+        """
+        合并推迟写入BM25快照的变化：同一文档只保留最后一次写入或删除，
+        变化前的元数据保留第一次变化之前的（与快照中的指纹对应）
+        """
+        pending = self._pending_snapshot_changes
+        if pending is None:
+            pending = self._pending_snapshot_changes = {'entries': {}, 'changes': {}}
+        affected = [chunk['id'] for chunk in upserts] + list(deletions)
+        for doc_id in affected:
+            if doc_id not in pending['changes'] and doc_id in entries:
+                pending['entries'][doc_id] = entries[doc_id]
+        for doc_id in deletions:
+            pending['changes'][doc_id] = None
+        for chunk in upserts:
+            pending['changes'][chunk['id']] = chunk
+    
+    def flush_index_changes(self):
+        """把批量入库期间推迟的IVF索引文件和BM25快照的变化写入磁盘"""
+        pending = self._pending_snapshot_changes
+        self._pending_snapshot_changes = None
+        if pending and pending['changes']:
+            changes = pending['changes']
+            bm25_index.update_snapshot(
+                self.get_bm25_snapshot_path(),
+                pending['entries'],
+                upserts=[(chunk['id'], chunk['document'], chunk['metadata']) for chunk in changes.values() if chunk],
+                deletions=[doc_id for doc_id, chunk in changes.items() if chunk is None]
+            )
+        if self._vector_index_dirty:
+            self._write_vector_index()
+    
+    def add_index_listener(self, listener: Callable[[List[Dict[str, Any]], List[str]], bool]):
+        """
+        注册词法索引监听器：集合中的文档新增、更新或删除后回调
+        
+        Args:
+            listener: listener(upserts, deletions)，upserts为[{'id', 'document', 'metadata'}]，
+                      deletions为文档ID列表；返回True表示已同步（含磁盘快照）
+        """
+        if listener not in self._index_listeners:
+            self._index_listeners.append(listener)
+    
+    def remove_index_listener(self, listener):
+        """注销词法索引监听器"""
+        if listener in self._index_listeners:
+            self._index_listeners.remove(listener)
+    
+    def _get_snapshot_entries(self, 
+                              ids: List[str], 
+                              stored_metadatas: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        变化前受影响文档的 {doc_id: metadata}，只在需要直接更新磁盘上的BM25快照时读取
+        （有常驻的搜索系统或快照不存在时返回None）；快照中的指纹按这些文档增量更新，不读取整个集合
+        
+        Args:
+            ids: 将被写入或删除的文档ID
+            stored_metadatas: 可选，已按这些ID查询到的元数据（不再重复查询）
+        """
+        snapshot_path = self.get_bm25_snapshot_path()
+        if self._index_listeners or not snapshot_path or not os.path.exists(snapshot_path):
+            return None
+        if stored_metadatas is None:
+            stored_metadatas = self._get_stored_metadatas(ids)
+        return {doc_id: stored_metadatas[doc_id] for doc_id in ids if doc_id in stored_metadatas}
+    
+    def _sync_lexical_index(self, 
+                            upserts: List[Dict[str, Any]], 
+                            deletions: List[str], 
+                            entries: Optional[Dict[str, Any]] = None):
+        """
+        将集合变化同步到BM25索引：优先交给常驻的搜索系统，否则直接增量更新磁盘快照
+        
+        Args:
+            upserts: 新增或更新的文档 [{'id', 'document', 'metadata'}]
+            deletions: 删除的文档ID
+            entries: 变化前受影响文档的 {doc_id: metadata}，更新磁盘快照时用于增量更新指纹
+        """
+        if not upserts and not deletions:
+            return
+        
+        handled = False
+        for listener in list(self._index_listeners):
+            try:
+                handled = listener(upserts, deletions) or handled
+            except Exception as e:
+                print(f"词法索引同步失败: {e}")
+        
+        if not handled and entries is not None:
+            if self._defer_index_saves:
+                self._defer_snapshot_changes(upserts, deletions, entries)
+                return
+            bm25_index.update_snapshot(
+                self.get_bm25_snapshot_path(),
+                entries,
+                upserts=[(chunk['id'], chunk['document'], chunk['metadata']) for chunk in upserts],
+                deletions=deletions
+            )
+    
     def load_processed_data(self, json_file_path: str) -> Dict[str, Any]:
         """
         加载处理后的JSON数据
@@ -241,29 +591,101 @@ class ChunkVectorizer:
             
         return metadata
     
-    def vectorize_chunks(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    @staticmethod
+    def compute_chunk_hash(document: str, metadata: Dict[str, Any]) -> str:
         """
-        对所有chunks进行向量化
+        文档块内容哈希：文档内容与元数据（写入时间除外）都不变时哈希不变
         
         Args:
-            data: 完整的数据字典
+            document: 文档内容
+            metadata: 元数据
             
         Returns:
-            向量化结果列表
+            十六进制哈希字符串
+        """
+        stable_metadata = {key: value for key, value in metadata.items() if key not in ('created_at', 'content_hash')}
+        return bm25_index.content_hash(
+            f"{document}\x00{json.dumps(stable_metadata, ensure_ascii=False, sort_keys=True)}"
+        )
+    
+    def _get_stored_metadatas(self, ids: List[str]) -> Dict[str, Any]:
+        """
+        只按ID查询集合中已有文档的元数据（不读取文档内容和向量）
+        
+        Returns:
+            {doc_id: metadata}，集合中不存在的ID不包含在结果中
+        """
+        if self.collection is None or not ids:
+            return {}
+        existing = self.collection.get(ids=list(dict.fromkeys(ids)), include=['metadatas'])
+        metadatas = existing.get('metadatas') or [None] * len(existing['ids'])
+        return dict(zip(existing['ids'], metadatas))
+    
+    def _get_stored_hashes(self, ids: List[str]) -> Dict[str, Optional[str]]:
+        """
+        只按ID查询集合中已有文档的内容哈希（不读取文档内容和向量）
+        
+        Returns:
+            {doc_id: content_hash}，集合中不存在的ID不包含在结果中；旧数据没有哈希时为None
+        """
+        return {doc_id: (metadata or {}).get('content_hash') for doc_id, metadata in self._get_stored_metadatas(ids).items()}
+    
+    def iter_vectorized_batches(self, 
+                                data: Dict[str, Any], 
+                                batch_size: int = 256,
+                                skip_batches: int = 0,
+                                skip_unchanged: bool = True) -> Iterator[List[Dict[str, Any]]]:
+        """
+        按批向量化chunks：每凑满batch_size个有效chunk编码一次并立即产出，
+        内存中只保留当前一批的文本和向量
+        
+        Args:
+            data: 完整的数据字典
+            batch_size: 每批编码的chunk数量
+            skip_batches: 跳过前多少批（已写入的批次，不再编码）
+            skip_unchanged: 是否跳过集合中内容哈希相同的chunk（不编码也不产出）
+            
+        Yields:
+            向量化结果列表 [{'id', 'document', 'embedding', 'metadata'}]，
+            每批都会产出（整批未变化时为空列表），便于调用方按批次记录进度
         """
         chunks = data.get('chunks', [])
         source_file = data.get('source_file', '')
         
         if not chunks:
             print("没有找到chunks数据")
-            return []
+            return
         
-        print(f"开始向量化 {len(chunks)} 个chunks")
+        print(f"开始向量化 {len(chunks)} 个chunks（每批 {batch_size} 个）")
         
-        # 提取所有chunk的文本内容
-        chunk_texts = []
-        chunk_metadata_list = []
-        chunk_ids = []
+        batch_number = 0
+        encoded_count = 0
+        unchanged_count = 0
+        pending = []
+        
+        def encode_pending() -> List[Dict[str, Any]]:
+            nonlocal unchanged_count
+            batch = pending
+            if skip_unchanged:
+                stored_hashes = self._get_stored_hashes([chunk_id for chunk_id, _, _ in batch])
+                batch = [item for item in batch if stored_hashes.get(item[0]) != item[2]['content_hash']]
+                unchanged_count += len(pending) - len(batch)
+            if not batch:
+                return []
+            try:
+                embeddings = self.model.encode([text for _, text, _ in batch])
+            except Exception as e:
+                print(f"向量生成失败: {e}")
+                raise
+            return [
+                {
+                    'id': chunk_id,
+                    'document': text,
+                    'embedding': embedding.tolist(),  # 转换为列表格式
+                    'metadata': metadata
+                }
+                for (chunk_id, text, metadata), embedding in zip(batch, embeddings)
+            ]
         
         for chunk in chunks:
             # 提取文本内容
@@ -271,50 +693,55 @@ class ChunkVectorizer:
             if not content.strip():
                 print(f"警告: Chunk {chunk.get('chunk_id', 'unknown')} 内容为空，跳过")
                 continue
-                
-            chunk_texts.append(content)
-            
-            # 准备元数据
-            metadata = self.prepare_metadata(chunk, source_file)
-            chunk_metadata_list.append(metadata)
             
             # 使用chunk_id作为主键
             chunk_id = chunk.get('chunk_id')
             if not chunk_id:
                 # 如果没有chunk_id，生成一个，但这通常不应该发生
-                chunk_id = f"generated_id_{len(chunk_ids) + 1}"
+                chunk_id = f"generated_id_{batch_number * batch_size + len(pending) + 1}"
                 print(f"警告: Chunk缺少ID，已生成: {chunk_id}")
-            chunk_ids.append(chunk_id)
+            
+            # 已写入的批次只计数，不准备元数据也不编码
+            if batch_number < skip_batches:
+                pending.append((chunk_id, None, None))
+            else:
+                metadata = self.prepare_metadata(chunk, source_file)
+                metadata['content_hash'] = self.compute_chunk_hash(content, metadata)
+                pending.append((chunk_id, content, metadata))
+            
+            if len(pending) == batch_size:
+                if batch_number >= skip_batches:
+                    batch = encode_pending()
+                    encoded_count += len(batch)
+                    print(f"已向量化第 {batch_number + 1} 批，累计 {encoded_count} 个chunks，{unchanged_count} 个未变化")
+                    yield batch
+                batch_number += 1
+                pending = []
         
-        if not chunk_texts:
+        if pending and batch_number >= skip_batches:
+            batch = encode_pending()
+            encoded_count += len(batch)
+            print(f"已向量化第 {batch_number + 1} 批，累计 {encoded_count} 个chunks，{unchanged_count} 个未变化")
+            yield batch
+        elif batch_number == 0 and not pending:
             print("没有有效的chunk文本内容")
-            return []
-        
-        # 批量生成向量
-        print("正在生成向量...")
-        try:
-            embeddings = self.model.encode(chunk_texts)
-            print(f"成功生成 {len(embeddings)} 个向量")
-        except Exception as e:
-            print(f"向量生成失败: {e}")
-            raise
+    
+    def vectorize_chunks(self, data: Dict[str, Any], batch_size: int = 256) -> List[Dict[str, Any]]:
+        """
+        对所有chunks进行向量化（一次性返回全部结果；大文件入库请使用iter_vectorized_batches）
         
-        # 组装结果
-        vectorized_chunks = []
-        for i, (chunk_id, text, embedding, metadata) in enumerate(
-            zip(chunk_ids, chunk_texts, embeddings, chunk_metadata_list)
-        ):
-            vectorized_chunk = {
-                'id': chunk_id,
-                'document': text,
-                'embedding': embedding.tolist(),  # 转换为列表格式
-                'metadata': metadata
-            }
-            vectorized_chunks.append(vectorized_chunk)
+        Args:
+            data: 完整的数据字典
+            batch_size: 每批编码的chunk数量
             
-            if (i + 1) % 10 == 0:
-                print(f"已处理 {i + 1}/{len(chunk_texts)} 个chunks")
-        
+        Returns:
+            向量化结果列表
+        """
+        vectorized_chunks = []
+        for batch in self.iter_vectorized_batches(data, batch_size, skip_unchanged=False):
+            vectorized_chunks.extend(batch)
+        if vectorized_chunks:
+            print(f"成功生成 {len(vectorized_chunks)} 个向量")
         return vectorized_chunks
     
     def store_to_chromadb(self, vectorized_chunks: List[Dict[str, Any]]) -> bool:
@@ -334,33 +761,36 @@ class ChunkVectorizer:
         try:
             print(f"正在存储 {len(vectorized_chunks)} 条记录到ChromaDB")
             
-            # 检查是否有重复的chunk_id
-            existing_ids = set()
+            # 只按本批ID查询已有记录的元数据（内容哈希）
+            stored_metadatas = None
+            stored_hashes = {}
             try:
-                # 获取现有的所有ID
-                existing_data = self.collection.get()
-                existing_ids = set(existing_data['ids'])
-                print(f"发现 {len(existing_ids)} 条现有记录")
-            except:
-                print("集合为空或获取现有数据失败")
+                stored_metadatas = self._get_stored_metadatas([chunk['id'] for chunk in vectorized_chunks])
+                stored_hashes = {doc_id: (metadata or {}).get('content_hash') for doc_id, metadata in stored_metadatas.items()}
+                print(f"发现 {len(stored_hashes)} 条现有记录")
+            except Exception as e:
+                print(f"查询现有记录失败: {e}")
             
-            # 过滤掉重复的记录
+            # 区分新增、更新和内容未变化的记录
             new_chunks = []
             updated_chunks = []
+            unchanged_count = 0
             
             for chunk in vectorized_chunks:
-                if chunk['id'] in existing_ids:
+                metadata = chunk['metadata']
+                if 'content_hash' not in metadata:
+                    metadata['content_hash'] = self.compute_chunk_hash(chunk['document'], metadata)
+                if chunk['id'] not in stored_hashes:
+                    new_chunks.append(chunk)
+                elif stored_hashes[chunk['id']] != metadata['content_hash']:
                     updated_chunks.append(chunk)
                 else:
-                    new_chunks.append(chunk)
+                    unchanged_count += 1
             
-            # 删除需要更新的记录
-            if updated_chunks:
-                update_ids = [chunk['id'] for chunk in updated_chunks]
-                print(f"删除 {len(update_ids)} 条重复记录")
-                self.collection.delete(ids=update_ids)
+            if unchanged_count:
+                print(f"跳过 {unchanged_count} 条内容未变化的记录")
             
-            # 添加所有记录（新增+更新）
+            # 写入新增和更新的记录
             all_chunks = new_chunks + updated_chunks
             
             if all_chunks:
@@ -369,7 +799,10 @@ class ChunkVectorizer:
                 embeddings = [chunk['embedding'] for chunk in all_chunks]
                 metadatas = [chunk['metadata'] for chunk in all_chunks]
                 
-                self.collection.add(
+                # 没有常驻的搜索系统时需要被覆盖文档原来的元数据来更新BM25快照的指纹
+                existing_entries = self._get_snapshot_entries(ids, stored_metadatas)
+                
+                self.collection.upsert(
                     ids=ids,
                     documents=documents,
                     embeddings=embeddings,
@@ -379,6 +812,16 @@ class ChunkVectorizer:
                 print(f"成功存储 {len(new_chunks)} 条新记录")
                 print(f"成功更新 {len(updated_chunks)} 条记录")
                 print(f"总计处理 {len(all_chunks)} 条记录")
+                
+                # 只对本次写入的文档增量更新BM25索引和进程内向量索引
+                self._sync_lexical_index(all_chunks, [], existing_entries)
+                if self.vector_index is not None:
+                    self.vector_index.upsert(ids, embeddings, documents, metadatas)
+                    self._save_vector_index()
+                if self.time_index is not None:
+                    self.time_index.upsert(ids, metadatas)
+                if self.filter_index is not None:
+                    self.filter_index.upsert(ids, metadatas)
             
             return True
             
@@ -386,6 +829,38 @@ class ChunkVectorizer:
             print(f"存储到ChromaDB失败: {e}")
             return False
     
+    def delete_chunks(self, ids: List[str]) -> int:
+        """
+        从集合中删除指定文档，并同步删除BM25索引中的对应文档
+        
+        Args:
+            ids: 待删除的文档ID列表
+            
+        Returns:
+            删除的文档数量
+        """
+        if not ids:
+            return 0
+        
+        try:
+            # 没有常驻的搜索系统时需要被删除文档原来的元数据来更新BM25快照的指纹
+            entries = self._get_snapshot_entries(list(ids))
+            self.collection.delete(ids=ids)
+            print(f"删除 {len(ids)} 条记录")
+            self._sync_lexical_index([], list(ids), entries)
+            if self.vector_index is not None:
+                self.vector_index.remove(ids)
+                self._save_vector_index()
+            if self.time_index is not None:
+                self.time_index.remove(ids)
+            if self.filter_index is not None:
+                self.filter_index.remove(ids)
+            return len(ids)
+            
+        except Exception as e:
+            print(f"删除记录失败: {e}")
+            return 0
+    
     def get_collection_info(self) -> Dict[str, Any]:
         """
         获取集合信息
@@ -412,26 +887,97 @@ class ChunkVectorizer:
             print(f"获取集合信息失败: {e}")
             return {}
     
-    def search_similar_chunks(self, query_text: str, n_results: int = 5) -> Dict[str, Any]:
+    def encode_query(self, query_text: str) -> np.ndarray:
+        """
+        查询编码（带缓存）：相同的规范化查询只调用一次编码模型
+        
+        Args:
+            query_text: 查询文本
+            
+        Returns:
+            只读的float32查询向量
+        """
+        return self.query_cache.get_or_encode(
+            query_text,
+            lambda text: self.model.encode_queries([text])[0]  # 使用encode_queries进行查询编码
+        )
+    
+    def encode_queries_batch(self, query_texts: List[str]) -> np.ndarray:
+        """
+        批量查询编码：缓存未命中的查询（去重后）合并为一次模型前向计算
+        
+        Args:
+            query_texts: 查询文本列表
+            
+        Returns:
+            形状为(N, 维度)的float32向量矩阵，与query_texts一一对应
+        """
+        return self.query_cache.get_or_encode_batch(
+            query_texts,
+            lambda texts: self.model.encode_queries(texts)  # 一次前向计算编码全部未命中的查询
+        )
+    
+    def get_query_cache_stats(self) -> Dict[str, Any]:
+        """获取查询向量缓存的命中统计"""
+        return self.query_cache.get_stats()
+    
+    def _empty_query_result(self, count: int = 1) -> Dict[str, Any]:
+        """没有满足过滤条件的文档时的检索结果（格式与collection.query相同）"""
+        return {'ids': [[] for _ in range(count)], 'documents': [[] for _ in range(count)],
+                'metadatas': [[] for _ in range(count)], 'distances': [[] for _ in range(count)], 'embeddings': None}
+    
+    def _filter_where(self, filters: Optional[Dict[str, Any]]) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        把元数据过滤条件解析为ChromaDB的where条件
+        
+        Args:
+            filters: 过滤条件（见metadata_filter.normalize_filters）
+            
+        Returns:
+            (是否可能有满足条件的文档, where条件)
+        """
+        if not filters:
+            return True, None
+        if self.filter_index is None and not self.build_metadata_indexes():
+            raise RuntimeError("元数据过滤位图不可用")
+        if self.filter_index.count(filters) == 0:
+            return False, None
+        return True, self.filter_index.where_clause(filters)
+    
+    def search_similar_chunks(self, 
+                              query_text: str, 
+                              n_results: int = 5,
+                              filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         搜索相似的chunks
         
         Args:
             query_text: 查询文本
             n_results: 返回结果数量
+            filters: 可选，元数据过滤条件，如 {'source_file': 'chap02', 'chunk_type': 'qa_pair', 'speakers': '老师'}
             
         Returns:
             搜索结果
         """
         try:
-            # 对查询文本进行向量化
-            query_embedding = self.model.encode_queries([query_text])  # 使用encode_queries进行查询编码
+            # 对查询文本进行向量化（重复查询直接复用缓存的向量）
+            query_embedding = self.encode_query(query_text)
+            
+            # 进程内向量索引：一次矩阵-向量乘积取top-k（过滤时只计算满足条件的向量）
+            if self.vector_index is not None:
+                return self.vector_index.search(query_embedding, n_results, filters)
+            
+            has_matches, where = self._filter_where(filters)
+            if not has_matches:
+                return self._empty_query_result()
             
             # 在ChromaDB中搜索
             search_params = {
-                "query_embeddings": query_embedding.tolist(),
+                "query_embeddings": [query_embedding.tolist()],
                 "n_results": n_results
             }
+            if where:
+                search_params["where"] = where
             
             results = self.collection.query(**search_params)
             
@@ -441,7 +987,58 @@ class ChunkVectorizer:
             print(f"搜索失败: {e}")
             return {}
     
-    def search_by_time_range(self, start_time: str, end_time: str, n_results: int = 10) -> Dict[str, Any]:
+    def search_similar_chunks_batch(self, 
+                                    query_texts: List[str], 
+                                    n_results: int = 5,
+                                    filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        批量搜索相似的chunks：一次编码全部查询，一次ChromaDB多向量查询
+        
+        Args:
+            query_texts: 查询文本列表
+            n_results: 每个查询返回的结果数量
+            filters: 可选，元数据过滤条件（对全部查询生效）
+            
+        Returns:
+            与query_texts一一对应的搜索结果（格式与search_similar_chunks相同）
+        """
+        if not query_texts:
+            return []
+        
+        try:
+            query_embeddings = self.encode_queries_batch(query_texts)
+            if self.vector_index is not None:
+                return self.vector_index.search_batch(query_embeddings, n_results, filters)
+            
+            has_matches, where = self._filter_where(filters)
+            if not has_matches:
+                return [self._empty_query_result() for _ in query_texts]
+            
+            search_params = {
+                "query_embeddings": query_embeddings.tolist(),
+                "n_results": n_results
+            }
+            if where:
+                search_params["where"] = where
+            results = self.collection.query(**search_params)
+            
+            # 拆分为单个查询的结果，每个字段保持[[...]]的嵌套格式
+            return [
+                {key: ([value[i]] if isinstance(value, list) and key != 'included' else value)
+                 for key, value in results.items()}
+                for i in range(len(query_texts))
+            ]
+            
+        except Exception as e:
+            print(f"批量搜索失败: {e}")
+            return [{} for _ in query_texts]
+    
+    def search_by_time_range(self, 
+                             start_time: str, 
+                             end_time: str, 
+                             n_results: int = 10,
+                             mode: str = 'contained',
+                             query_text: Optional[str] = None) -> Dict[str, Any]:
         """
         按时间范围搜索chunks
         
@@ -449,29 +1046,41 @@ class ChunkVectorizer:
             start_time: 开始时间，格式如 "10:00" 或 "01:10:30"
             end_time: 结束时间，格式如 "11:00" 或 "01:20:30"
             n_results: 返回结果数量
+            mode: contained（完全落在时间范围内）/ overlap（与时间范围有交集）
+            query_text: 查询文本，提供时窗口内的chunks按与查询的向量距离排序，否则按时间排序
             
         Returns:
-            搜索结果
+            搜索结果（格式与collection.get相同；按查询排序时附带distances）
         """
         try:
             start_timestamp = self.time_to_seconds(start_time)
             end_timestamp = self.time_to_seconds(end_time)
             
-            # 构建时间范围查询条件
-            where_clause = {
-                "$and": [
-                    {"start_timestamp": {"$gte": start_timestamp}},
-                    {"end_timestamp": {"$lte": end_timestamp}}
-                ]
-            }
+            if self.time_index is None and not self.build_metadata_indexes():
+                return {}
             
-            # 获取指定时间范围内的所有chunks
-            results = self.collection.get(
-                where=where_clause,
-                limit=n_results
-            )
+            ids = self.time_index.query(start_timestamp, end_timestamp, mode)
+            distances = None
+            if query_text and ids:
+                distances = self._distances_to_query(query_text, ids)
+                order = np.lexsort((np.arange(len(ids)), distances))[:n_results]
+                ids = [ids[i] for i in order]
+                distances = [float(distances[i]) for i in order]
+            else:
+                ids = ids[:n_results]
+            
+            results = {'ids': ids, 'documents': [], 'metadatas': []}
+            if ids:
+                # collection.get不保证按传入ID的顺序返回
+                fetched = self.collection.get(ids=ids, include=['documents', 'metadatas'])
+                rows = {doc_id: i for i, doc_id in enumerate(fetched['ids'])}
+                results['ids'] = [doc_id for doc_id in ids if doc_id in rows]
+                results['documents'] = [fetched['documents'][rows[doc_id]] for doc_id in results['ids']]
+                results['metadatas'] = [fetched['metadatas'][rows[doc_id]] for doc_id in results['ids']]
+                if distances is not None:
+                    results['distances'] = [d for doc_id, d in zip(ids, distances) if doc_id in rows]
             
-            print(f"时间范围 {start_time} - {end_time} 内找到 {len(results.get('ids', []))} 个chunks")
+            print(f"时间范围 {start_time} - {end_time} 内找到 {len(results['ids'])} 个chunks")
             
             return results
             
@@ -479,39 +1088,136 @@ class ChunkVectorizer:
             print(f"时间范围搜索失败: {e}")
             return {}
     
-    def process_and_store(self, json_file_path: str) -> bool:
+    def _distances_to_query(self, query_text: str, ids: List[str]) -> np.ndarray:
         """
-        完整的处理和存储流程
+        查询与候选文档的向量距离：优先使用进程内向量索引，否则从集合读取候选的向量
+        
+        Args:
+            query_text: 查询文本
+            ids: 候选文档ID
+            
+        Returns:
+            与ids一一对应的距离（越小越相关）
+        """
+        query_embedding = self.encode_query(query_text)
+        index = self.vector_index
+        if index is None:
+            space = (getattr(self.collection, 'metadata', None) or {}).get('hnsw:space', 'l2')
+            fetched = self.collection.get(ids=ids, include=['embeddings'])
+            index = FlatVectorIndex(space=space)
+            index.upsert(fetched['ids'], fetched['embeddings'], [''] * len(fetched['ids']), [None] * len(fetched['ids']))
+        return index.distances_to(query_embedding, ids)
+    
+    def _get_ingest_checkpoint_path(self, json_file_path: str) -> Optional[str]:
+        """入库检查点路径：索引目录下按集合名和文件绝对路径区分"""
+        if not self.persist_directory:
+            return None
+        file_key = hashlib.sha1(os.path.abspath(json_file_path).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.get_index_directory(), "ingest_checkpoints", f"{self.collection_name}_{file_key}.json")
+    
+    def _load_ingest_checkpoint(self, checkpoint_path: Optional[str], file_hash: str, batch_size: int) -> int:
+        """
+        读取入库检查点
+        
+        Returns:
+            已写入的批次数；检查点不存在或与文件内容、批大小不一致时返回0
+        """
+        if not checkpoint_path or not os.path.exists(checkpoint_path):
+            return 0
+        try:
+            with open(checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if checkpoint.get('file_hash') != file_hash or checkpoint.get('batch_size') != batch_size:
+                print("入库检查点与当前文件或批大小不一致，从头开始")
+                return 0
+            return int(checkpoint.get('committed_batches', 0))
+        except Exception as e:
+            print(f"读取入库检查点失败: {e}，从头开始")
+            return 0
+    
+    def _save_ingest_checkpoint(self, checkpoint_path: Optional[str], checkpoint: Dict[str, Any]):
+        """写入入库检查点（先写临时文件再替换）"""
+        if not checkpoint_path:
+            return
+        os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+        tmp_path = f"{checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(tmp_path, checkpoint_path)
+    
+    def process_and_store(self, 
+                          json_file_path: str, 
+                          batch_size: int = 256, 
+                          resume: bool = True,
+                          flush_batches: int = INDEX_FLUSH_BATCHES) -> bool:
+        """
+        完整的处理和存储流程：按批向量化，每批编码完成后立即写入ChromaDB并记录检查点，
+        中断后重新运行时跳过已写入的批次
+        
+        内存中的索引每批更新，IVF索引文件和BM25快照每flush_batches批及结束时才写入磁盘；
+        中途中断时磁盘上的索引与集合指纹不符，下次启动时重建
         
         Args:
             json_file_path: 输入JSON文件路径
-            persist_directory: ChromaDB持久化目录
+            batch_size: 每批编码和写入的chunk数量
+            resume: 是否从上次中断的检查点继续
+            flush_batches: 每写入多少批把索引变化写入磁盘
             
         Returns:
             处理是否成功
         """
+        self._defer_index_saves = True
         try:
             print(f"\n=== 开始处理文件: {json_file_path} ===")
             
             # 1. 加载数据
             data = self.load_processed_data(json_file_path)
+            with open(json_file_path, 'rb') as f:
+                file_hash = hashlib.sha1(f.read()).hexdigest()
             
-            # 2. 向量化
-            vectorized_chunks = self.vectorize_chunks(data)
+            checkpoint_path = self._get_ingest_checkpoint_path(json_file_path)
+            skip_batches = self._load_ingest_checkpoint(checkpoint_path, file_hash, batch_size) if resume else 0
+            if skip_batches:
+                print(f"从检查点继续：跳过已写入的 {skip_batches} 批")
             
-            # 3. 存储到ChromaDB
-            success = self.store_to_chromadb(vectorized_chunks)
+            # 2. 逐批向量化并存储到ChromaDB
+            stored_count = 0
+            batch_count = 0
+            batches = self.iter_vectorized_batches(data, batch_size, skip_batches=skip_batches)
+            for batch_number, batch in enumerate(batches, start=skip_batches):
+                batch_count += 1
+                # 整批内容未变化时不写入，只推进检查点
+                if batch and not self.store_to_chromadb(batch):
+                    print(f"=== 文件处理失败: {json_file_path}（第 {batch_number + 1} 批写入失败） ===")
+                    return False
+                stored_count += len(batch)
+                self._save_ingest_checkpoint(checkpoint_path, {
+                    'source_file': os.path.abspath(json_file_path),
+                    'file_hash': file_hash,
+                    'batch_size': batch_size,
+                    'committed_batches': batch_number + 1,
+                    'updated_at': datetime.now().isoformat()
+                })
+                if batch_count % max(flush_batches, 1) == 0:
+                    self.flush_index_changes()
             
-            if success:
-                print(f"=== 文件处理成功: {json_file_path} ===")
-                return True
-            else:
+            if batch_count == 0 and skip_batches == 0:
+                print("没有数据需要存储")
                 print(f"=== 文件处理失败: {json_file_path} ===")
                 return False
+            
+            # 全部批次写入完成，删除检查点
+            if checkpoint_path and os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
+            print(f"=== 文件处理成功: {json_file_path}（本次写入 {stored_count} 条） ===")
+            return True
                 
         except Exception as e:
             print(f"处理文件 {json_file_path} 失败: {e}")
             return False
+        finally:
+            self._defer_index_saves = False
+            self.flush_index_changes()
 
 
 def main():
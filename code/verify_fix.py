@@ -53,7 +53,7 @@ def verify_fix():
             
             # 2. 测试多阶段查询
             dimension_analyzer = DimensionAnalyzer()
-            multi_stage_query = MultiStageQuerySystem(search_interface)
+            multi_stage_query = MultiStageQuerySystem(search_interface, dimension_analyzer=dimension_analyzer)
             
             dimension_result = dimension_analyzer.analyze_query_dimensions(query)
             multi_stage_result = multi_stage_query.multi_stage_search(
@@ -85,7 +85,7 @@ def fix_search_issues():
     
     # 重新构建BM25索引
     print("\n重新构建BM25索引...")
-    search_interface.search_system.build_global_bm25_index()
+    search_interface.search_system.build_global_bm25_index(use_snapshot=False)
     
     # 测试改进后的搜索
     test_queries_detailed = [
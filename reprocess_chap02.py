@@ -10,6 +10,7 @@ sys.path.append('e:\\PyProjects\\QASystem\\code')
 
 from qa_document_processor import QADocumentProcessor
 from vectorize_chunks import ChunkVectorizer
+from bm25_index import get_snapshot_path, update_snapshot
 import chromadb
 
 def clean_existing_chap02_data():
@@ -39,6 +40,13 @@ def clean_existing_chap02_data():
             if chap02_ids:
                 print(f"找到 {len(chap02_ids)} 条chap02数据，正在删除...")
                 collection.delete(ids=chap02_ids)
+                
+                # 从BM25快照中删除对应文档，避免后端重启时全量重建
+                update_snapshot(
+                    get_snapshot_path('e:\\PyProjects\\QASystem\\chroma_db', 'qa_system_chunks'),
+                    dict(zip(results['ids'], results['metadatas'])),
+                    deletions=chap02_ids
+                )
                 print("✓ 清理完成")
             else:
                 print("未找到chap02数据")
@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""
+测试BM25倒排索引
+验证倒排索引打分与逐文档计算的BM25公式一致
+"""
+
+import sys
+import os
+import math
+import random
+import tempfile
+from collections import Counter
+sys.path.append(os.path.join(os.path.dirname(__file__), 'code'))
+
+import bm25_index
+from bm25_index import (BM25Index, CollectionFingerprint, compute_collection_fingerprint, char_ngrams,
+                        get_delta_path, get_ngram_snapshot_path, update_snapshot, TOKENIZER_VERSION, NGRAM_VERSION)
+
+
+def _make_corpus(num_docs: int = 300, vocab_size: int = 200, seed: int = 42):
+    """生成随机语料 {doc_id: 词项列表}"""
+    rng = random.Random(seed)
+    vocab = [f"词{i}" for i in range(vocab_size)]
+    corpus = {}
+    for i in range(num_docs):
+        length = rng.randint(0, 50)
+        corpus[f"chap01-{i}"] = [rng.choice(vocab[:rng.randint(5, vocab_size)]) for _ in range(length)]
+    return corpus, vocab
+
+
+def _reference_bm25(corpus, query_terms, doc_id, k1=1.5, b=0.75):
+    """逐文档计算BM25（与旧版calculate_bm25_score公式相同）"""
+    doc_count = len(corpus)
+    avg_doc_length = sum(len(words) for words in corpus.values()) / doc_count
+    doc_freq = Counter(term for words in corpus.values() for term in set(words))
+
+    term_freq = Counter(corpus[doc_id])
+    doc_length = len(corpus[doc_id])
+    if doc_length == 0:
+        return 0.0
+
+    score = 0.0
+    for term in query_terms:
+        if term in term_freq:
+            tf = term_freq[term]
+            df = doc_freq[term]
+            idf = math.log((doc_count - df + 0.5) / (df + 0.5))
+            score += idf * (tf * (k1 + 1)) / (tf + k1 * (1 - b + b * (doc_length / avg_doc_length)))
+    return score
+
+
+def test_scores_match_reference():
+    """测试倒排索引得分与参考实现一致"""
+    print("\n=== 测试倒排索引打分 ===")
+
+    corpus, vocab = _make_corpus()
+    index = BM25Index()
+    index.build(corpus.items())
+
+    rng = random.Random(7)
+    doc_ids = list(corpus.keys())
+    for _ in range(20):
+        query_terms = rng.sample(vocab, 5)
+        batch_scores = index.score_documents(query_terms, doc_ids)
+        for doc_id, score in zip(doc_ids, batch_scores):
+            expected = _reference_bm25(corpus, query_terms, doc_id)
+            if abs(score - expected) > 1e-9 or abs(index.score_document(query_terms, doc_id) - expected) > 1e-9:
+                print(f"得分不一致: {doc_id} {score} != {expected}")
+                return False
+
+    print("倒排索引得分与参考实现一致")
+    return True
+
+
+def test_top_k_retrieval():
+    """测试BM25作为检索通道的top-k结果"""
+    print("\n=== 测试BM25 top-k检索 ===")
+
+    corpus, vocab = _make_corpus()
+    index = BM25Index()
+    index.build(corpus.items())
+
+    doc_ids = list(corpus.keys())
+    rng = random.Random(11)
+    for _ in range(20):
+        query_terms = rng.sample(vocab, 4)
+        results = index.top_k(query_terms, k=10)
+
+        matched = [d for d in doc_ids if any(t in corpus[d] for t in query_terms)]
+        expected = sorted(matched, key=lambda d: (-_reference_bm25(corpus, query_terms, d), doc_ids.index(d)))[:10]
+        if [doc_id for doc_id, _ in results] != expected:
+            print(f"top-k结果不一致: {results} vs {expected}")
+            return False
+
+    print("top-k检索结果正确")
+    return True
+
+
+def test_max_score_matches_exhaustive():
+    """测试MaxScore剪枝的top-k结果与全量打分完全一致"""
+    print("\n=== 测试MaxScore剪枝 ===")
+
+    # 按Zipf分布生成语料，使查询中同时包含高频词和低频词
+    rng = random.Random(5)
+    vocab = [f"词{i}" for i in range(2000)]
+    weights = [1.0 / (i + 1) for i in range(len(vocab))]
+    corpus = {f"chap02-{i}": rng.choices(vocab, weights, k=rng.randint(1, 80)) for i in range(2000)}
+
+    index = BM25Index()
+    index.build(corpus.items())
+    for round_num in range(2):
+        for _ in range(50):
+            query_terms = rng.choices(vocab[:300], k=rng.randint(2, 15))
+            for k in (1, 5, 10, 50):
+                if index.top_k(query_terms, k=k) != index.top_k_exhaustive(query_terms, k=k):
+                    print(f"剪枝结果不一致: {query_terms} k={k}")
+                    return False
+        # 增量更新后上界需要重新计算
+        for i in range(100):
+            index.remove_document(f"chap02-{i}")
+        index.add_document("chap02-new", vocab[:20] * 3)
+
+    print("MaxScore剪枝结果与全量打分一致")
+    return True
+
+
+def test_parallel_build_identical():
+    """测试多进程分词构建的快照与单进程构建逐字节一致"""
+    print("\n=== 测试并行构建 ===")
+
+    rng = random.Random(17)
+    phrases = ["乔老师的邮箱是多少", "创新创业课程", "学生需要提交作业", "公司注册流程", "梁老师讲了市场分析",
+               "期末考试安排在下周", "ABC公司2024年的营收", "请大家准备小组展示"]
+    documents = {f"chap0{i % 3 + 1}-{i}": "，".join(rng.choices(phrases, k=rng.randint(1, 6))) for i in range(400)}
+
+    min_documents = bm25_index.PARALLEL_MIN_DOCUMENTS
+    bm25_index.PARALLEL_MIN_DOCUMENTS = 100
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for tokenizer in (bm25_index.tokenize, char_ngrams):
+                contents = []
+                for workers in (1, 3):
+                    index = BM25Index()
+                    index.build_from_texts(documents, tokenizer=tokenizer, workers=workers)
+                    path = os.path.join(tmp_dir, f"{tokenizer.__name__}-{workers}.bm25")
+                    index.save(path, "fingerprint")
+                    with open(path, 'rb') as f:
+                        contents.append(f.read())
+                if contents[0] != contents[1]:
+                    print(f"并行构建结果不一致: {tokenizer.__name__}")
+                    return False
+    finally:
+        bm25_index.PARALLEL_MIN_DOCUMENTS = min_documents
+
+    print("并行构建与单进程构建逐字节一致")
+    return True
+
+
+def test_legacy_mapping_interface():
+    """测试兼容旧接口（doc_id -> Counter）"""
+    print("\n=== 测试兼容接口 ===")
+
+    corpus, _ = _make_corpus(num_docs=20)
+    index = BM25Index()
+    index.build(corpus.items())
+
+    ok = len(index) == len(corpus) and all(index[d] == Counter(words) for d, words in corpus.items())
+    print(f"兼容接口: {'正常' if ok else '异常'}")
+    return ok
+
+
+def test_snapshot_round_trip():
+    """测试快照保存与内存映射加载"""
+    print("\n=== 测试BM25快照 ===")
+
+    corpus, vocab = _make_corpus()
+    index = BM25Index()
+    index.build(corpus.items())
+
+    ids = list(corpus.keys())
+    metadatas = [{'created_at': '2025-06-20T00:00:00'} for _ in ids]
+    fingerprint = compute_collection_fingerprint(ids, metadatas)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'qa_system_chunks.bm25')
+        index.save(path, fingerprint)
+
+        loaded = BM25Index.load(path, fingerprint)
+        if loaded is None:
+            print("快照加载失败")
+            return False
+
+        rng = random.Random(3)
+        for _ in range(10):
+            query_terms = rng.sample(vocab, 5)
+            if loaded.top_k(query_terms, k=20) != index.top_k(query_terms, k=20):
+                print("快照加载后检索结果不一致")
+                loaded.close()
+                return False
+
+        # 集合变化后指纹不同，快照应失效
+        metadatas[0] = {'created_at': '2025-06-21T00:00:00'}
+        stale = BM25Index.load(path, compute_collection_fingerprint(ids, metadatas))
+        loaded.close()
+        if stale is not None:
+            print("过期快照未被识别")
+            stale.close()
+            return False
+
+    print("快照保存、加载及过期检测正常")
+    return True
+
+
+def test_incremental_update():
+    """测试增量新增/更新/删除与全量重建结果一致"""
+    print("\n=== 测试增量更新 ===")
+
+    corpus, vocab = _make_corpus()
+    index = BM25Index()
+    index.build(corpus.items())
+
+    rng = random.Random(5)
+    doc_ids = list(corpus.keys())
+    for doc_id in rng.sample(doc_ids, 30):
+        index.remove_document(doc_id)
+        del corpus[doc_id]
+    for doc_id in rng.sample(list(corpus.keys()), 30):
+        corpus[doc_id] = [rng.choice(vocab) for _ in range(rng.randint(1, 40))]
+        index.add_document(doc_id, corpus[doc_id])
+    for i in range(20):
+        corpus[f"chap02-{i}"] = [rng.choice(vocab) for _ in range(rng.randint(1, 40))]
+        index.add_document(f"chap02-{i}", corpus[f"chap02-{i}"])
+
+    def same_scores(candidate):
+        for _ in range(20):
+            query_terms = rng.sample(vocab, 5)
+            scores = candidate.score_documents(query_terms, list(corpus.keys()))
+            for doc_id, score in zip(corpus.keys(), scores):
+                if abs(score - _reference_bm25(corpus, query_terms, doc_id)) > 1e-9:
+                    print(f"得分不一致: {doc_id}")
+                    return False
+        return True
+
+    if len(index) != len(corpus) or not same_scores(index):
+        return False
+
+    # 压缩后再做增量修改（快照加载后的写时复制路径）
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'qa_system_chunks.bm25')
+        index.save(path, 'v1')
+        loaded = BM25Index.load(path, 'v1')
+        removed = rng.choice(list(corpus.keys()))
+        loaded.remove_document(removed)
+        del corpus[removed]
+        corpus["chap03-1"] = [rng.choice(vocab) for _ in range(10)]
+        loaded.add_document("chap03-1", corpus["chap03-1"])
+        ok = same_scores(loaded) and loaded["chap03-1"] == Counter(corpus["chap03-1"])
+        loaded.close()
+
+    print(f"增量更新: {'与全量重建一致' if ok else '结果不一致'}")
+    return ok
+
+
+def test_incremental_fingerprint():
+    """测试集合指纹可按文档增量加减，且与文档顺序无关"""
+    print("\n=== 测试增量集合指纹 ===")
+
+    rng = random.Random(7)
+    entries = {f"doc_{i}": {'created_at': f"2025-06-{rng.randint(1, 28):02d}"} for i in range(500)}
+    fingerprint = CollectionFingerprint.from_entries(entries.keys(), entries.values())
+
+    shuffled = list(entries.items())
+    rng.shuffle(shuffled)
+    if compute_collection_fingerprint([k for k, _ in shuffled], [v for _, v in shuffled]) != fingerprint.hexdigest():
+        print("指纹与文档顺序有关")
+        return False
+
+    for doc_id in rng.sample(list(entries), 50):
+        fingerprint.remove(doc_id, entries.pop(doc_id))
+    for doc_id in rng.sample(list(entries), 50):
+        fingerprint.remove(doc_id, entries[doc_id])
+        entries[doc_id] = {'created_at': '2025-07-01'}
+        fingerprint.add(doc_id, entries[doc_id])
+    for i in range(50):
+        entries[f"new_{i}"] = {'created_at': '2025-07-02'}
+        fingerprint.add(f"new_{i}", entries[f"new_{i}"])
+
+    expected = compute_collection_fingerprint(list(entries), list(entries.values()), "1")
+    parsed = CollectionFingerprint.parse(fingerprint.hexdigest("1"), "1")
+    ok = (fingerprint.hexdigest("1") == expected and parsed is not None and parsed.hexdigest("1") == expected
+          and CollectionFingerprint.parse(expected, "2") is None)
+    print(f"增量指纹: {'与重新计算一致' if ok else '不一致'}")
+    return ok
+
+
+def test_snapshot_delta():
+    """测试增量日志：变化只追加到日志，加载时重放，日志过大时整体重写"""
+    print("\n=== 测试快照增量日志 ===")
+
+    corpus, vocab = _make_corpus()
+    entries = {doc_id: {'created_at': '2025-06-20'} for doc_id in corpus}
+    fingerprint = CollectionFingerprint.from_entries(entries.keys(), entries.values())
+    index = BM25Index()
+    index.build(corpus.items())
+    rng = random.Random(11)
+
+    def change(target, count):
+        """删除、更新、新增和重命名各count个文档，同步更新指纹"""
+        for doc_id in rng.sample(sorted(corpus), count):
+            target.remove_document(doc_id)
+            fingerprint.remove(doc_id, entries.pop(doc_id))
+            del corpus[doc_id]
+        for doc_id in rng.sample(sorted(corpus), count):
+            corpus[doc_id] = [rng.choice(vocab) for _ in range(rng.randint(1, 40))]
+            target.add_document(doc_id, corpus[doc_id])
+            fingerprint.remove(doc_id, entries[doc_id])
+            entries[doc_id] = {'created_at': '2025-06-21'}
+            fingerprint.add(doc_id, entries[doc_id])
+        for _ in range(count):
+            doc_id = f"chap09-{len(entries)}-{rng.random():.6f}"
+            corpus[doc_id] = [rng.choice(vocab) for _ in range(rng.randint(1, 40))]
+            target.add_document(doc_id, corpus[doc_id])
+            entries[doc_id] = {'created_at': '2025-06-22'}
+            fingerprint.add(doc_id, entries[doc_id])
+        renames = {old: f"{old}-renamed" for old in rng.sample(sorted(corpus), count)}
+        target.rename_documents(renames)
+        for old, new in renames.items():
+            corpus[new] = corpus.pop(old)
+            fingerprint.remove(old, entries[old])
+            entries[new] = entries.pop(old)
+            fingerprint.add(new, entries[new])
+
+    def same_results(candidate, reference):
+        for _ in range(10):
+            query_terms = rng.sample(vocab, 5)
+            if candidate.top_k(query_terms, k=20) != reference.top_k(query_terms, k=20):
+                return False
+        return True
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'qa_system_chunks.bm25')
+        index.save(path, fingerprint.hexdigest())
+        with open(path, 'rb') as f:
+            base = f.read()
+
+        loaded = BM25Index.load(path, fingerprint.hexdigest())
+        stale = fingerprint.hexdigest()
+        change(loaded, 3)
+        rewritten = loaded.save_changes(path, fingerprint.hexdigest())
+        with open(path, 'rb') as f:
+            unchanged = f.read() == base
+        delta_size = os.path.getsize(get_delta_path(path))
+        print(f"少量变化: 整体重写{rewritten}，快照未改动{unchanged}，增量日志{delta_size}字节（快照{len(base)}字节）")
+        if rewritten or not unchanged or delta_size > len(base) * 0.1:
+            return False
+
+        # 日志末尾不完整的记录被忽略；旧指纹视为过期
+        with open(get_delta_path(path), 'a', encoding='utf-8') as f:
+            f.write('{"base": "')
+        replayed = BM25Index.load(path, fingerprint.hexdigest())
+        expired = BM25Index.load(path, stale)
+        ok = replayed is not None and expired is None and len(replayed) == len(corpus) and same_results(replayed, loaded)
+        if replayed is not None:
+            replayed.close()
+        if not ok:
+            print("重放增量日志后的结果不一致")
+            return False
+
+        # 大量变化后日志超过阈值，整体重写快照并删除日志
+        loaded.close()
+        loaded = BM25Index.load(path, fingerprint.hexdigest())
+        change(loaded, 40)
+        rewritten = loaded.save_changes(path, fingerprint.hexdigest())
+        reloaded = BM25Index.load(path, fingerprint.hexdigest())
+        ok = (rewritten and not os.path.exists(get_delta_path(path)) and reloaded is not None
+              and same_results(reloaded, loaded) and sorted(reloaded) == sorted(corpus))
+        print(f"大量变化: 整体重写{rewritten}，重新加载结果一致{ok}")
+        loaded.close()
+        if reloaded is not None:
+            reloaded.close()
+    return ok
+
+
+def test_update_snapshot_affected_entries():
+    """测试脚本增量更新快照：只提供受影响文档的元数据，更新后的快照与变化后的集合指纹一致"""
+    print("\n=== 测试脚本增量更新快照 ===")
+
+    rng = random.Random(13)
+    words = ['注意力', '机制', '训练', '方法', '模型', '数据', '梯度', '向量']
+    contents = {f"doc_{i}": "".join(rng.choice(words) for _ in range(rng.randint(2, 12))) for i in range(200)}
+    entries = {doc_id: {'created_at': '2025-06-20'} for doc_id in contents}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'qa_system_chunks.bm25')
+        index = BM25Index()
+        index.build_from_texts(contents, workers=1)
+        index.save(path, compute_collection_fingerprint(list(entries), list(entries.values()), TOKENIZER_VERSION))
+        ngram = BM25Index()
+        ngram.build_from_texts(contents, tokenizer=char_ngrams, workers=1)
+        ngram.save(get_ngram_snapshot_path(path), compute_collection_fingerprint(list(entries), list(entries.values()), NGRAM_VERSION))
+
+        deletions = ["doc_1", "doc_2"]
+        upserts = [("doc_3", "梯度向量", {'created_at': '2025-06-21'}), ("doc_new", "注意力训练", {'created_at': '2025-06-21'})]
+        renames = {"doc_4": "doc_4b"}
+        affected = {doc_id: entries[doc_id] for doc_id in ("doc_1", "doc_2", "doc_3", "doc_4")}
+        updated = update_snapshot(path, affected, upserts=upserts, deletions=deletions, renames=renames)
+
+        for doc_id in deletions:
+            del entries[doc_id], contents[doc_id]
+        entries["doc_4b"], contents["doc_4b"] = entries.pop("doc_4"), contents.pop("doc_4")
+        for doc_id, content, metadata in upserts:
+            entries[doc_id], contents[doc_id] = metadata, content
+
+        loaded = BM25Index.load(path, compute_collection_fingerprint(list(entries), list(entries.values()), TOKENIZER_VERSION))
+        loaded_ngram = BM25Index.load(get_ngram_snapshot_path(path), compute_collection_fingerprint(list(entries), list(entries.values()), NGRAM_VERSION))
+        reference = BM25Index()
+        reference.build_from_texts(contents, workers=1)
+        ok = (updated and loaded is not None and loaded_ngram is not None and sorted(loaded) == sorted(contents)
+              and all(loaded[doc_id] == reference[doc_id] for doc_id in contents))
+        for candidate in (loaded, loaded_ngram):
+            if candidate is not None:
+                candidate.close()
+
+    print(f"脚本增量更新: {'与变化后的集合一致' if ok else '不一致'}")
+    return ok
+
+
+def main():
+    """主测试函数"""
+    tests = [
+        ("倒排索引打分", test_scores_match_reference),
+        ("BM25 top-k检索", test_top_k_retrieval),
+        ("MaxScore剪枝", test_max_score_matches_exhaustive),
+        ("并行构建", test_parallel_build_identical),
+        ("兼容旧接口", test_legacy_mapping_interface),
+        ("BM25快照", test_snapshot_round_trip),
+        ("增量更新", test_incremental_update),
+        ("增量集合指纹", test_incremental_fingerprint),
+        ("快照增量日志", test_snapshot_delta),
+        ("脚本增量更新快照", test_update_snapshot_affected_entries),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            success = test_func()
+            results.append((test_name, success))
+        except Exception as e:
+            print(f"测试 {test_name} 出现异常: {e}")
+            results.append((test_name, False))
+
+    print("\n=== 测试结果汇总 ===")
+    passed = 0
+    for test_name, success in results:
+        status = "✓ 通过" if success else "✗ 失败"
+        print(f"{test_name}: {status}")
+        if success:
+            passed += 1
+
+    print(f"\n总计: {passed}/{len(results)} 个测试通过")
+
+
+if __name__ == "__main__":
+    main()
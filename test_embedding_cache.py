@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+测试查询向量缓存
+验证重复查询不再调用编码模型、LRU淘汰与过期时间生效、批量编码只调用一次模型
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), 'code'))
+
+import numpy as np
+
+from embedding_cache import QueryEmbeddingCache
+
+
+class _CountingEncoder:
+    """记录调用次数的编码函数"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, text):
+        self.calls.append(text)
+        return np.arange(4, dtype=np.float64) + len(self.calls)
+
+
+def test_repeated_queries_hit_cache():
+    """测试重复查询（含空白差异）只编码一次"""
+    print("\n=== 测试查询向量缓存命中 ===")
+
+    encoder = _CountingEncoder()
+    cache = QueryEmbeddingCache(max_size=8)
+    first = cache.get_or_encode("乔老师的邮箱是多少", encoder)
+    second = cache.get_or_encode("  乔老师的邮箱是多少 ", encoder)
+    third = cache.get_or_encode("乔老师的 \n 邮箱", encoder)
+
+    stats = cache.get_stats()
+    ok = (encoder.calls == ["乔老师的邮箱是多少", "乔老师的 邮箱"]
+          and first is second
+          and first.dtype == np.float32
+          and not first.flags.writeable
+          and not np.array_equal(first, third)
+          and stats['hits'] == 1 and stats['misses'] == 2)
+    print(f"编码次数: {len(encoder.calls)}，缓存统计: {stats}")
+    return ok
+
+
+def test_lru_and_ttl():
+    """测试容量淘汰和过期时间"""
+    print("\n=== 测试LRU淘汰与过期 ===")
+
+    encoder = _CountingEncoder()
+    cache = QueryEmbeddingCache(max_size=2, ttl_seconds=0.2)
+    cache.get_or_encode("创新创业", encoder)
+    cache.get_or_encode("课程安排", encoder)
+    cache.get_or_encode("创新创业", encoder)   # 命中，"课程安排"成为最久未使用
+    cache.get_or_encode("考试时间", encoder)   # 淘汰"课程安排"
+    cache.get_or_encode("课程安排", encoder)
+    if encoder.calls != ["创新创业", "课程安排", "考试时间", "课程安排"]:
+        print(f"LRU淘汰顺序错误: {encoder.calls}")
+        return False
+
+    time.sleep(0.3)
+    cache.get_or_encode("课程安排", encoder)
+    stats = cache.get_stats()
+    ok = len(encoder.calls) == 5 and stats['expired'] == 1 and stats['cached_queries'] == 2
+    print(f"缓存统计: {stats}")
+    return ok
+
+
+def test_batch_encoding():
+    """测试批量编码：未命中的查询去重后只调用一次批量编码"""
+    print("\n=== 测试批量编码 ===")
+
+    batches = []
+
+    def batch_encoder(texts):
+        batches.append(list(texts))
+        return np.array([[len(text), i] for i, text in enumerate(texts)], dtype=np.float64)
+
+    cache = QueryEmbeddingCache(max_size=8)
+    cache.get_or_encode("创新创业", lambda text: np.array([0.5, 0.5]))
+    matrix = cache.get_or_encode_batch(["乔老师的邮箱", "创新创业", " 乔老师的邮箱", "课程安排"], batch_encoder)
+
+    ok = (batches == [["乔老师的邮箱", "课程安排"]]
+          and matrix.shape == (4, 2) and matrix.dtype == np.float32
+          and np.array_equal(matrix[0], matrix[2])
+          and np.array_equal(matrix[1], [0.5, 0.5]))
+    print(f"批量编码调用: {batches}")
+    return ok
+
+
+def main():
+    """主测试函数"""
+    tests = [
+        ("查询向量缓存命中", test_repeated_queries_hit_cache),
+        ("LRU淘汰与过期", test_lru_and_ttl),
+        ("批量编码", test_batch_encoding),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            success = test_func()
+            results.append((test_name, success))
+        except Exception as e:
+            print(f"测试 {test_name} 出现异常: {e}")
+            results.append((test_name, False))
+
+    print("\n=== 测试结果汇总 ===")
+    passed = 0
+    for test_name, success in results:
+        status = "✓ 通过" if success else "✗ 失败"
+        print(f"{test_name}: {status}")
+        if success:
+            passed += 1
+
+    print(f"\n总计: {passed}/{len(results)} 个测试通过")
+
+
+if __name__ == "__main__":
+    main()
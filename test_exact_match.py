@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+测试批量精确匹配打分
+验证整批打分与逐文档计算的精确匹配公式一致
+"""
+
+import sys
+import os
+import random
+sys.path.append(os.path.join(os.path.dirname(__file__), 'code'))
+
+from exact_match import ExactMatcher
+
+
+def _reference_exact(query, document, query_terms, doc_terms):
+    """逐文档计算精确匹配得分（与旧版exact_match_score公式相同）"""
+    score = 0.0
+    if query.lower() in document.lower():
+        score += 1.0
+    if query_terms:
+        score += len(query_terms & doc_terms) / len(query_terms) * 0.8
+    query_phrases = [query[i:i+4] for i in range(len(query) - 3)]
+    if query_phrases:
+        score += sum(1 for phrase in query_phrases if phrase in document) / len(query_phrases) * 0.6
+    return score
+
+
+def test_batch_matches_reference():
+    """测试整批打分与参考实现一致"""
+    print("\n=== 测试批量精确匹配 ===")
+
+    rng = random.Random(13)
+    alphabet = "乔老师邮箱创新创业学生公司AbCd "
+    documents = [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 60))) for _ in range(100)]
+    doc_terms = [frozenset(document.split()) for document in documents]
+
+    queries = ["乔老师邮箱", "创新创业学生", "abcd", "Ab", "", "老师老师老师"] + [rng.choice(documents)[3:15] for _ in range(10)]
+    for query in queries:
+        query_terms = frozenset(query.split())
+        matcher = ExactMatcher(query, query_terms)
+        overlaps = [len(query_terms & terms) for terms in doc_terms]
+        scores = matcher.score_batch(documents, overlaps)
+        expected = [_reference_exact(query, d, query_terms, t) for d, t in zip(documents, doc_terms)]
+        if scores != expected:
+            print(f"得分不一致: {query}")
+            return False
+
+    print("批量打分与逐文档计算一致")
+    return True
+
+
+def test_matches_do_not_cross_documents():
+    """测试短语匹配不会跨越相邻文档的边界"""
+    print("\n=== 测试文档边界 ===")
+
+    matcher = ExactMatcher("创新创业", frozenset())
+    scores = matcher.score_batch(["学生创新", "创业公司", "创新创业"], [0, 0, 0])
+    ok = scores == [0.0, 0.0, 1.6]
+    print(f"得分: {scores}")
+    return ok
+
+
+def main():
+    """主测试函数"""
+    tests = [
+        ("批量精确匹配", test_batch_matches_reference),
+        ("文档边界", test_matches_do_not_cross_documents),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            success = test_func()
+            results.append((test_name, success))
+        except Exception as e:
+            print(f"测试 {test_name} 出现异常: {e}")
+            results.append((test_name, False))
+
+    print("\n=== 测试结果汇总 ===")
+    passed = 0
+    for test_name, success in results:
+        status = "✓ 通过" if success else "✗ 失败"
+        print(f"{test_name}: {status}")
+        if success:
+            passed += 1
+
+    print(f"\n总计: {passed}/{len(results)} 个测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+测试时间区间索引
+验证交集/包含查询与逐个比较的结果一致且按时间排序，以及增量更新和按查询排序的距离
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'code'))
+
+import numpy as np
+
+from interval_index import TimeIntervalIndex
+from vector_index import FlatVectorIndex
+
+
+def _transcript_metadatas(files, chunks_per_file, seed):
+    """生成若干文件的连续对话文档块元数据（不同文件的时间互相重叠，夹杂少量长文档块和问答对）"""
+    rng = np.random.default_rng(seed)
+    ids, metadatas = [], []
+    for f in range(files):
+        position = int(rng.integers(0, 30))
+        for c in range(chunks_per_file):
+            duration = int(rng.integers(20, 120)) if rng.random() > 0.02 else int(rng.integers(600, 3600))
+            ids.append(f"chap{f:02d}_chunk_{c}")
+            metadatas.append({'chunk_type': 'traditional', 'start_timestamp': position, 'end_timestamp': position + duration})
+            position += duration + int(rng.integers(0, 5))
+        ids.append(f"chap{f:02d}_qa")
+        metadatas.append({'chunk_type': 'qa_pair', 'question': '问题'})
+    return ids, metadatas
+
+
+def _expected(ids, metadatas, start, end, mode):
+    """逐个比较得到的期望结果（按开始时间、结束时间、ID排序）"""
+    matched = []
+    for doc_id, metadata in zip(ids, metadatas):
+        if 'start_timestamp' not in metadata:
+            continue
+        s, e = metadata['start_timestamp'], metadata['end_timestamp']
+        if (mode == 'overlap' and s <= end and e >= start) or (mode == 'contained' and s >= start and e <= end):
+            matched.append((s, e, doc_id))
+    return [doc_id for _, _, doc_id in sorted(matched)]
+
+
+def test_interval_queries():
+    """测试交集与包含查询的结果与逐个比较一致"""
+    print("\n=== 测试时间区间查询 ===")
+
+    ids, metadatas = _transcript_metadatas(files=8, chunks_per_file=300, seed=1)
+    index = TimeIntervalIndex()
+    index.upsert(ids, metadatas)
+    print(f"索引文档块数: {len(index)}")
+
+    rng = np.random.default_rng(2)
+    for _ in range(200):
+        start = int(rng.integers(0, 20000))
+        end = start + int(rng.integers(0, 1500))
+        for mode in ('overlap', 'contained'):
+            if index.query(start, end, mode) != _expected(ids, metadatas, start, end, mode):
+                print(f"{mode} 查询 [{start}, {end}] 结果不一致")
+                return False
+
+    overlap, contained = index.overlapping(600, 900), index.contained(600, 900)
+    print(f"[600, 900] 交集{len(overlap)}个，包含{len(contained)}个")
+    return set(contained) < set(overlap)
+
+
+def test_interval_incremental():
+    """测试增量更新与删除后查询结果正确"""
+    print("\n=== 测试时间区间增量更新 ===")
+
+    ids, metadatas = _transcript_metadatas(files=3, chunks_per_file=100, seed=3)
+    index = TimeIntervalIndex()
+    index.upsert(ids, metadatas)
+    index.overlapping(0, 100)
+
+    # 删除一部分、修改一部分时间、把一个对话块改为问答对
+    index.remove(ids[:20])
+    for metadata in metadatas[20:40]:
+        metadata['start_timestamp'] += 5000
+        metadata['end_timestamp'] += 5000
+    metadatas[50] = {'chunk_type': 'qa_pair'}
+    index.upsert(ids[20:60], metadatas[20:60])
+
+    ids, metadatas = ids[20:], metadatas[20:]
+    for start, end in ((0, 500), (5000, 8000), (100, 100)):
+        for mode in ('overlap', 'contained'):
+            if index.query(start, end, mode) != _expected(ids, metadatas, start, end, mode):
+                print(f"{mode} 查询 [{start}, {end}] 结果不一致")
+                return False
+    print(f"更新后文档块数: {len(index)}")
+    return len(index) == sum('start_timestamp' in m for m in metadatas)
+
+
+def test_distances_to():
+    """测试按ID计算的距离与检索结果中的距离一致"""
+    print("\n=== 测试候选文档距离 ===")
+
+    rng = np.random.default_rng(4)
+    embeddings = rng.normal(size=(500, 32)).astype(np.float32)
+    ids = [f"doc-{i}" for i in range(len(embeddings))]
+    query = embeddings[7] + 0.1
+
+    for space in ('l2', 'cosine'):
+        index = FlatVectorIndex(space=space)
+        index.upsert(ids, embeddings, [""] * len(ids), [None] * len(ids))
+        result = index.search(query, n_results=5)
+        candidates = list(reversed(result['ids'][0])) + ["missing"]
+        distances = index.distances_to(query, candidates)
+        print(f"{space}: {np.round(distances, 4).tolist()}")
+        if not np.allclose(distances[:-1], result['distances'][0][::-1], atol=1e-4) or distances[-1] != np.inf:
+            return False
+    return True
+
+
+def main():
+    """主测试函数"""
+    tests = [
+        ("时间区间查询", test_interval_queries),
+        ("时间区间增量更新", test_interval_incremental),
+        ("候选文档距离", test_distances_to),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            success = test_func()
+            results.append((test_name, success))
+        except Exception as e:
+            print(f"测试 {test_name} 出现异常: {e}")
+            results.append((test_name, False))
+
+    print("\n=== 测试结果汇总 ===")
+    passed = 0
+    for test_name, success in results:
+        status = "✓ 通过" if success else "✗ 失败"
+        print(f"{test_name}: {status}")
+        if success:
+            passed += 1
+
+    print(f"\n总计: {passed}/{len(results)} 个测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+测试元数据过滤位图
+验证过滤掩码与逐条判断一致，BM25与向量索引的过滤top-k与“全量打分后过滤”的结果完全相同
+"""
+
+import sys
+import os
+import random
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), 'code'))
+
+import numpy as np
+
+from bm25_index import BM25Index
+from metadata_filter import MetadataBitmapIndex, normalize_filters
+from vector_index import FlatVectorIndex, IVFVectorIndex
+
+SOURCE_FILES = [f"e:\\data\\chap{i:02d}_processed.json" for i in range(1, 6)]
+SPEAKERS = ["老师", "学生甲", "学生乙", "助教"]
+
+
+def _random_metadatas(count, seed):
+    """生成带来源文件、文档块类型和说话人的元数据"""
+    rng = random.Random(seed)
+    metadatas = []
+    for _ in range(count):
+        chunk_type = rng.choice(['traditional', 'traditional', 'qa_pair', 'general_text'])
+        metadata = {'source_file': rng.choice(SOURCE_FILES), 'chunk_type': chunk_type}
+        if chunk_type == 'traditional':
+            metadata['speakers'] = ', '.join(rng.sample(SPEAKERS, rng.randint(1, 3)))
+        metadatas.append(metadata)
+    return metadatas
+
+
+def _matches(metadata, filters):
+    """逐条判断元数据是否满足过滤条件（对照实现）"""
+    for field, values in normalize_filters(filters).items():
+        stored = metadata.get(field) or ''
+        if field == 'source_file':
+            ok = any(value in stored for value in values)
+        elif field == 'speakers':
+            ok = any(value in [s.strip() for s in stored.split(',')] for value in values)
+        else:
+            ok = stored in values
+        if not ok:
+            return False
+    return True
+
+
+FILTER_CASES = [
+    {'source_file': 'chap02'},
+    {'chunk_type': 'qa_pair'},
+    {'speakers': '老师'},
+    {'source_file': ['chap01', 'chap03'], 'chunk_type': 'traditional'},
+    {'source_file': 'chap04', 'speakers': ['学生甲', '助教']},
+    {'source_file': 'chap09'},
+]
+
+
+def test_bitmap_masks():
+    """测试过滤掩码、计数、where条件及增量维护"""
+    print("\n=== 测试元数据过滤位图 ===")
+
+    metadatas = _random_metadatas(3000, 1)
+    ids = [f"doc-{i}" for i in range(len(metadatas))]
+    index = MetadataBitmapIndex(ids, metadatas)
+
+    for filters in FILTER_CASES:
+        expected = np.array([_matches(m, filters) for m in metadatas])
+        if not np.array_equal(index.mask(filters), expected):
+            print(f"过滤掩码不一致: {filters}")
+            return False
+        print(f"{filters}: {index.count(filters)}个文档")
+
+    where = index.where_clause({'source_file': 'chap02', 'speakers': '老师'})
+    print(f"ChromaDB条件: {where}")
+    if where['$and'][0] != {'source_file': {'$in': [SOURCE_FILES[1]]}}:
+        return False
+    if not all('老师' in value for value in where['$and'][1]['speakers']['$in']):
+        return False
+
+    # 增量维护：删除过半后回收空位，修改元数据后掩码随之变化
+    index.remove(ids[:2000])
+    metadatas[2500] = {'source_file': SOURCE_FILES[1], 'chunk_type': 'qa_pair'}
+    index.upsert(ids[2500:2501] + ["new"], [metadatas[2500], {'chunk_type': 'qa_pair'}])
+    live_ids = ids[2000:] + ["new"]
+    live_metadatas = metadatas[2000:] + [{'chunk_type': 'qa_pair'}]
+    for filters in FILTER_CASES:
+        expected = {doc_id for doc_id, m in zip(live_ids, live_metadatas) if _matches(m, filters)}
+        actual = {index.ids[row] for row in np.flatnonzero(index.mask(filters))}
+        if actual != expected:
+            print(f"增量更新后过滤结果不一致: {filters}")
+            return False
+    print(f"增量更新后文档数: {len(index)}，行数: {index.size}")
+    return len(index) == 1001 and index.size == 1001
+
+
+def test_filtered_bm25_top_k():
+    """测试带过滤的MaxScore top-k与全量打分后过滤的结果完全一致"""
+    print("\n=== 测试BM25过滤top-k ===")
+
+    rng = random.Random(2)
+    vocab = [f"词{i}" for i in range(2000)]
+    weights = [1.0 / (i + 1) for i in range(len(vocab))]
+    corpus = {f"chap-{i}": rng.choices(vocab, weights, k=rng.randint(1, 80)) for i in range(6000)}
+    metadatas = dict(zip(corpus, _random_metadatas(len(corpus), 3)))
+
+    index = BM25Index()
+    index.build(corpus.items())
+    index.remove_document("chap-7")
+    bitmaps = MetadataBitmapIndex(index.doc_ids, [metadatas.get(d) if d else None for d in index.doc_ids])
+
+    queries = [rng.choices(vocab[:300], k=rng.randint(2, 12)) for _ in range(40)]
+    for filters in FILTER_CASES:
+        allowed = bitmaps.mask(filters)
+        for query_terms in queries:
+            for k in (1, 10, 50):
+                results = index.top_k(query_terms, k=k, allowed=allowed)
+                expected = [(d, s) for d, s in index.top_k_exhaustive(query_terms, k=len(corpus))
+                            if _matches(metadatas[d], filters)][:k]
+                if results != expected or results != index.top_k_exhaustive(query_terms, k=k, allowed=allowed):
+                    print(f"过滤top-k不一致: {filters} {query_terms} k={k}")
+                    return False
+
+    allowed = bitmaps.mask({'source_file': 'chap02', 'chunk_type': 'qa_pair'})
+    start = time.perf_counter()
+    for query_terms in queries:
+        index.top_k(query_terms, k=10)
+    unfiltered_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for query_terms in queries:
+        index.top_k(query_terms, k=10, allowed=allowed)
+    filtered_time = time.perf_counter() - start
+    print(f"不过滤{unfiltered_time * 1000:.1f}ms，过滤({int(allowed.sum())}个文档){filtered_time * 1000:.1f}ms")
+    return True
+
+
+def test_filtered_vector_search():
+    """测试精确索引与IVF索引的过滤检索与逐条过滤后的精确top-k一致"""
+    print("\n=== 测试向量索引过滤检索 ===")
+
+    rng = np.random.default_rng(4)
+    embeddings = rng.normal(size=(5000, 32)).astype(np.float32)
+    metadatas = _random_metadatas(len(embeddings), 5)
+    ids = [f"doc-{i}" for i in range(len(embeddings))]
+    queries = embeddings[:20] + 0.05
+
+    flat = FlatVectorIndex()
+    flat.upsert(ids, embeddings, [""] * len(ids), metadatas)
+    ivf = IVFVectorIndex(nprobe=4)
+    ivf.upsert(ids, embeddings, [""] * len(ids), metadatas)
+
+    for filters in FILTER_CASES:
+        rows = np.array([i for i, m in enumerate(metadatas) if _matches(m, filters)], dtype=np.int64)
+        for query, result in zip(queries, flat.search_batch(queries, n_results=10, filters=filters)):
+            if len(rows) == 0:
+                expected = []
+            else:
+                distances = ((embeddings[rows] - query) ** 2).sum(axis=1)
+                expected = [ids[i] for i in rows[np.argsort(distances, kind='stable')[:10]]]
+            if set(result['ids'][0]) != set(expected):
+                print(f"精确索引过滤结果不一致: {filters}")
+                return False
+
+        ivf_results = ivf.search_batch(queries, n_results=10, filters=filters)
+        if not all(_matches(m, filters) for r in ivf_results for m in r['metadatas'][0]):
+            print(f"IVF返回了不满足条件的文档: {filters}")
+            return False
+        if len(rows) >= 10 and not all(len(r['ids'][0]) == 10 for r in ivf_results):
+            print(f"IVF过滤后结果数量不足: {filters}")
+            return False
+    print("过滤检索结果正确")
+    return True
+
+
+def main():
+    """主测试函数"""
+    tests = [
+        ("元数据过滤位图", test_bitmap_masks),
+        ("BM25过滤top-k", test_filtered_bm25_top_k),
+        ("向量索引过滤检索", test_filtered_vector_search),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            success = test_func()
+            results.append((test_name, success))
+        except Exception as e:
+            print(f"测试 {test_name} 出现异常: {e}")
+            results.append((test_name, False))
+
+    print("\n=== 测试结果汇总 ===")
+    passed = 0
+    for test_name, success in results:
+        status = "✓ 通过" if success else "✗ 失败"
+        print(f"{test_name}: {status}")
+        if success:
+            passed += 1
+
+    print(f"\n总计: {passed}/{len(results)} 个测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+测试字符n-gram索引
+验证短语检索结果与逐文档字符串包含判断一致
+"""
+
+import sys
+import os
+import random
+sys.path.append(os.path.join(os.path.dirname(__file__), 'code'))
+
+from ngram_index import NGramIndex
+
+
+def _random_documents(seed=7, count=200):
+    rng = random.Random(seed)
+    alphabet = "乔老师邮箱创新创业学生公司课程AbCd "
+    return {f"chunk-{i}": ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 80))) for i in range(count)}
+
+
+def test_phrase_search_matches_scan():
+    """测试短语检索与全量扫描一致"""
+    print("\n=== 测试短语检索 ===")
+
+    documents = _random_documents()
+    index = NGramIndex()
+    index.build_from_texts(documents)
+    lowered = {doc_id: content.lower() for doc_id, content in documents.items()}
+
+    rng = random.Random(11)
+    phrase_sets = [["乔老师"], ["创新创业"], ["abcd", "学生"], ["不存在的短语"]]
+    phrase_sets += [[content[3:3 + rng.randint(2, 8)] for content in rng.sample(list(documents.values()), 3)] for _ in range(20)]
+
+    for phrases in phrase_sets:
+        phrases = [p for p in dict.fromkeys(p.lower() for p in phrases) if len(p) >= 2]
+        expected = []
+        for doc_id, content in lowered.items():
+            score = float(sum(len(p) for p in phrases if p in content))
+            if score > 0:
+                expected.append((doc_id, score))
+        expected.sort(key=lambda item: (-item[1], index.doc_index[item[0]]))
+
+        hits = index.search_phrases(phrases, top_k=10, fetch_documents=lambda ids: {i: documents[i] for i in ids})
+        if hits != expected[:10]:
+            print(f"检索结果不一致: {phrases}")
+            return False
+
+    print("短语检索与全量扫描一致")
+    return True
+
+
+def test_incremental_update():
+    """测试增量更新后短语倒排列表仍然精确"""
+    print("\n=== 测试增量更新 ===")
+
+    documents = _random_documents(seed=3, count=50)
+    index = NGramIndex()
+    index.build_from_texts(documents)
+
+    documents["chunk-1"] = "乔老师的邮箱"
+    index.add_text("chunk-1", documents["chunk-1"])
+    del documents["chunk-2"]
+    index.remove_document("chunk-2")
+
+    for phrase in ["乔老", "老师的", "邮箱", "ab"]:
+        found = {index.doc_ids[n] for n in index.phrase_postings(phrase)}
+        expected = {doc_id for doc_id, content in documents.items() if phrase in content.lower()}
+        if found != expected:
+            print(f"倒排列表不一致: {phrase}")
+            return False
+
+    print("增量更新后倒排列表一致")
+    return True
+
+
+def main():
+    """主测试函数"""
+    tests = [
+        ("短语检索", test_phrase_search_matches_scan),
+        ("增量更新", test_incremental_update),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            success = test_func()
+            results.append((test_name, success))
+        except Exception as e:
+            print(f"测试 {test_name} 出现异常: {e}")
+            results.append((test_name, False))
+
+    print("\n=== 测试结果汇总 ===")
+    passed = 0
+    for test_name, success in results:
+        status = "✓ 通过" if success else "✗ 失败"
+        print(f"{test_name}: {status}")
+        if success:
+            passed += 1
+
+    print(f"\n总计: {passed}/{len(results)} 个测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+测试查询维度的本地分类器
+验证未训练时不替代大模型、用维度分析器写出的记录训练后的判断与抽样复核、以及调用大模型的条件
+"""
+
+import sys
+import os
+import json
+import random
+import re
+import tempfile
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), 'code'))
+
+from query_classifier import QueryDimensionClassifier, LOCAL_CONFIDENCE_THRESHOLD
+from dimension_analyzer import DimensionAnalyzer
+
+TOPICS = ['自然语言处理', '注意力机制', '梁文峰', '大模型训练', '强化学习', '向量数据库', '分词算法', '开源社区']
+
+
+def _traffic(count, seed):
+    """
+    模拟线上对话：首轮提问（观点类只需向量搜索，带书名号的需要关键词搜索，带时间的需要时间搜索）与追问（不需要额外搜索）
+
+    Returns:
+        [(查询, 对话上下文)]，以及 {查询: 大模型给出的分析结果}
+    """
+    rng = random.Random(seed)
+    turns, labels = [], {}
+    for _ in range(count):
+        topic = rng.choice(TOPICS)
+        kind = rng.randrange(4)
+        context = ""
+        if kind == 0:
+            query, result = f"大家对{topic}有什么看法和观点", (True, ['vector_search'])
+        elif kind == 1:
+            query, result = f"《{topic}》这一节提到了哪些内容", (True, ['keyword_search', 'vector_search'])
+        elif kind == 2:
+            query, result = f"第{rng.randint(1, 60)}分钟老师讲了{topic}的什么", (True, ['time_search', 'vector_search'])
+        else:
+            query = rng.choice(["上面说的再解释一下", "刚才那个例子能展开吗", "你能总结一下刚才的回答吗"])
+            context, result = f"user: {topic}是什么\nassistant: {topic}是……", (False, [])
+        turns.append((query, context))
+        labels[query] = {'needs_additional_search': result[0], 'missing_dimensions': result[1]}
+    return turns, labels
+
+
+def _agrees(prediction, result):
+    """预测与分析结果是否一致（维度不计顺序）"""
+    if prediction['needs_additional_search'] != result['needs_additional_search']:
+        return False
+    return not result['needs_additional_search'] or set(prediction['missing_dimensions']) == set(result['missing_dimensions'])
+
+
+class _OracleClient:
+    """DeepSeek客户端替身：从提示词中取出查询，按模拟数据的标注回复，并记录调用次数"""
+
+    def __init__(self, labels=None):
+        self.labels = labels or {}
+        self.calls = 0
+
+    def simple_chat(self, prompt, **kwargs):
+        self.calls += 1
+        query = re.search(r"用户查询：(.*)\n", prompt).group(1)
+        label = self.labels.get(query, {'needs_additional_search': False, 'missing_dimensions': []})
+        return json.dumps(dict(label, confidence=0.95, reasoning="模拟分析"), ensure_ascii=False)
+
+
+def _read_log(log_path):
+    with open(log_path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_seeded_classifier():
+    """测试规则初始权重的判断与规则分析一致，但未训练时置信度低于阈值（仍由大模型分析）"""
+    print("\n=== 测试规则初始权重 ===")
+
+    classifier = QueryDimensionClassifier()
+    analyzer = DimensionAnalyzer(_OracleClient())
+    queries = ["梁文峰的采访", "老师在课程开始时说了什么？", "NLP", "第10分钟讲了什么", "总结一下强化学习的要点", "好"]
+    for query in queries:
+        prediction = classifier.predict(query)
+        expected = analyzer._rule_based_analysis(query)
+        print(f"{query}: {prediction['missing_dimensions']}（置信度{prediction['confidence']:.2f}）")
+        if set(prediction['missing_dimensions']) != set(expected['missing_dimensions']):
+            return False
+        if prediction['confidence'] >= LOCAL_CONFIDENCE_THRESHOLD:
+            return False
+
+    start = time.perf_counter()
+    for _ in range(2000):
+        classifier.predict("老师在课程开始时说了什么关于自然语言处理的定义？")
+    per_query = (time.perf_counter() - start) / 2000 * 1e6
+    print(f"单次判断耗时: {per_query:.1f}微秒")
+    return per_query < 1000
+
+
+def test_training_from_analyzer_log():
+    """测试用维度分析器实际写出的记录训练：本地判断与大模型一致，大模型调用减少，抽样复核覆盖本地判断的查询"""
+    print("\n=== 测试用分析记录训练 ===")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = os.path.join(tmp_dir, "log.jsonl")
+
+        # 第一阶段：未训练，所有查询都由大模型分析并记录
+        turns, labels = _traffic(400, 1)
+        client = _OracleClient(labels)
+        analyzer = DimensionAnalyzer(client, analysis_log_path=log_path, random_seed=0)
+        seed_accuracy = sum(_agrees(analyzer.classifier.predict(q, c), labels[q]) for q, c in turns) / len(turns)
+        for query, context in turns:
+            analyzer.analyze_query_dimensions(query, context)
+        print(f"未训练: 大模型调用{client.calls}/{len(turns)}次，规则判断一致率{seed_accuracy:.2f}")
+        if client.calls != len(turns) or len(_read_log(log_path)) != len(turns):
+            return False
+
+        classifier = QueryDimensionClassifier()
+        used = classifier.fit_log(log_path)
+
+        # 第二阶段：训练后置信的查询由本地判断，按比例抽样复核
+        turns, labels = _traffic(600, 2)
+        client = _OracleClient(labels)
+        analyzer = DimensionAnalyzer(client, classifier=classifier, analysis_log_path=log_path,
+                                     audit_rate=0.1, random_seed=0)
+        results = [analyzer.analyze_query_dimensions(q, c) for q, c in turns]
+        local = [(r, labels[q]) for r, (q, c) in zip(results, turns) if r.get('source') == 'local']
+        local_accuracy = sum(_agrees(r, label) for r, label in local) / max(len(local), 1)
+        audits = [r for r in _read_log(log_path)[used:] if 'local' in r]
+        first_turn_audits = [r for r in audits if not r['current_context']]
+        print(f"训练记录{used}条后: 本地判断{len(local)}/{len(turns)}次（一致率{local_accuracy:.2f}），"
+              f"大模型调用{client.calls}次，其中抽样复核{analyzer.stats['audit']}次（首轮查询{len(first_turn_audits)}条）")
+        if local_accuracy < 0.95 or client.calls > len(turns) * 0.3 or not first_turn_audits:
+            return False
+
+        # 重新训练总是从初始权重开始，记录数不重复计入，结果与上次相同
+        total = len(_read_log(log_path))
+        retrained = QueryDimensionClassifier()
+        retrained.fit_log(log_path)
+        again = QueryDimensionClassifier.load(None)
+        again.fit_log(log_path)
+        model_path = os.path.join(tmp_dir, "classifier.npz")
+        retrained.save(model_path)
+        loaded = QueryDimensionClassifier.load(model_path)
+        same = all(loaded.predict(q, c) == retrained.predict(q, c) == again.predict(q, c) for q, c in turns[:50])
+        print(f"重新训练记录{retrained.trained_samples}/{total}条，结果一致: {same}")
+        return retrained.trained_samples == again.trained_samples == total and same
+
+
+def test_analyzer_escalation():
+    """测试维度分析器的升级条件：未训练或置信度不足时调用大模型，不记录时不抽样复核"""
+    print("\n=== 测试维度分析器升级到大模型 ===")
+
+    turns, labels = _traffic(300, 3)
+    classifier = QueryDimensionClassifier()
+    classifier.fit([{'query': q, 'current_context': c, 'result': labels[q]} for q, c in turns])
+
+    client = _OracleClient(labels)
+    analyzer = DimensionAnalyzer(client, classifier=classifier)
+    # 训练数据中的各类首轮查询由本地判断
+    samples = {}
+    for query, context in turns:
+        samples.setdefault(query[:2], (query, context))
+    for query, context in samples.values():
+        result = analyzer.analyze_query_dimensions(query, context)
+        if result.get('source') != 'local' or not _agrees(result, labels[query]):
+            return False
+    # 置信度不足的查询调用大模型
+    unfamiliar = ["嗯", "这门课的作业什么时候交"]
+    expected_calls = sum(classifier.predict(q)['confidence'] < LOCAL_CONFIDENCE_THRESHOLD for q in unfamiliar)
+    for query in unfamiliar:
+        analyzer.analyze_query_dimensions(query)
+    print(f"调用统计: {analyzer.stats}，大模型调用{client.calls}次")
+    if expected_calls == 0 or client.calls != expected_calls or analyzer.stats['audit'] != 0:
+        return False
+    calls = client.calls
+
+    # 阈值大于1时总是调用大模型
+    always = DimensionAnalyzer(client, classifier=classifier, confidence_threshold=1.01)
+    always.analyze_query_dimensions(turns[0][0], turns[0][1])
+    return client.calls == calls + 1
+
+
+def main():
+    """主测试函数"""
+    tests = [
+        ("规则初始权重", test_seeded_classifier),
+        ("用分析记录训练", test_training_from_analyzer_log),
+        ("维度分析器升级到大模型", test_analyzer_escalation),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            success = test_func()
+            results.append((test_name, success))
+        except Exception as e:
+            print(f"测试 {test_name} 出现异常: {e}")
+            results.append((test_name, False))
+
+    print("\n=== 测试结果汇总 ===")
+    passed = 0
+    for test_name, success in results:
+        status = "✓ 通过" if success else "✗ 失败"
+        print(f"{test_name}: {status}")
+        if success:
+            passed += 1
+
+    print(f"\n总计: {passed}/{len(results)} 个测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+测试预先检索的多阶段搜索
+验证按单一维度的top-k预先检索后再截取的结果，与分析完成后直接按各维度top-k检索的结果一致
+"""
+
+import sys
+import os
+import random
+sys.path.append(os.path.join(os.path.dirname(__file__), 'code'))
+
+from advanced_search_system import AdvancedSearchSystem, truncate_reranked
+from search_interface import SearchInterface
+from multi_stage_query import MultiStageQuerySystem
+
+QUERY = "注意力机制的训练方法"
+WORDS = ['注意力', '机制', '训练', '方法', '模型', '数据', '梯度', '向量', '课程', '老师', '参数', '实验']
+
+
+def _corpus(count, seed):
+    """
+    生成BM25排序与综合得分排序不同的语料：部分文档包含完整的查询短语（精确匹配得分高），
+    部分文档短而重复个别查询词（BM25得分高）
+
+    Returns:
+        [{'id', 'document', 'metadata'}]
+    """
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(3, 40))]
+        if rng.random() < 0.3:
+            words.insert(rng.randrange(len(words) + 1), QUERY)
+        chunks.append({'id': f'chunk_{i}', 'document': "，".join(words), 'metadata': {'source_file': f'doc{i % 7}.txt'}})
+    return chunks
+
+
+class _FixedAnalyzer:
+    """维度分析器替身：总是返回给定的搜索维度"""
+
+    def __init__(self, dimensions):
+        self.dimensions = dimensions
+
+    def analyze_query_dimensions(self, query, current_context=None):
+        return {
+            "needs_additional_search": True,
+            "missing_dimensions": list(self.dimensions),
+            "confidence": 0.9,
+            "reasoning": "固定维度",
+            "dimensions": list(self.dimensions)
+        }
+
+
+def _keyword_system():
+    """在内存中用真实的BM25索引和精确匹配打分构建搜索接口（不需要向量模型和ChromaDB）"""
+    search_system = AdvancedSearchSystem()
+    search_system.use_bm25_snapshot = False
+    search_system.apply_document_changes(_corpus(300, 0))
+
+    search_interface = SearchInterface(config_name="balanced")
+    search_interface.search_system = search_system
+    search_interface.initialized = True
+    return search_interface
+
+
+def _keyword_ranking(results):
+    return [(r['document_id'], round(r['score'], 9)) for r in results if r.get('search_source') == 'keyword_search']
+
+
+def test_keyword_prefetch_matches_serial():
+    """测试预先检索的关键词结果截取后与直接检索一致（直接截取前k个则不一致）"""
+    print("\n=== 测试关键词预先检索的截取 ===")
+
+    search_interface = _keyword_system()
+    reordered = False
+    for max_results in (5, 20, 30, 60):
+        analyzer = _FixedAnalyzer(['keyword_search', 'time_search'])
+        system = MultiStageQuerySystem(search_interface, dimension_analyzer=analyzer)
+
+        serial = system.multi_stage_search(QUERY, max_results=max_results, dimension_analysis=analyzer.analyze_query_dimensions(QUERY))
+        speculative = system.speculative_multi_stage_search(QUERY, max_results=max_results,
+                                                            speculative_dimensions=("keyword_search",))
+        expected, actual = _keyword_ranking(serial['results']), _keyword_ranking(speculative['results'])
+
+        # 对照：预先检索的结果直接取前k个
+        per_dimension = max(max_results // 2 + 5, 10)
+        prefetched = system.execute_keyword_search(QUERY, top_k=max(max_results + 5, 10))
+        naive = [(r['document_id'], round(r['score'], 9)) for r in prefetched[:per_dimension]]
+        reordered = reordered or naive != expected[:per_dimension]
+
+        print(f"max_results={max_results}: 直接检索{len(expected)}个，预先检索截取{len(actual)}个，一致: {actual == expected}，"
+              f"直接取前{per_dimension}个一致: {naive == expected[:per_dimension]}")
+        if actual != expected or speculative['speculative']['used'] != ['keyword_search']:
+            return False
+
+    # 语料中BM25与综合得分的排序确实不同，否则上面的比较没有意义
+    return reordered
+
+
+def test_truncate_reranked_prefix():
+    """测试BRE重排序的截取规则：先按较大top-k截取再按较小top-k截取，与直接截取相同"""
+    print("\n=== 测试重排序结果的截取 ===")
+
+    rng = random.Random(1)
+    for _ in range(500):
+        scores = sorted((rng.choice([0.0, 0.0005, rng.random()]) for _ in range(rng.randint(0, 30))), reverse=True)
+        reranked = [{'id': i, 'final_score': score} for i, score in enumerate(scores)]
+        small, large = sorted(rng.sample(range(1, 40), 2))
+        if truncate_reranked(truncate_reranked(reranked, large), small) != truncate_reranked(reranked, small):
+            print(f"不一致: {scores}, top_k={small}/{large}")
+            return False
+    print("500组随机得分均一致")
+    return True
+
+
+def main():
+    """主测试函数"""
+    tests = [
+        ("关键词预先检索的截取", test_keyword_prefetch_matches_serial),
+        ("重排序结果的截取", test_truncate_reranked_prefix),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            success = test_func()
+            results.append((test_name, success))
+        except Exception as e:
+            print(f"测试 {test_name} 出现异常: {e}")
+            results.append((test_name, False))
+
+    print("\n=== 测试结果汇总 ===")
+    passed = 0
+    for test_name, success in results:
+        status = "✓ 通过" if success else "✗ 失败"
+        print(f"{test_name}: {status}")
+        if success:
+            passed += 1
+
+    print(f"\n总计: {passed}/{len(results)} 个测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+测试分词缓存
+验证查询只分析一次、文档词项取自BM25正排列表、缓存大小有界
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'code'))
+
+from bm25_index import BM25Index, content_hash
+from token_cache import TokenCache, QueryTokens
+
+
+def _failing_tokenizer(text):
+    raise AssertionError(f"不应对已索引的文档分词: {text[:20]}")
+
+
+def test_query_analyzed_once():
+    """测试同一查询只调用一次分析函数"""
+    print("\n=== 测试查询缓存 ===")
+
+    calls = []
+
+    def analyzer(query):
+        calls.append(query)
+        tokens = query.split()
+        return QueryTokens(tags=[], tokens=tokens, token_set=frozenset(tokens))
+
+    cache = TokenCache(max_queries=2)
+    for _ in range(5):
+        cache.get_query("乔老师 邮箱", analyzer)
+
+    cache.get_query("创新 创业", analyzer)
+    cache.get_query("课程 安排", analyzer)  # 淘汰最久未使用的"乔老师 邮箱"
+    cache.get_query("乔老师 邮箱", analyzer)
+
+    ok = calls == ["乔老师 邮箱", "创新 创业", "课程 安排", "乔老师 邮箱"] and cache.get_stats()['cached_queries'] == 2
+    print(f"查询分析次数: {len(calls)}，缓存查询数: {cache.get_stats()['cached_queries']}")
+    return ok
+
+
+def test_document_terms_from_index():
+    """测试已索引文档的词项直接取自正排列表"""
+    print("\n=== 测试文档词项缓存 ===")
+
+    documents = {
+        'chap01-1': ("乔老师 邮箱 邮箱", ['乔', '老师', '邮箱', '邮箱']),
+        'chap01-2': ("创新 创业 公司", ['创新', '创业', '公司']),
+    }
+    index = BM25Index()
+    index.build(
+        ((doc_id, tokens) for doc_id, (_, tokens) in documents.items()),
+        content_hashes={doc_id: content_hash(content) for doc_id, (content, _) in documents.items()}
+    )
+
+    cache = TokenCache(max_documents=1)
+    for content, tokens in documents.values():
+        if cache.get_document_terms(content, index, _failing_tokenizer) != frozenset(tokens):
+            print("文档词项与分词结果不一致")
+            return False
+
+    # 未被索引的内容才会分词
+    terms = cache.get_document_terms("新的 文档", index, lambda text: text.split())
+    stats = cache.get_stats()
+    ok = terms == frozenset(['新的', '文档']) and stats['document_misses'] == 1 and stats['cached_documents'] == 1
+    print(f"缓存统计: {stats}")
+    return ok
+
+
+def main():
+    """主测试函数"""
+    tests = [
+        ("查询缓存", test_query_analyzed_once),
+        ("文档词项缓存", test_document_terms_from_index),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            success = test_func()
+            results.append((test_name, success))
+        except Exception as e:
+            print(f"测试 {test_name} 出现异常: {e}")
+            results.append((test_name, False))
+
+    print("\n=== 测试结果汇总 ===")
+    passed = 0
+    for test_name, success in results:
+        status = "✓ 通过" if success else "✗ 失败"
+        print(f"{test_name}: {status}")
+        if success:
+            passed += 1
+
+    print(f"\n总计: {passed}/{len(results)} 个测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+测试进程内向量索引
+验证top-k结果与逐个计算距离的结果一致，增量新增/删除后结果正确，
+IVF近似索引的召回率随nprobe提高、扫描全部列表时与精确检索一致
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'code'))
+
+import numpy as np
+
+from vector_index import FlatVectorIndex, IVFVectorIndex
+
+
+def _reference_distances(space, embeddings, query):
+    """逐个向量计算距离（与ChromaDB的距离定义相同）"""
+    distances = []
+    for embedding in embeddings:
+        if space == 'l2':
+            distances.append(float(np.sum((embedding.astype(np.float64) - query) ** 2)))
+        elif space == 'ip':
+            distances.append(1.0 - float(np.dot(embedding, query)))
+        else:
+            distances.append(1.0 - float(np.dot(embedding, query) / (np.linalg.norm(embedding) * np.linalg.norm(query))))
+    return np.array(distances)
+
+
+def test_top_k_matches_reference():
+    """测试三种距离度量下的top-k结果"""
+    print("\n=== 测试向量索引top-k ===")
+
+    rng = np.random.default_rng(3)
+    embeddings = rng.normal(size=(500, 32)).astype(np.float32)
+    ids = [f"chap01-{i}" for i in range(len(embeddings))]
+
+    for space in ('l2', 'ip', 'cosine'):
+        index = FlatVectorIndex(space=space)
+        index.upsert(ids, embeddings, [f"文档{i}" for i in range(len(ids))], [{'chunk_id': i} for i in range(len(ids))])
+
+        queries = rng.normal(size=(10, 32)).astype(np.float32)
+        for query, result in zip(queries, index.search_batch(queries, n_results=10)):
+            expected = np.argsort(_reference_distances(space, embeddings, query), kind='stable')[:10]
+            if result['ids'][0] != [ids[i] for i in expected]:
+                print(f"{space}: top-k结果不一致")
+                return False
+            if result['metadatas'][0][0] != {'chunk_id': int(expected[0])} or result['documents'][0][0] != f"文档{expected[0]}":
+                print(f"{space}: 文档或元数据不对应")
+                return False
+
+    print("三种距离度量的top-k结果均正确")
+    return True
+
+
+def test_upsert_and_remove():
+    """测试增量新增、更新和删除"""
+    print("\n=== 测试向量索引增量更新 ===")
+
+    index = FlatVectorIndex()
+    index.upsert(["a", "b", "c"], [[0, 0], [1, 0], [5, 5]], ["A", "B", "C"], [{}, {}, {}])
+    index.upsert(["b"], [[9, 9]], ["B2"], [{'updated': True}])
+    index.remove(["a"])
+
+    result = index.search([0.9, 0.1], n_results=5)
+    ok = (len(index) == 2
+          and result['ids'] == [["c", "b"]]
+          and result['documents'] == [["C", "B2"]]
+          and abs(result['distances'][0][0] - (4.1 ** 2 + 4.9 ** 2)) < 1e-4)
+    print(f"检索结果: {result['ids']}")
+    return ok
+
+
+def test_ivf_recall():
+    """测试IVF索引的召回率与nprobe的关系"""
+    print("\n=== 测试IVF近似索引召回率 ===")
+
+    rng = np.random.default_rng(5)
+    centers = rng.normal(size=(40, 32)) * 4
+    embeddings = (centers[rng.integers(0, len(centers), 4000)] + rng.normal(size=(4000, 32))).astype(np.float32)
+    ids = [f"chap02-{i}" for i in range(len(embeddings))]
+    documents = [f"文档{i}" for i in range(len(ids))]
+    metadatas = [{'chunk_id': i} for i in range(len(ids))]
+
+    exact = FlatVectorIndex()
+    exact.upsert(ids, embeddings, documents, metadatas)
+    index = IVFVectorIndex(nlist=64)
+    index.upsert(ids, embeddings, documents, metadatas)
+    if index.centroids is None or len(index.centroids) != 64:
+        print("IVF索引未训练")
+        return False
+
+    queries = embeddings[rng.choice(len(embeddings), 50, replace=False)] + rng.normal(size=(50, 32)).astype(np.float32) * 0.5
+    expected = [set(result['ids'][0]) for result in exact.search_batch(queries, n_results=10)]
+
+    recalls = []
+    for nprobe in (1, 8, 64):
+        index.nprobe = nprobe
+        results = index.search_batch(queries, n_results=10)
+        recalls.append(np.mean([len(set(r['ids'][0]) & e) / 10 for r, e in zip(results, expected)]))
+    print(f"nprobe=1/8/64 召回率: {[round(float(r), 3) for r in recalls]}")
+
+    index.nprobe = 64
+    if index.search_batch(queries, n_results=10) != exact.search_batch(queries, n_results=10):
+        print("扫描全部列表时结果与精确检索不一致")
+        return False
+    return recalls[0] <= recalls[1] <= recalls[2] == 1.0 and recalls[1] >= 0.9
+
+
+def _list_rows(index):
+    """各有效行所在的倒排列表（包括已并入列表的行和尚未并入的末尾区间）"""
+    lists = {}
+    tail = index._assignments[index._listed_rows:]
+    for l in range(len(index.centroids)):
+        rows = index._list_order[index._list_offsets[l]:index._list_offsets[l + 1]].tolist()
+        rows += (index._listed_rows + np.flatnonzero(tail == l)).tolist()
+        for row in rows:
+            if index._live[row]:
+                lists.setdefault(row, []).append(l)
+    return lists
+
+
+def test_ivf_incremental():
+    """测试IVF索引增量新增与删除后倒排列表保持一致"""
+    print("\n=== 测试IVF索引增量更新 ===")
+
+    rng = np.random.default_rng(8)
+    embeddings = rng.normal(size=(2000, 16)).astype(np.float32)
+    ids = [f"doc-{i}" for i in range(len(embeddings))]
+    index = IVFVectorIndex(nprobe=4)
+    index.upsert(ids, embeddings, [""] * len(ids), [{}] * len(ids))
+    centroids = index.centroids.copy()
+
+    index.remove(ids[:100])
+    index.upsert(["new"], embeddings[500:501] + 0.01, ["新文档"], [{}])
+    lists = _list_rows(index)
+    lists_ok = (np.array_equal(centroids, index.centroids)
+                and sorted(lists) == sorted(index._id_index.values())
+                and all(found == [index._assignments[row]] for row, found in lists.items())
+                and index._assignments[index._id_index["doc-500"]] == index._assignments[index._id_index["new"]])
+
+    result = index.search(embeddings[500], n_results=2)
+    print(f"检索结果: {result['ids']}")
+    return lists_ok and len(index) == 1901 and result['ids'] == [["doc-500", "new"]]
+
+
+def test_incremental_batches():
+    """测试多批小规模新增、更新和删除（空位压缩、倒排列表合并）后与一次性构建的索引结果一致"""
+    print("\n=== 测试多批增量更新 ===")
+
+    rng = np.random.default_rng(11)
+    flat = FlatVectorIndex()
+    ivf = IVFVectorIndex(nlist=16)
+    vectors = {}
+    for batch in range(300):
+        ids = [f"doc-{i}" for i in rng.integers(0, 3000, 20)]
+        ids = list(dict.fromkeys(ids))
+        embeddings = rng.normal(size=(len(ids), 16)).astype(np.float32)
+        for index in (flat, ivf):
+            index.upsert(ids, embeddings, ids, [{'batch': batch}] * len(ids))
+        vectors.update(zip(ids, embeddings))
+        if batch % 3 == 0:
+            removed = [f"doc-{i}" for i in rng.integers(0, 3000, 15)]
+            for index in (flat, ivf):
+                index.remove(removed)
+            for doc_id in removed:
+                vectors.pop(doc_id, None)
+
+    ids = sorted(vectors)
+    rebuilt = FlatVectorIndex()
+    rebuilt.upsert(ids, np.array([vectors[doc_id] for doc_id in ids]), ids, [{}] * len(ids))
+    queries = rng.normal(size=(20, 16)).astype(np.float32)
+    expected = [r['ids'][0] for r in rebuilt.search_batch(queries, n_results=10)]
+
+    ivf.nprobe = 16
+    flat_ok = [r['ids'][0] for r in flat.search_batch(queries, n_results=10)] == expected
+    ivf_ok = [r['ids'][0] for r in ivf.search_batch(queries, n_results=10)] == expected
+    lists = _list_rows(ivf)
+    lists_ok = sorted(lists) == sorted(ivf._id_index.values()) and all(len(found) == 1 for found in lists.values())
+    print(f"文档数{len(flat)}，精确索引{len(flat.ids)}行（空位{flat._removed}），"
+          f"IVF末尾区间{len(ivf.ids) - ivf._listed_rows}行，结果一致: {flat_ok}/{ivf_ok}")
+    return (len(flat) == len(ivf) == len(vectors) and flat._removed <= 0.25 * len(flat.ids)
+            and flat_ok and ivf_ok and lists_ok and ivf.centroids is not None)
+
+
+def main():
+    """主测试函数"""
+    tests = [
+        ("向量索引top-k", test_top_k_matches_reference),
+        ("向量索引增量更新", test_upsert_and_remove),
+        ("IVF近似索引召回率", test_ivf_recall),
+        ("IVF索引增量更新", test_ivf_incremental),
+        ("多批增量更新", test_incremental_batches),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            success = test_func()
+            results.append((test_name, success))
+        except Exception as e:
+            print(f"测试 {test_name} 出现异常: {e}")
+            results.append((test_name, False))
+
+    print("\n=== 测试结果汇总 ===")
+    passed = 0
+    for test_name, success in results:
+        status = "✓ 通过" if success else "✗ 失败"
+        print(f"{test_name}: {status}")
+        if success:
+            passed += 1
+
+    print(f"\n总计: {passed}/{len(results)} 个测试通过")
+
+
+if __name__ == "__main__":
+    main()
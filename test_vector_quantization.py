@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+测试向量压缩编码
+验证量化器的近似内积误差、量化索引精确重算后的top-k与float32索引一致，
+以及增量更新和内存映射后的结果
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.join(os.path.dirname(__file__), 'code'))
+
+import numpy as np
+
+from vector_index import FlatVectorIndex, IVFVectorIndex
+from vector_quantization import ScalarQuantizer, ProductQuantizer
+
+
+def _clustered_embeddings(count, dim, seed):
+    """生成带聚类结构的单位向量（与bge句向量的分布相近）"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(50, dim))
+    embeddings = (centers[rng.integers(0, len(centers), count)] * 0.5 + rng.normal(size=(count, dim))).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def test_quantizer_inner_products():
+    """测试近似内积与解码后向量的内积一致、与原始内积误差很小"""
+    print("\n=== 测试量化器近似内积 ===")
+
+    embeddings = _clustered_embeddings(3000, 64, 1)
+    queries = embeddings[:5] + 0.01
+
+    for quantizer in (ScalarQuantizer(), ProductQuantizer(16)):
+        quantizer.train(embeddings)
+        codes = quantizer.encode(embeddings)
+        products = quantizer.inner_products(queries, codes)
+        decoded = quantizer.decode(codes)
+        if not np.allclose(products, queries @ decoded.T, atol=1e-4):
+            print(f"{quantizer.method}: 近似内积与解码向量的内积不一致")
+            return False
+        if not np.allclose(quantizer.sq_norms(codes), np.einsum('ij,ij->i', decoded, decoded), atol=1e-4):
+            print(f"{quantizer.method}: 平方范数不一致")
+            return False
+        error = np.abs(products - queries @ embeddings.T).mean()
+        print(f"{quantizer.method}: 编码{codes.shape[1]}字节/向量，平均内积误差{error:.4f}")
+        if error > 0.05:
+            return False
+    return True
+
+
+def test_quantized_top_k():
+    """测试量化索引精确重算后的top-10召回率与距离，内存按预期减少"""
+    print("\n=== 测试量化索引top-k ===")
+
+    embeddings = _clustered_embeddings(20000, 128, 2)
+    ids = [f"chap03-{i}" for i in range(len(embeddings))]
+    documents = [f"文档{i}" for i in range(len(ids))]
+    metadatas = [{'chunk_id': i} for i in range(len(ids))]
+    rng = np.random.default_rng(3)
+    queries = embeddings[rng.choice(len(embeddings), 30, replace=False)] + rng.normal(size=(30, 128)).astype(np.float32) * 0.02
+
+    exact = FlatVectorIndex()
+    exact.upsert(ids, embeddings, documents, metadatas)
+    expected = exact.search_batch(queries, n_results=10)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for method, min_ratio, min_recall in (('int8', 3.5, 1.0), ('pq', 10.0, 0.98)):
+            index = FlatVectorIndex()
+            index.upsert(ids, embeddings, documents, metadatas)
+            index.quantize(method)
+            index.offload_embeddings(os.path.join(tmp_dir, f"{method}.npy"))
+
+            results = index.search_batch(queries, n_results=10)
+            recall = np.mean([len(set(r['ids'][0]) & set(e['ids'][0])) / 10 for r, e in zip(results, expected)])
+            # 召回的文档距离经过精确重算，应与float32索引完全相同
+            distances_ok = all(
+                np.allclose(d, e['distances'][0][e['ids'][0].index(doc_id)], atol=1e-5)
+                for r, e in zip(results, expected)
+                for doc_id, d in zip(r['ids'][0], r['distances'][0]) if doc_id in e['ids'][0]
+            )
+            ratio = exact.memory_bytes / index.memory_bytes
+            print(f"{method}: 内存减少{ratio:.1f}倍，top-10召回率{recall:.3f}")
+            if ratio < min_ratio or recall < min_recall or not distances_ok:
+                return False
+            del index
+    return True
+
+
+def test_quantized_incremental():
+    """测试量化IVF索引增量更新后编码与内存映射的向量保持一致，新增的向量追加到原向量文件"""
+    print("\n=== 测试量化索引增量更新 ===")
+
+    embeddings = _clustered_embeddings(2000, 32, 4)
+    ids = [f"doc-{i}" for i in range(len(embeddings))]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for method in ('int8', 'pq'):
+            path = os.path.join(tmp_dir, f"{method}.npy")
+            index = IVFVectorIndex(nprobe=4)
+            index.upsert(ids, embeddings, [""] * len(ids), [{'created_at': str(i)} for i in range(len(ids))])
+            index.quantize(method)
+            index.offload_embeddings(path)
+            inode = os.stat(path).st_ino
+
+            index.remove(ids[:10])
+            for i in range(5):
+                index.upsert([f"new-{i}"], embeddings[100:101] + 0.001 * i, ["新文档"], [{'created_at': 'x'}])
+            consistent = (np.array_equal(index._codes, index.quantizer.encode(np.asarray(index.embeddings)))
+                          and isinstance(index.embeddings, np.memmap)
+                          and len(index.embeddings) == len(index.ids) and len(index) == 1995)
+            # 向量文件只追加了新增的行，没有整体重写
+            appended = os.stat(path).st_ino == inode and np.array_equal(np.load(path), index.embeddings)
+
+            result = index.search(embeddings[100], n_results=2)
+            print(f"{method}: 检索结果{result['ids']}，向量文件原地追加: {appended}")
+            ok = consistent and appended and result['ids'][0][0] in ("doc-100", "new-0")
+            del index
+            if not ok:
+                return False
+    return True
+
+
+def main():
+    """主测试函数"""
+    tests = [
+        ("量化器近似内积", test_quantizer_inner_products),
+        ("量化索引top-k", test_quantized_top_k),
+        ("量化索引增量更新", test_quantized_incremental),
+    ]
+
+    results = []
+    for test_name, test_func in tests:
+        try:
+            success = test_func()
+            results.append((test_name, success))
+        except Exception as e:
+            print(f"测试 {test_name} 出现异常: {e}")
+            results.append((test_name, False))
+
+    print("\n=== 测试结果汇总 ===")
+    passed = 0
+    for test_name, success in results:
+        status = "✓ 通过" if success else "✗ 失败"
+        print(f"{test_name}: {status}")
+        if success:
+            passed += 1
+
+    print(f"\n总计: {passed}/{len(results)} 个测试通过")
+
+
+if __name__ == "__main__":
+    main()